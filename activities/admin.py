@@ -8,5 +8,6 @@ class ActivityAdmin(admin.ModelAdmin):
     list_filter = ['activity_type', 'date', 'created_at']
     search_fields = ['user__username', 'activity_type', 'notes']
     date_hierarchy = 'date'
+    list_select_related = ['user']
 
 
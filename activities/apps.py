@@ -5,3 +5,5 @@ class ActivitiesConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'activities'
 
+    def ready(self):
+        from . import db, signals  # noqa: F401
@@ -0,0 +1,97 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from .db import copy_rows, delete_rows
+from .models import Activity, ArchivedActivity
+
+
+def archive_cutoff():
+    """
+    Return the first date whose activities stay in the Activity table, or
+    None when archiving is off. Activities dated before it may have been
+    moved to ArchivedActivity.
+    """
+    if not settings.ACTIVITY_ARCHIVE_DAYS:
+        return None
+    return timezone.now().date() - timedelta(days=settings.ACTIVITY_ARCHIVE_DAYS)
+
+
+def reaches_archive(filters):
+    """
+    Return True if the activities matching ``filters``, as built by
+    ActivityViewSet.get_history_filters(), may include archived ones.
+    """
+    cutoff = archive_cutoff()
+    if cutoff is None:
+        return False
+    start = filters.get('date__gte')
+    return start is None or start < cutoff
+
+
+def tiered(user, build, filters=None):
+    """
+    Return ``build(user.activities.filter(**filters))``, the user's matching
+    activities turned into the rows wanted, e.g. with values(). When the
+    date range of ``filters`` reaches past the cutoff, the same query on
+    the user's archived activities is added with UNION ALL, in the order of
+    the hot query; recent ranges only touch the Activity table.
+
+    The combined queryset can be counted, sliced, iterated and reordered by
+    its columns, but only filtered with filter_tiers().
+    """
+    filters = filters or {}
+    hot = build(user.activities.filter(**filters))
+    if not reaches_archive(filters):
+        return hot
+    cold = build(user.archived_activities.filter(**filters))
+    ordering = hot.query.order_by or Activity._meta.ordering
+    return hot.order_by().union(cold.order_by(), all=True).order_by(*ordering)
+
+
+def filter_tiers(queryset, *args, **kwargs):
+    """
+    ``queryset.filter()`` for querysets returned by tiered(): a combined
+    queryset cannot be filtered, so each of its queries is instead.
+    """
+    if not queryset.query.combinator:
+        return queryset.filter(*args, **kwargs)
+    queryset = queryset.all()
+    condition = Q(*args, **kwargs)
+    parts = []
+    for query in queryset.query.combined_queries:
+        query = query.chain()
+        query.add_q(condition)
+        parts.append(query)
+    queryset.query.combined_queries = tuple(parts)
+    return queryset
+
+
+def as_activity(archived):
+    """
+    Return an archived activity as an Activity, so that it renders like one.
+    It is not in the Activity table: restore() it before writing to it.
+    """
+    activity = Activity(**{field.attname: getattr(archived, field.attname) for field in Activity._meta.concrete_fields})
+    activity._state.adding = False
+    activity._state.db = archived._state.db
+    if ArchivedActivity.user.is_cached(archived):
+        activity.user = archived.user
+    return activity
+
+
+def archive(activities, using):
+    """Move ``activities``, all on the database ``using``, to the archive."""
+    with transaction.atomic(using=using):
+        copy_rows(ArchivedActivity, activities, using)
+        delete_rows(Activity, [activity.pk for activity in activities], using)
+
+
+def restore(archived, using):
+    """Move ``archived`` activities, all on ``using``, back to the Activity table."""
+    with transaction.atomic(using=using):
+        copy_rows(Activity, archived, using)
+        delete_rows(ArchivedActivity, [activity.pk for activity in archived], using)
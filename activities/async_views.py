@@ -0,0 +1,219 @@
+import asyncio
+
+from asgiref.sync import sync_to_async
+from django.core.exceptions import ValidationError
+from django.http import Http404
+from django.urls import URLPattern
+from django.utils import timezone
+from django.views import View
+from rest_framework import status
+from rest_framework.response import Response
+
+from .archive import as_activity
+from .cache import aget_or_compute
+from .conditional import aconditional_read
+from .statistics import acompute_statistics, acompute_trends
+from .streaming import stream_json_response, wants_stream
+from .values_serializers import ActivityHistoryValuesSerializer, ActivityValuesSerializer
+
+
+class AsyncViewSetRoute(View):
+    """
+    Async view serving one route of a DRF viewset.
+
+    GET and HEAD run the ``read()`` coroutine. Everything around it is done
+    by an instance of the route's viewset exactly as on the sync route:
+    authentication, permissions, content negotiation, exception handling
+    and rendering. Only authentication touches the database there, and it
+    runs in a thread. Every other method is passed to the sync route.
+    """
+    sync_view = None
+
+    @classmethod
+    def as_view(cls, **initkwargs):
+        view = super().as_view(**initkwargs)
+        sync_view = initkwargs['sync_view']
+        # Let DRF's breadcrumbs and schema generation see the viewset
+        view.cls = sync_view.cls
+        view.initkwargs = sync_view.initkwargs
+        view.actions = sync_view.actions
+        # CSRF is enforced by DRF's SessionAuthentication, as on the sync route
+        view.csrf_exempt = True
+        return view
+
+    def get_viewset(self, request, *args, **kwargs):
+        """Instantiate the viewset the way ViewSetMixin.as_view() does."""
+        actions = dict(self.sync_view.actions)
+        if 'get' in actions and 'head' not in actions:
+            actions['head'] = actions['get']
+        viewset = self.sync_view.cls(**self.sync_view.initkwargs)
+        viewset.action_map = actions
+        for method, action in actions.items():
+            setattr(viewset, method, getattr(viewset, action))
+        viewset.args = args
+        viewset.kwargs = kwargs
+        viewset.request = viewset.initialize_request(request, *args, **kwargs)
+        viewset.headers = viewset.default_response_headers
+        return viewset
+
+    async def get(self, request, *args, **kwargs):
+        self.viewset = self.get_viewset(request, *args, **kwargs)
+        request = self.viewset.request
+        try:
+            await sync_to_async(self.viewset.initial)(request, *args, **kwargs)
+            response = await self.read(request, *args, **kwargs)
+        except Exception as exc:
+            response = self.viewset.handle_exception(exc)
+        return self.viewset.finalize_response(request, response, *args, **kwargs)
+
+    async def read(self, request, *args, **kwargs):
+        raise NotImplementedError
+
+    async def delegate(self, request, *args, **kwargs):
+        return await sync_to_async(self.sync_view)(request, *args, **kwargs)
+
+    post = put = patch = delete = options = delegate
+
+
+class ActivityListRoute(AsyncViewSetRoute):
+    """Async ActivityViewSet.list()."""
+
+    @aconditional_read
+    async def read(self, request, *args, **kwargs):
+        viewset = self.viewset
+        queryset, error = viewset.get_list_queryset(request)
+        if error:
+            return Response({'error': error}, status=status.HTTP_400_BAD_REQUEST)
+        page = await sync_to_async(viewset.paginate_queryset)(queryset)
+        if page is not None:
+            serializer = ActivityValuesSerializer(page, many=True)
+            return viewset.get_paginated_response(serializer.data)
+        serializer = ActivityValuesSerializer([row async for row in queryset], many=True)
+        return Response(serializer.data)
+
+
+class ActivityDetailRoute(AsyncViewSetRoute):
+    """Async ActivityViewSet.retrieve(), archived activities included."""
+
+    @aconditional_read
+    async def read(self, request, *args, **kwargs):
+        viewset = self.viewset
+        queryset = viewset.filter_queryset(viewset.get_queryset())
+        lookup_url_kwarg = viewset.lookup_url_kwarg or viewset.lookup_field
+        try:
+            instance = await queryset.aget(**{viewset.lookup_field: kwargs[lookup_url_kwarg]})
+        except (queryset.model.DoesNotExist, TypeError, ValueError, ValidationError):
+            archived = await sync_to_async(viewset.get_archived_object)()
+            if archived is None:
+                raise Http404
+            instance = as_activity(archived)
+        viewset.check_object_permissions(request, instance)
+        return Response(viewset.get_serializer(instance).data)
+
+
+class ActivityHistoryRoute(AsyncViewSetRoute):
+    """
+    Async ActivityViewSet.history(). The statistics and the page of
+    activities are independent, so their queries are issued together.
+    """
+
+    @aconditional_read
+    async def read(self, request, *args, **kwargs):
+        viewset = self.viewset
+        filters, period, error = viewset.get_history_filters(request)
+        if error:
+            return Response({'error': error}, status=status.HTTP_400_BAD_REQUEST)
+
+        queryset = viewset.get_history_queryset(request, filters)
+
+        async def compute():
+            rollups = request.user.daily_rollups.filter(**filters)
+            return viewset.history_statistics(await acompute_statistics(rollups))
+
+        if wants_stream(request):
+            stats = await aget_or_compute(request, 'history', compute)
+            return stream_json_response(
+                queryset, ActivityHistoryValuesSerializer,
+                payload={'statistics': stats, 'period': period}, list_key='activities',
+                asynchronous=True,
+            )
+
+        stats, page = await asyncio.gather(
+            aget_or_compute(request, 'history', compute),
+            sync_to_async(viewset.paginate_queryset)(queryset),
+        )
+        serializer = ActivityHistoryValuesSerializer(page, many=True)
+
+        return Response({
+            'statistics': stats,
+            'activities': serializer.data,
+            'period': period,
+            'next': viewset.paginator.get_next_link(),
+            'previous': viewset.paginator.get_previous_link(),
+        })
+
+
+class ActivitySummaryRoute(AsyncViewSetRoute):
+    """Async ActivityViewSet.summary()."""
+
+    @aconditional_read
+    async def read(self, request, *args, **kwargs):
+        viewset = self.viewset
+        queryset, error = viewset.get_summary_queryset(request)
+        if error:
+            return Response({'error': error}, status=status.HTTP_400_BAD_REQUEST)
+
+        async def compute():
+            return viewset.summary_result(await acompute_statistics(queryset))
+
+        return Response(await aget_or_compute(request, 'summary', compute))
+
+
+class ActivityTrendsRoute(AsyncViewSetRoute):
+    """Async ActivityViewSet.trends()."""
+
+    @aconditional_read
+    async def read(self, request, *args, **kwargs):
+        viewset = self.viewset
+        queryset = request.user.daily_rollups.all()
+
+        period, param, count, error = viewset.get_trends_params(request)
+        if error:
+            return Response({'error': error}, status=status.HTTP_400_BAD_REQUEST)
+
+        try:
+            trends = await aget_or_compute(
+                request, 'trends',
+                lambda: acompute_trends(queryset, period, count, timezone.now().date())
+            )
+        except (ValueError, OverflowError):
+            return Response(
+                {'error': f'{param} is out of range'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        return Response({
+            'period_type': period,
+            'trends': trends
+        })
+
+
+# Router URL name -> async view serving that route
+ASYNC_ROUTES = {
+    'activity-list': ActivityListRoute,
+    'activity-detail': ActivityDetailRoute,
+    'activity-history': ActivityHistoryRoute,
+    'activity-summary': ActivitySummaryRoute,
+    'activity-trends': ActivityTrendsRoute,
+}
+
+
+def async_read_urls(urls):
+    """Return router ``urls`` with the routes in ASYNC_ROUTES served async."""
+    patterns = []
+    for url in urls:
+        route = ASYNC_ROUTES.get(getattr(url, 'name', None))
+        if route is not None:
+            url = URLPattern(url.pattern, route.as_view(sync_view=url.callback), url.default_args, url.name)
+        patterns.append(url)
+    return patterns
@@ -0,0 +1,159 @@
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import IntegrityError, transaction
+from django.utils.translation import gettext_lazy as _
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import AuthenticationFailed, InvalidToken, TokenError
+from rest_framework_simplejwt.serializers import TokenRefreshSerializer
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.token_blacklist.models import BlacklistedToken, OutstandingToken
+from rest_framework_simplejwt.tokens import RefreshToken
+from rest_framework_simplejwt.utils import datetime_from_epoch, get_md5_hash_password
+
+
+def _cache():
+    return caches[settings.USER_CACHE_ALIAS]
+
+
+def _user_key(user_id):
+    return f'auth:user:{user_id}'
+
+
+def forget_user(user):
+    """
+    Drop ``user`` from the authentication cache once the current
+    transaction commits, so the next request loads the saved row.
+    """
+    key = _user_key(getattr(user, api_settings.USER_ID_FIELD))
+    transaction.on_commit(lambda: _cache().delete(key))
+
+
+class CachedJWTAuthentication(JWTAuthentication):
+    """
+    JWTAuthentication that loads the token's user from the USER_CACHE_ALIAS
+    cache, so that steady-state requests skip the user query. Entries expire
+    after the cache's short timeout and are dropped when the user is saved
+    or deleted. The active and revoked token checks still run on every
+    request. Unless USER_CACHE_ENABLED, the user is read from the database
+    every time.
+    """
+
+    def get_user(self, validated_token):
+        if not settings.USER_CACHE_ENABLED:
+            return super().get_user(validated_token)
+        try:
+            user_id = validated_token[api_settings.USER_ID_CLAIM]
+        except KeyError:
+            raise InvalidToken(_("Token contained no recognizable user identification"))
+
+        cache = _cache()
+        key = _user_key(user_id)
+        user = cache.get(key)
+        if user is None:
+            try:
+                user = self.user_model.objects.get(**{api_settings.USER_ID_FIELD: user_id})
+            except self.user_model.DoesNotExist:
+                raise AuthenticationFailed(_("User not found"), code="user_not_found")
+            cache.set(key, user)
+
+        if not user.is_active:
+            raise AuthenticationFailed(_("User is inactive"), code="user_inactive")
+
+        if api_settings.CHECK_REVOKE_TOKEN:
+            if validated_token.get(
+                api_settings.REVOKE_TOKEN_CLAIM
+            ) != get_md5_hash_password(user.password):
+                raise AuthenticationFailed(
+                    _("The user's password has been changed."), code="password_changed"
+                )
+
+        return user
+
+
+def _revoked_key(jti):
+    return f'auth:revoked:{jti}'
+
+
+def remember_revoked(jti, exp):
+    """Cache that the token ``jti`` is revoked until it expires at ``exp``."""
+    timeout = int(exp - time.time()) + 1
+    if timeout > 0:
+        caches[settings.TOKEN_BLACKLIST_CACHE_ALIAS].set(_revoked_key(jti), True, timeout=timeout)
+
+
+def is_revoked(jti, check_database=True):
+    """
+    Return whether the token ``jti`` is blacklisted. The cache answers for
+    revocations it has seen, the database for the others unless
+    ``check_database`` is false.
+    """
+    if caches[settings.TOKEN_BLACKLIST_CACHE_ALIAS].get(_revoked_key(jti)):
+        return True
+    return check_database and BlacklistedToken.objects.filter(token__jti=jti).exists()
+
+
+def revoke(token):
+    """
+    Blacklist ``token`` and return True, or return False if it already
+    was. The unique blacklist row makes this the check as well, so of
+    concurrent calls for the same token only one returns True.
+    """
+    jti = token[api_settings.JTI_CLAIM]
+    exp = token['exp']
+    outstanding, _ = OutstandingToken.objects.get_or_create(
+        jti=jti, defaults={'token': str(token), 'expires_at': datetime_from_epoch(exp)}
+    )
+    try:
+        with transaction.atomic():
+            # Cached by the post_save signal once committed
+            BlacklistedToken.objects.create(token=outstanding)
+    except IntegrityError:
+        remember_revoked(jti, exp)
+        return False
+    return True
+
+
+class RevocableRefreshToken(RefreshToken):
+    """RefreshToken whose blacklist check goes through the revocation cache."""
+    check_database = True
+
+    def check_blacklist(self):
+        if is_revoked(self.payload[api_settings.JTI_CLAIM], self.check_database):
+            raise TokenError(_("Token is blacklisted"))
+
+
+class RotatedRefreshToken(RevocableRefreshToken):
+    """
+    Refresh token about to be rotated. Only the cache is checked, as
+    revoke() is the authoritative check.
+    """
+    check_database = False
+
+
+class RotatingTokenRefreshSerializer(TokenRefreshSerializer):
+    """
+    TokenRefreshSerializer that revokes the rotated refresh token with a
+    single insert, rejecting it if it had already been revoked.
+    """
+    token_class = RevocableRefreshToken
+
+    def validate(self, attrs):
+        rotating = api_settings.ROTATE_REFRESH_TOKENS and api_settings.BLACKLIST_AFTER_ROTATION
+        token_class = RotatedRefreshToken if rotating else self.token_class
+        refresh = token_class(attrs["refresh"])
+
+        data = {"access": str(refresh.access_token)}
+
+        if api_settings.ROTATE_REFRESH_TOKENS:
+            if api_settings.BLACKLIST_AFTER_ROTATION and not revoke(refresh):
+                raise TokenError(_("Token is blacklisted"))
+
+            refresh.set_jti()
+            refresh.set_exp()
+            refresh.set_iat()
+
+            data["refresh"] = str(refresh)
+
+        return data
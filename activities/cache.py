@@ -0,0 +1,160 @@
+import hashlib
+import threading
+import time
+from collections import Counter
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+from django.utils import timezone
+
+from . import metrics
+
+
+# Query parameters that select a page, an order or a response format rather
+# than the data set, and therefore never change a cached statistics result
+IGNORED_PARAMS = {'page', 'page_size', 'pagination', 'cursor', 'sort_by', 'stream', 'format'}
+
+_counter_lock = threading.Lock()
+_counters = Counter()
+
+
+def _cache():
+    return caches[settings.ACTIVITY_CACHE_ALIAS]
+
+
+def _version_key(user_id):
+    return f'activities:version:{user_id}'
+
+
+def _modified_key(user_id):
+    return f'activities:modified:{user_id}'
+
+
+def get_data_version(user_id):
+    """
+    Return the current data version of a user's activities.
+
+    A missing version (never set, or evicted) starts from the current time
+    in nanoseconds, so it can never collide with a version used before.
+    """
+    cache = _cache()
+    key = _version_key(user_id)
+    version = cache.get(key)
+    if version is None:
+        cache.add(key, time.time_ns(), timeout=None)
+        version = cache.get(key)
+    return version
+
+
+def bump_data_version(user_id, using=None):
+    """
+    Invalidate every cached result of a user once the current transaction
+    on the database ``using`` commits, so a concurrent reader cannot cache
+    pre-commit data under the new version.
+    """
+    transaction.on_commit(lambda: _bump(user_id), using=using)
+
+
+def _bump(user_id):
+    cache = _cache()
+    key = _version_key(user_id)
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.set(key, time.time_ns(), timeout=None)
+    # Last-Modified has one second resolution, so keep it strictly
+    # increasing to tell apart changes made within the same second
+    modified_key = _modified_key(user_id)
+    previous = cache.get(modified_key) or 0
+    cache.set(modified_key, max(int(time.time()), previous + 1), timeout=None)
+
+
+def get_last_modified(user_id):
+    """
+    Return the Unix time of the last change to a user's activities.
+
+    When unknown (never recorded, or evicted) the current time is recorded,
+    which errs on the side of reporting the data as modified.
+    """
+    cache = _cache()
+    key = _modified_key(user_id)
+    modified = cache.get(key)
+    if modified is None:
+        cache.add(key, int(time.time()), timeout=None)
+        modified = cache.get(key)
+    return modified
+
+
+def _record(endpoint, outcome):
+    with _counter_lock:
+        _counters[(endpoint, outcome)] += 1
+    metrics.record_cache(endpoint, 'hit' if outcome == 'hits' else 'miss')
+
+
+def cache_stats():
+    """Return this process's hit and miss counts per endpoint."""
+    with _counter_lock:
+        counters = dict(_counters)
+    endpoints = sorted({endpoint for endpoint, _ in counters})
+    return {
+        endpoint: {
+            'hits': counters.get((endpoint, 'hits'), 0),
+            'misses': counters.get((endpoint, 'misses'), 0),
+        }
+        for endpoint in endpoints
+    }
+
+
+def _result_key(user_id, endpoint, request):
+    params = sorted(
+        (key, values)
+        for key, values in request.query_params.lists()
+        if key not in IGNORED_PARAMS
+    )
+    # Relative ranges such as days=30 depend on the current date
+    fingerprint = repr((params, timezone.now().date().isoformat()))
+    digest = hashlib.sha1(fingerprint.encode()).hexdigest()
+    return f'activities:{endpoint}:{user_id}:{get_data_version(user_id)}:{digest}'
+
+
+def get_or_compute(request, endpoint, compute):
+    """
+    Return the cached result of ``compute()`` for the requesting user,
+    ``endpoint`` and the normalized query parameters, computing and
+    storing it on a miss. Without a shared cache, ``compute()`` is
+    always called.
+    """
+    if not settings.ACTIVITY_CACHE_ENABLED:
+        return compute()
+    cache = _cache()
+    key = _result_key(request.user.pk, endpoint, request)
+    result = cache.get(key)
+    if result is not None:
+        _record(endpoint, 'hits')
+        return result
+    _record(endpoint, 'misses')
+    result = compute()
+    cache.set(key, result, timeout=settings.ACTIVITY_CACHE_TIMEOUT)
+    return result
+
+
+async def aget_or_compute(request, endpoint, compute):
+    """
+    Async version of get_or_compute(), where ``compute`` is a coroutine
+    function. Cache calls run in a thread, as backends such as the
+    database cache may query the database.
+    """
+    if not settings.ACTIVITY_CACHE_ENABLED:
+        return await compute()
+    cache = _cache()
+    key = await sync_to_async(_result_key)(request.user.pk, endpoint, request)
+    result = await cache.aget(key)
+    if result is not None:
+        _record(endpoint, 'hits')
+        return result
+    _record(endpoint, 'misses')
+    result = await compute()
+    await cache.aset(key, result, timeout=settings.ACTIVITY_CACHE_TIMEOUT)
+    return result
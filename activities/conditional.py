@@ -0,0 +1,75 @@
+import functools
+import hashlib
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.utils import timezone
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date
+
+from .cache import get_data_version, get_last_modified
+
+
+def read_fingerprint(request):
+    """
+    Return ``(etag, last_modified)`` for a read of the requesting user's
+    activities, built from the per-user data version kept in the cache so
+    that no database query is needed.
+    """
+    user = request.user
+    fingerprint = repr((
+        get_data_version(user.pk),
+        user.get_username(),
+        request.path,
+        sorted(request.query_params.lists()),
+        request.META.get('HTTP_ACCEPT', ''),
+        # Relative ranges such as days=30 depend on the current date
+        timezone.now().date().isoformat(),
+    ))
+    etag = '"%s"' % hashlib.sha1(fingerprint.encode()).hexdigest()
+    # Never before the start of the day, as relative ranges move with it
+    start_of_day = timezone.now().replace(hour=0, minute=0, second=0, microsecond=0)
+    return etag, max(get_last_modified(user.pk), int(start_of_day.timestamp()))
+
+
+def conditional_read(view_method):
+    """
+    Decorate a read-only view method with ETag and Last-Modified support.
+
+    When the request's If-None-Match or If-Modified-Since header matches
+    the current fingerprint, 304 Not Modified is returned without calling
+    the view, so no query is run and nothing is serialized. Without a
+    shared cache the data versions are per process, so the view is always
+    called and no validators are sent.
+    """
+    @functools.wraps(view_method)
+    def wrapper(self, request, *args, **kwargs):
+        if not settings.ACTIVITY_CACHE_ENABLED:
+            return view_method(self, request, *args, **kwargs)
+        etag, last_modified = read_fingerprint(request)
+        response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+        if response is None:
+            response = view_method(self, request, *args, **kwargs)
+        return _add_validators(response, etag, last_modified)
+    return wrapper
+
+
+def aconditional_read(view_method):
+    """Async version of conditional_read() for coroutine view methods."""
+    @functools.wraps(view_method)
+    async def wrapper(self, request, *args, **kwargs):
+        if not settings.ACTIVITY_CACHE_ENABLED:
+            return await view_method(self, request, *args, **kwargs)
+        etag, last_modified = await sync_to_async(read_fingerprint)(request)
+        response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+        if response is None:
+            response = await view_method(self, request, *args, **kwargs)
+        return _add_validators(response, etag, last_modified)
+    return wrapper
+
+
+def _add_validators(response, etag, last_modified):
+    if response.status_code in (200, 304):
+        response['ETag'] = etag
+        response['Last-Modified'] = http_date(last_modified)
+    return response
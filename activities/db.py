@@ -0,0 +1,298 @@
+import heapq
+import random
+from contextvars import ContextVar
+from functools import cmp_to_key
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import caches
+from django.db import DEFAULT_DB_ALIAS, connections, transaction
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+
+from .models import Activity, ActivityDailyRollup, ActivityStats, ActivityStreak, ArchivedActivity, UserShard
+
+
+# Models whose rows live on their user's shard
+SHARDED_MODELS = (Activity, ActivityDailyRollup, ActivityStats, ActivityStreak, ArchivedActivity)
+
+# Replica alias the reads of the current request go to, or None for the
+# primary. Set per request by ReplicaReadMixin.
+_read_replica = ContextVar('read_replica', default=None)
+# (user id, shard alias) of the current request's user, so that routing
+# their queries needs no lookup. Set per request by UserShardMixin.
+_request_shard = ContextVar('request_shard', default=None)
+
+
+@receiver(connection_created)
+def configure_sqlite(sender, connection, **kwargs):
+    """
+    Apply SQLITE_PRAGMAS to every new SQLite connection. They are run on
+    the raw connection, so they are neither logged nor counted as queries.
+    """
+    if connection.vendor != 'sqlite':
+        return
+    for name, value in settings.SQLITE_PRAGMAS.items():
+        connection.connection.execute(f'PRAGMA {name} = {value}')
+
+
+def _pin_key(user_id):
+    return f'db:pinned:{user_id}'
+
+
+def pin_to_primary(user_id):
+    """Read the user's data from the primary for DATABASE_REPLICA_PIN_SECONDS."""
+    if settings.DATABASE_REPLICAS:
+        caches['default'].set(_pin_key(user_id), True, timeout=settings.DATABASE_REPLICA_PIN_SECONDS)
+
+
+def is_pinned(user_id):
+    return bool(caches['default'].get(_pin_key(user_id)))
+
+
+def read_from_replica(user_id):
+    """
+    Send the rest of the current request's reads to a random replica,
+    unless there is none or the user wrote recently.
+    """
+    replicas = settings.DATABASE_REPLICAS
+    if replicas and not (user_id is not None and is_pinned(user_id)):
+        _read_replica.set(random.choice(replicas))
+    else:
+        _read_replica.set(None)
+
+
+def read_from_primary():
+    """Send the rest of the current request's reads to the primary."""
+    _read_replica.set(None)
+
+
+class ReplicaRouter:
+    """
+    Route reads to the replica picked for the current request, if any, and
+    everything else to the primary. Replicas are copies of the primary, so
+    nothing is migrated on them.
+    """
+
+    def db_for_read(self, model, **hints):
+        return _read_replica.get()
+
+    def db_for_write(self, model, **hints):
+        return None
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Rows read from a replica are rows of the primary
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        if db in settings.DATABASE_REPLICAS:
+            return False
+        return None
+
+
+def _shard_key(user_id):
+    return f'db:shard:{user_id}'
+
+
+def is_sharded():
+    return len(settings.DATABASE_SHARDS) > 1
+
+
+def shard_for_user(user_id):
+    """
+    Return the alias of the database holding the user's activities. Users
+    without an entry in the shard directory, such as those created before
+    sharding was configured, are on the default database.
+    """
+    if not is_sharded():
+        return DEFAULT_DB_ALIAS
+    bound = _request_shard.get()
+    if bound is not None and bound[0] == user_id:
+        return bound[1]
+    cache = caches['default']
+    key = _shard_key(user_id)
+    alias = cache.get(key)
+    if alias is None:
+        alias = (
+            UserShard.objects.using(DEFAULT_DB_ALIAS)
+            .filter(user_id=user_id)
+            .values_list('database', flat=True)
+            .first()
+        ) or DEFAULT_DB_ALIAS
+        cache.set(key, alias, timeout=settings.DATABASE_SHARD_CACHE_SECONDS)
+    return alias
+
+
+def assign_shards(user_ids):
+    """Spread new users over the shards by id and record it in the directory."""
+    if not is_sharded():
+        return
+    shards = settings.DATABASE_SHARDS
+    entries = [UserShard(user_id=user_id, database=shards[user_id % len(shards)]) for user_id in user_ids]
+    UserShard.objects.using(DEFAULT_DB_ALIAS).bulk_create(entries)
+    transaction.on_commit(lambda: caches['default'].set_many(
+        {_shard_key(entry.user_id): entry.database for entry in entries},
+        timeout=settings.DATABASE_SHARD_CACHE_SECONDS,
+    ), using=DEFAULT_DB_ALIAS)
+
+
+def move_user_to_shard(user_id, alias):
+    """Record in the directory that the user's activities are now on ``alias``."""
+    UserShard.objects.using(DEFAULT_DB_ALIAS).update_or_create(user_id=user_id, defaults={'database': alias})
+    caches['default'].set(_shard_key(user_id), alias, timeout=settings.DATABASE_SHARD_CACHE_SECONDS)
+
+
+def forget_shard(user_id):
+    caches['default'].delete(_shard_key(user_id))
+
+
+def bind_user_shard(user_id):
+    """
+    Look up the shard of the current request's user once, for all of the
+    request's queries. Also lets async code route their queries without
+    touching the cache or the database. None unbinds.
+    """
+    _request_shard.set(None if user_id is None else (user_id, shard_for_user(user_id)))
+
+
+def scatter(function):
+    """
+    Call ``function(alias)`` for every shard and return the results by
+    alias. The shards are queried one after the other on the calling
+    thread's persistent connections.
+    """
+    return {alias: function(alias) for alias in settings.DATABASE_SHARDS}
+
+
+def gather(queryset, limit=None):
+    """
+    Evaluate ``queryset`` on every shard and merge the results following
+    its ordering, e.g. for admin-style queries across all users:
+
+        gather(Activity.objects.filter(date=today).order_by('-duration'), limit=10)
+
+    Each shard's results are already ordered, so at most ``limit`` rows are
+    read from each. Model instances and values() rows can be merged, the
+    latter only when they include the ordering fields. NULLs sort first.
+    """
+    if limit is not None:
+        queryset = queryset[:limit]
+    results = scatter(lambda alias: list(queryset.using(alias))).values()
+
+    query = queryset.query
+    ordering = query.order_by or (queryset.model._meta.ordering if query.default_ordering else ())
+    fields = []
+    for name in ordering:
+        descending = name.startswith('-')
+        name = name.lstrip('-')
+        if name == 'pk':
+            name = queryset.model._meta.pk.attname
+        fields.append((name, descending))
+
+    def compare(left, right):
+        for name, descending in fields:
+            a, b = _ordering_value(left, name), _ordering_value(right, name)
+            if a == b:
+                continue
+            if a is None or (b is not None and a < b):
+                result = -1
+            else:
+                result = 1
+            return -result if descending else result
+        return 0
+
+    merged = heapq.merge(*results, key=cmp_to_key(compare)) if fields else (row for rows in results for row in rows)
+    return list(merged)[:limit]
+
+
+def _ordering_value(row, name):
+    if isinstance(row, dict):
+        return row[name]
+    return getattr(row, row._meta.get_field(name).attname)
+
+
+def copy_rows(model, objs, using, batch_size=1000):
+    """
+    Insert ``objs`` into ``model``'s table on ``using`` as they are, ids and
+    timestamps included, without sending signals. ``objs`` may be of
+    another model with the same columns. bulk_create() would overwrite the
+    created_at and updated_at timestamps.
+    """
+    connection = connections[using]
+    quote = connection.ops.quote_name
+    fields = model._meta.concrete_fields
+    sql = 'INSERT INTO {} ({}) VALUES ({})'.format(
+        quote(model._meta.db_table),
+        ', '.join(quote(field.column) for field in fields),
+        ', '.join(['%s'] * len(fields)),
+    )
+    with connection.cursor() as cursor:
+        for start in range(0, len(objs), batch_size):
+            cursor.executemany(sql, [
+                [field.get_db_prep_save(getattr(obj, field.attname), connection) for field in fields]
+                for obj in objs[start:start + batch_size]
+            ])
+
+
+def delete_rows(model, pks, using, batch_size=1000):
+    """
+    Delete the rows of ``model`` with the primary keys ``pks`` from
+    ``using`` without collecting them or sending signals, e.g. once they
+    have been copied elsewhere with copy_rows().
+    """
+    connection = connections[using]
+    quote = connection.ops.quote_name
+    pks = list(pks)
+    with connection.cursor() as cursor:
+        for start in range(0, len(pks), batch_size):
+            batch = pks[start:start + batch_size]
+            cursor.execute(
+                'DELETE FROM {} WHERE {} IN ({})'.format(
+                    quote(model._meta.db_table),
+                    quote(model._meta.pk.column),
+                    ', '.join(['%s'] * len(batch)),
+                ),
+                batch,
+            )
+
+
+class ShardRouter:
+    """
+    Route the queries of sharded models to the shard of the user they
+    belong to. The user is taken from the ``instance`` hint, which is set
+    for saves, deletes and related managers (``user.activities``), or else
+    is the current request's user. Anything else is left to the next
+    router, as are reads on the default database so that they may go to
+    a replica.
+    """
+
+    def _shard(self, hints):
+        instance = hints.get('instance')
+        if isinstance(instance, User):
+            return shard_for_user(instance.pk)
+        if isinstance(instance, SHARDED_MODELS) and instance.user_id is not None:
+            return shard_for_user(instance.user_id)
+        bound = _request_shard.get()
+        return bound[1] if bound is not None else DEFAULT_DB_ALIAS
+
+    def db_for_read(self, model, **hints):
+        if issubclass(model, SHARDED_MODELS):
+            alias = self._shard(hints)
+            return None if alias == DEFAULT_DB_ALIAS else alias
+        if isinstance(hints.get('instance'), SHARDED_MODELS):
+            # e.g. activity.user: users are never on the shards
+            return _read_replica.get() or DEFAULT_DB_ALIAS
+        return None
+
+    def db_for_write(self, model, **hints):
+        if issubclass(model, SHARDED_MODELS):
+            return self._shard(hints)
+        if isinstance(hints.get('instance'), SHARDED_MODELS):
+            return DEFAULT_DB_ALIAS
+        return None
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # A sharded row references its user on the default database
+        if isinstance(obj1, SHARDED_MODELS) or isinstance(obj2, SHARDED_MODELS):
+            return True
+        return None
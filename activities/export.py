@@ -0,0 +1,88 @@
+import csv
+import json
+
+from django.http import StreamingHttpResponse
+from django.utils import timezone
+
+
+EXPORT_FIELDS = [
+    'id', 'activity_type', 'duration', 'distance', 'calories_burned',
+    'notes', 'date', 'created_at', 'updated_at',
+]
+EXPORT_CHUNK_SIZE = 2000
+
+
+class _Echo:
+    """File-like object whose write() returns the value instead of storing it."""
+
+    def write(self, value):
+        return value
+
+
+def _format_datetime(value):
+    # Same representation as the DRF DateTimeField used by the serializers
+    value = timezone.localtime(value).isoformat()
+    if value.endswith('+00:00'):
+        value = value[:-6] + 'Z'
+    return value
+
+
+def _rows(queryset, chunk_size):
+    """Yield export rows as tuples straight from the database cursor."""
+    date_index = EXPORT_FIELDS.index('date')
+    datetime_indexes = (EXPORT_FIELDS.index('created_at'), EXPORT_FIELDS.index('updated_at'))
+    for row in queryset.values_list(*EXPORT_FIELDS).iterator(chunk_size=chunk_size):
+        row = list(row)
+        row[date_index] = row[date_index].isoformat()
+        for index in datetime_indexes:
+            row[index] = _format_datetime(row[index])
+        yield row
+
+
+def _csv_lines(queryset, chunk_size):
+    writer = csv.writer(_Echo())
+    yield writer.writerow(EXPORT_FIELDS)
+    for row in _rows(queryset, chunk_size):
+        yield writer.writerow(row)
+
+
+def _ndjson_lines(queryset, chunk_size):
+    for row in _rows(queryset, chunk_size):
+        yield json.dumps(dict(zip(EXPORT_FIELDS, row)), ensure_ascii=False) + '\n'
+
+
+def _batched(lines, size):
+    """Join lines into blocks of ``size`` so each write carries many rows."""
+    block = []
+    for line in lines:
+        block.append(line)
+        if len(block) >= size:
+            yield ''.join(block)
+            block = []
+    if block:
+        yield ''.join(block)
+
+
+EXPORT_FORMATS = {
+    'csv': (_csv_lines, 'text/csv'),
+    'ndjson': (_ndjson_lines, 'application/x-ndjson'),
+}
+
+
+def export_response(queryset, output, filename, chunk_size=EXPORT_CHUNK_SIZE):
+    """
+    Stream ``queryset`` as CSV or NDJSON.
+
+    Rows are read with values_list() through a chunked cursor, so no model
+    instances or serializers are involved and memory use is constant.
+    """
+    lines, content_type = EXPORT_FORMATS[output]
+    # The rows are read after the view has returned, so pin the database
+    # the view's reads were routed to
+    queryset = queryset.using(queryset.db)
+    response = StreamingHttpResponse(
+        _batched(lines(queryset, chunk_size), chunk_size),
+        content_type=content_type,
+    )
+    response['Content-Disposition'] = f'attachment; filename="{filename}.{output}"'
+    return response
@@ -0,0 +1,80 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.db.models import Q
+
+from activities.archive import archive, archive_cutoff, restore
+from activities.models import Activity, ArchivedActivity
+
+
+class Command(BaseCommand):
+    help = (
+        'Move activities dated before the archive cutoff, ACTIVITY_ARCHIVE_DAYS '
+        'days ago, from the Activity table to the archive in batches, on every '
+        'shard. Archived activities dated after the cutoff, e.g. once '
+        'ACTIVITY_ARCHIVE_DAYS has been raised, are moved back. Run it daily.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size', type=int, default=1000,
+            help='Number of activities moved per transaction (default: 1000).',
+        )
+        parser.add_argument(
+            '--restore', action='store_true',
+            help='Move every archived activity back, e.g. before turning archiving off.',
+        )
+        parser.add_argument(
+            '--dry-run', action='store_true',
+            help='Print how many activities would move without moving them.',
+        )
+
+    def handle(self, *args, **options):
+        cutoff = archive_cutoff()
+        if cutoff is None and not options['restore']:
+            raise CommandError(
+                'Archiving is off. Set ACTIVITY_ARCHIVE_DAYS, or pass --restore '
+                'to move every archived activity back.'
+            )
+        verb = 'Would move' if options['dry_run'] else 'Moved'
+
+        archived = restored = 0
+        for alias in settings.DATABASE_SHARDS:
+            if options['restore']:
+                shard_archived = 0
+                shard_restored = self.move(ArchivedActivity, Q(), restore, alias, options)
+            else:
+                shard_archived = self.move(Activity, Q(date__lt=cutoff), archive, alias, options)
+                shard_restored = self.move(ArchivedActivity, Q(date__gte=cutoff), restore, alias, options)
+            self.stdout.write(
+                f"{alias}: {verb.lower()} {shard_archived} activities to the archive "
+                f"and {shard_restored} back."
+            )
+            archived += shard_archived
+            restored += shard_restored
+
+        since = f" (cutoff {cutoff.isoformat()})" if cutoff is not None and not options['restore'] else ''
+        self.stdout.write(self.style.SUCCESS(
+            f"{verb} {archived} activities to the archive and {restored} back{since}."
+        ))
+
+    def move(self, model, condition, function, alias, options):
+        """
+        Pass the rows of ``model`` on ``alias`` matching ``condition`` to
+        ``function`` (archive or restore) a batch at a time, walking the
+        table by id so that no index on the condition is needed. Returns
+        the number of rows moved.
+        """
+        rows = model.objects.using(alias).filter(condition)
+        if options['dry_run']:
+            return rows.count()
+        moved = 0
+        last = 0
+        while True:
+            with transaction.atomic(using=alias):
+                batch = list(rows.select_for_update().filter(pk__gt=last).order_by('pk')[:options['batch_size']])
+                if not batch:
+                    return moved
+                function(batch, alias)
+            last = batch[-1].pk
+            moved += len(batch)
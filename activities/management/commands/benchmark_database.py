@@ -0,0 +1,164 @@
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import OperationalError, connections, transaction
+from django.test.utils import override_settings
+
+
+# Stand-in for the activities table and its daily rollups, so that the
+# write benchmark does not depend on the schema or fire model signals
+SCHEMA = [
+    'CREATE TABLE entry (id INTEGER PRIMARY KEY, user_id INTEGER, duration INTEGER, date TEXT)',
+    'CREATE INDEX entry_user ON entry (user_id, date)',
+    'CREATE TABLE total (user_id INTEGER PRIMARY KEY, count INTEGER, duration INTEGER)',
+]
+WRITE = [
+    "INSERT INTO entry (user_id, duration, date) VALUES (%s, %s, date('now'))",
+    'INSERT INTO total (user_id, count, duration) VALUES (%s, 1, %s) '
+    'ON CONFLICT (user_id) DO UPDATE SET count = count + 1, duration = duration + excluded.duration',
+]
+READ = 'SELECT COUNT(*), SUM(duration) FROM entry WHERE user_id = %s'
+USERS = 50
+
+
+class Command(BaseCommand):
+    help = (
+        'Measure the per-request cost of opening a database connection '
+        'against reusing a persistent, health-checked one, on the configured '
+        'database. Then measure concurrent writers and readers on throwaway '
+        'SQLite files with the default settings and with SQLITE_PRAGMAS.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--requests', type=int, default=1000,
+            help='Number of simulated requests per connection mode (default: 1000).',
+        )
+        parser.add_argument(
+            '--writers', type=int, default=4,
+            help='Number of concurrent writing threads (default: 4).',
+        )
+        parser.add_argument(
+            '--readers', type=int, default=4,
+            help='Number of concurrent reading threads (default: 4).',
+        )
+        parser.add_argument(
+            '--duration', type=float, default=3.0,
+            help='Seconds each write concurrency run lasts (default: 3).',
+        )
+
+    def handle(self, *args, **options):
+        self.stdout.write(f"Connection overhead ({connections['default'].vendor}):")
+        per_request = self.benchmark_connections(0, options['requests'])
+        persistent = self.benchmark_connections(settings.DATABASE_CONN_MAX_AGE or 600, options['requests'])
+        self.stdout.write(f"  {'new connection per request':<34} {per_request * 1000:>8.3f} ms/request")
+        self.stdout.write(
+            f"  {'persistent with health checks':<34} {persistent * 1000:>8.3f} ms/request "
+            f"({per_request / persistent:.1f}x)"
+        )
+
+        self.stdout.write(
+            f"SQLite write concurrency ({options['writers']} writers, {options['readers']} readers):"
+        )
+        with tempfile.TemporaryDirectory() as directory:
+            for label, pragmas in [('default settings', {}), ('SQLITE_PRAGMAS', settings.SQLITE_PRAGMAS)]:
+                with override_settings(SQLITE_PRAGMAS=pragmas):
+                    result = self.benchmark_writes(Path(directory) / f'{len(pragmas)}.sqlite3', options)
+                self.stdout.write(
+                    f"  {label:<18} {result['writes']:>8,.0f} commits/s {result['reads']:>9,.0f} reads/s "
+                    f"  slowest commit {result['slowest'] * 1000:>7.1f} ms  {result['locked']} locked errors"
+                )
+
+    def add_alias(self, alias, **overrides):
+        connections.settings[alias] = dict(connections.settings['default'], **overrides)
+        return connections[alias]
+
+    def remove_alias(self, alias):
+        connections[alias].close()
+        del connections[alias]
+        del connections.settings[alias]
+
+    def benchmark_connections(self, max_age, requests):
+        """
+        Return the seconds per request of a request that runs one query,
+        with Django's request start and end connection handling.
+        """
+        alias = f'benchmark_{max_age}'
+        connection = self.add_alias(alias, CONN_MAX_AGE=max_age, CONN_HEALTH_CHECKS=bool(max_age))
+        try:
+            started = time.perf_counter()
+            for _ in range(requests):
+                connection.close_if_unusable_or_obsolete()
+                with connection.cursor() as cursor:
+                    cursor.execute('SELECT 1')
+                    cursor.fetchone()
+                connection.close_if_unusable_or_obsolete()
+            return (time.perf_counter() - started) / requests
+        finally:
+            self.remove_alias(alias)
+
+    def benchmark_writes(self, path, options):
+        """Run writers and readers against a new SQLite file and return rates."""
+        alias = 'benchmark_writes'
+        overrides = {'ENGINE': 'django.db.backends.sqlite3', 'NAME': str(path), 'OPTIONS': {}}
+        connection = self.add_alias(alias, **overrides)
+        with connection.cursor() as cursor:
+            for statement in SCHEMA:
+                cursor.execute(statement)
+        connection.close()
+
+        stop = threading.Event()
+        lock = threading.Lock()
+        totals = {'writes': 0, 'reads': 0, 'locked': 0, 'slowest': 0.0}
+
+        def work(index, write):
+            counts = {'writes': 0, 'reads': 0, 'locked': 0, 'slowest': 0.0}
+            connection = connections[alias]
+            try:
+                while not stop.is_set():
+                    user_id = (index * 7919 + counts['writes'] + counts['reads']) % USERS
+                    started = time.perf_counter()
+                    try:
+                        if write:
+                            with transaction.atomic(using=alias), connection.cursor() as cursor:
+                                for statement in WRITE:
+                                    cursor.execute(statement, [user_id, 30])
+                            counts['writes'] += 1
+                            counts['slowest'] = max(counts['slowest'], time.perf_counter() - started)
+                        else:
+                            with connection.cursor() as cursor:
+                                cursor.execute(READ, [user_id])
+                                cursor.fetchone()
+                            counts['reads'] += 1
+                    except OperationalError:
+                        counts['locked'] += 1
+            finally:
+                connection.close()
+                with lock:
+                    for key in ('writes', 'reads', 'locked'):
+                        totals[key] += counts[key]
+                    totals['slowest'] = max(totals['slowest'], counts['slowest'])
+
+        threads = [
+            threading.Thread(target=work, args=(index, index < options['writers']))
+            for index in range(options['writers'] + options['readers'])
+        ]
+        try:
+            for thread in threads:
+                thread.start()
+            time.sleep(options['duration'])
+            stop.set()
+            for thread in threads:
+                thread.join()
+        finally:
+            self.remove_alias(alias)
+        return {
+            'writes': totals['writes'] / options['duration'],
+            'reads': totals['reads'] / options['duration'],
+            'slowest': totals['slowest'],
+            'locked': totals['locked'],
+        }
@@ -0,0 +1,100 @@
+import random
+import time
+from contextlib import ExitStack
+from datetime import timedelta
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+from rest_framework.renderers import JSONRenderer
+
+from activities.db import shard_for_user
+from activities.models import Activity, ActivityDailyRollup
+from activities.serializers import ActivityHistorySerializer, ActivitySerializer
+from activities.values_serializers import ActivityHistoryValuesSerializer, ActivityValuesSerializer
+
+
+# (model serializer, values() serializer) pairs to compare
+PAIRS = [
+    (ActivitySerializer, ActivityValuesSerializer),
+    (ActivityHistorySerializer, ActivityHistoryValuesSerializer),
+]
+
+
+class Command(BaseCommand):
+    help = (
+        'Seed a throwaway set of activities and compare the rows per second '
+        'of the model serializers with their values() counterparts, from '
+        'the query to the rendered JSON. All seeded rows are rolled back. '
+        'That the outputs are identical is checked by '
+        'activities.tests.test_serializers.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--rows', type=int, default=5000,
+            help='Number of activities to serialize per run (default: 5000).',
+        )
+        parser.add_argument(
+            '--repeat', type=int, default=5,
+            help='Number of runs per serializer; the fastest one is reported (default: 5).',
+        )
+
+    def handle(self, *args, **options):
+        with ExitStack() as stack:
+            # Roll back whichever shard the user is put on
+            for alias in settings.DATABASE_SHARDS:
+                stack.enter_context(transaction.atomic(using=alias))
+            user = self.seed(options['rows'])
+            queryset = user.activities.order_by('-date', '-created_at')
+            renderer = JSONRenderer()
+            for model_serializer, values_serializer in PAIRS:
+                def model_path():
+                    rows = list(queryset)
+                    return renderer.render(model_serializer(rows, many=True).data)
+
+                def values_path():
+                    rows = list(values_serializer.rows(queryset, user=user))
+                    return renderer.render(values_serializer(rows, many=True).data)
+
+                model_rate = self.rows_per_second(model_path, options)
+                values_rate = self.rows_per_second(values_path, options)
+                self.stdout.write(
+                    f"{model_serializer.__name__:<32} {model_rate:>10,.0f} rows/s\n"
+                    f"{values_serializer.__name__:<32} {values_rate:>10,.0f} rows/s "
+                    f"({values_rate / model_rate:.1f}x)"
+                )
+            for alias in settings.DATABASE_SHARDS:
+                transaction.set_rollback(True, using=alias)
+
+    def seed(self, rows):
+        """Create a user with ``rows`` random activities and return it."""
+        rng = random.Random(0)
+        today = timezone.now().date()
+        types = [choice[0] for choice in Activity.ACTIVITY_TYPES]
+        user = User.objects.create(username='serializer-benchmark')
+        activities = Activity.objects.bulk_create([
+            Activity(
+                user=user,
+                activity_type=rng.choice(types),
+                duration=rng.randint(1, 180),
+                distance=rng.choice([None, 5.0, round(rng.uniform(0.5, 40), 2)]),
+                calories_burned=rng.choice([None, rng.randint(50, 1500)]),
+                notes=rng.choice(['', 'Morning run', 'Café & "quotes" ✓\nsecond line']),
+                date=today - timedelta(days=rng.randint(0, 3 * 365)),
+            )
+            for _ in range(rows)
+        ], batch_size=1000)
+        ActivityDailyRollup.objects.db_manager(shard_for_user(user.pk)).add_activities(activities)
+        return user
+
+    def rows_per_second(self, run, options):
+        best = None
+        for _ in range(options['repeat']):
+            started = time.perf_counter()
+            run()
+            elapsed = time.perf_counter() - started
+            best = elapsed if best is None else min(best, elapsed)
+        return options['rows'] / best
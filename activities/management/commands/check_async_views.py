@@ -0,0 +1,15 @@
+from django.core.management import call_command
+from django.core.management.base import BaseCommand
+
+
+class Command(BaseCommand):
+    help = (
+        'In a throwaway test database, call the activity read endpoints through '
+        'the sync views over WSGI and the async views over ASGI and fail if any '
+        'response differs. Then send many concurrent requests to one ASGI '
+        'application and fail unless all of them succeed. Runs '
+        'activities.tests.test_async_views, where the compared requests live.'
+    )
+
+    def handle(self, *args, **options):
+        call_command('test', 'activities.tests.test_async_views', verbosity=options['verbosity'])
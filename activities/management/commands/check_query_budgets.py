@@ -0,0 +1,14 @@
+from django.core.management import call_command
+from django.core.management.base import BaseCommand
+
+
+class Command(BaseCommand):
+    help = (
+        'Call every API and admin route against data sets of several sizes '
+        'in a throwaway test database and fail if an endpoint runs another '
+        'number of queries than its budget. Runs '
+        'activities.tests.test_query_counts, where the budgets live.'
+    )
+
+    def handle(self, *args, **options):
+        call_command('test', 'activities.tests.test_query_counts', verbosity=options['verbosity'])
@@ -0,0 +1,15 @@
+from django.core.management import call_command
+from django.core.management.base import BaseCommand
+
+
+class Command(BaseCommand):
+    help = (
+        'Seed a throwaway test database, EXPLAIN every query issued by the '
+        'activity endpoints and fail if any of them scans a whole table or '
+        'sorts its result in a temporary structure, with and without '
+        'archived activities. Runs activities.tests.test_query_plans, where '
+        'the checked endpoints live.'
+    )
+
+    def handle(self, *args, **options):
+        call_command('test', 'activities.tests.test_query_plans', verbosity=options['verbosity'])
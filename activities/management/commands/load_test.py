@@ -0,0 +1,223 @@
+import http.client
+import json
+import platform
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone as dt_timezone
+from urllib.parse import urlsplit
+
+import django
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+
+# name -> (method, path, needs a token). Paths are relative to --base-url.
+SCENARIOS = {
+    'token-obtain': ('POST', '/api/token/', False),
+    'list': ('GET', '/api/activities/', True),
+    'create': ('POST', '/api/activities/', True),
+    'history': ('GET', '/api/activities/history/?days=90', True),
+    'summary': ('GET', '/api/activities/summary/', True),
+    'trends': ('GET', '/api/activities/trends/?period=weekly', True),
+}
+PERCENTILES = [50, 95, 99]
+
+
+def percentile(values, percent):
+    """Return the nearest-rank percentile of sorted ``values``."""
+    if not values:
+        return None
+    rank = max(1, -(-len(values) * percent // 100))
+    return values[rank - 1]
+
+
+class Client:
+    """One keep-alive HTTP connection per worker thread."""
+
+    def __init__(self, base_url, timeout):
+        parts = urlsplit(base_url)
+        self.connection_class = (
+            http.client.HTTPSConnection if parts.scheme == 'https' else http.client.HTTPConnection
+        )
+        self.netloc = parts.netloc
+        self.prefix = parts.path.rstrip('/')
+        self.timeout = timeout
+        self.local = threading.local()
+
+    def request(self, method, path, body=None, token=None):
+        """Send one request and return ``(status, elapsed seconds, body)``."""
+        headers = {'Accept': 'application/json'}
+        if body is not None:
+            body = json.dumps(body)
+            headers['Content-Type'] = 'application/json'
+        if token:
+            headers['Authorization'] = f'Bearer {token}'
+        started = time.perf_counter()
+        for attempt in range(2):
+            connection = getattr(self.local, 'connection', None)
+            if connection is None:
+                connection = self.local.connection = self.connection_class(self.netloc, timeout=self.timeout)
+            try:
+                connection.request(method, self.prefix + path, body=body, headers=headers)
+                response = connection.getresponse()
+                content = response.read()
+                return response.status, time.perf_counter() - started, content
+            except (http.client.HTTPException, OSError):
+                # The server closed a kept-alive connection; retry once on a new one
+                connection.close()
+                self.local.connection = None
+                if attempt:
+                    return None, time.perf_counter() - started, b''
+                started = time.perf_counter()
+
+
+class Command(BaseCommand):
+    help = (
+        'Drive the API of a running server with concurrent requests, one '
+        'endpoint at a time, and report the throughput and the p50/p95/p99 '
+        'latency of each. Logs in as users created by seed_activities. The '
+        'report is written as JSON so that runs can be compared.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--base-url', default='http://127.0.0.1:8000',
+            help='Server to test (default: http://127.0.0.1:8000).',
+        )
+        parser.add_argument(
+            '--endpoints', nargs='+', choices=list(SCENARIOS), default=list(SCENARIOS),
+            help='Endpoints to test, in order (default: all of them).',
+        )
+        parser.add_argument(
+            '--concurrency', type=int, default=10,
+            help='Number of requests in flight at once (default: 10).',
+        )
+        parser.add_argument(
+            '--requests', type=int, default=200,
+            help='Number of measured requests per endpoint (default: 200).',
+        )
+        parser.add_argument(
+            '--warmup', type=int, default=10,
+            help='Number of unmeasured requests sent to each endpoint first (default: 10).',
+        )
+        parser.add_argument(
+            '--users', type=int, default=10,
+            help='Number of seeded users to spread the requests over (default: 10).',
+        )
+        parser.add_argument(
+            '--prefix', default='loadtest',
+            help='Username prefix given to seed_activities (default: loadtest).',
+        )
+        parser.add_argument(
+            '--password', default='loadtest-Password-1',
+            help='Password given to seed_activities (default: loadtest-Password-1).',
+        )
+        parser.add_argument(
+            '--timeout', type=float, default=30,
+            help='Timeout of a single request in seconds (default: 30).',
+        )
+        parser.add_argument(
+            '--output', default='-',
+            help="File to write the JSON report to, or '-' for standard output (default).",
+        )
+
+    def handle(self, *args, **options):
+        client = Client(options['base_url'], options['timeout'])
+        self.password = options['password']
+        users = [f"{options['prefix']}-{index}" for index in range(options['users'])]
+        tokens = self.obtain_tokens(client, users, options['password'])
+
+        started_at = datetime.now(dt_timezone.utc).isoformat()
+        results = {}
+        for name in options['endpoints']:
+            self.stderr.write(f"Testing {name}...")
+            self.run(client, name, users, tokens, options['warmup'], options['concurrency'])
+            results[name] = self.run(client, name, users, tokens, options['requests'], options['concurrency'])
+
+        report = {
+            'started_at': started_at,
+            'base_url': options['base_url'],
+            'concurrency': options['concurrency'],
+            'requests_per_endpoint': options['requests'],
+            'users': options['users'],
+            'python': platform.python_version(),
+            'django': django.get_version(),
+            'endpoints': results,
+        }
+        self.print_table(results)
+        if options['output'] == '-':
+            self.stdout.write(json.dumps(report, indent=2))
+        else:
+            with open(options['output'], 'w') as output:
+                json.dump(report, output, indent=2)
+            self.stderr.write(f"Report written to {options['output']}")
+
+    def obtain_tokens(self, client, users, password):
+        """Log every user in once, so the other endpoints skip that cost."""
+        tokens = {}
+        for username in users:
+            status, _, content = client.request(
+                'POST', '/api/token/', {'username': username, 'password': password}
+            )
+            if status != 200:
+                raise CommandError(
+                    f"Could not log in as {username} (status {status}). Create the users "
+                    f"with seed_activities using the same --prefix and --password."
+                )
+            tokens[username] = json.loads(content)['access']
+        return tokens
+
+    def build_request(self, name, index, users, tokens):
+        method, path, authenticated = SCENARIOS[name]
+        username = users[index % len(users)]
+        body = None
+        if name == 'token-obtain':
+            body = {'username': username, 'password': self.password}
+        elif name == 'create':
+            body = {
+                'activity_type': 'running',
+                'duration': 20 + index % 40,
+                'distance': 5.0,
+                'date': timezone.now().date().isoformat(),
+            }
+        return method, path, body, tokens[username] if authenticated else None
+
+    def run(self, client, name, users, tokens, count, concurrency):
+        """Send ``count`` requests to one endpoint and summarize them."""
+        def send(index):
+            method, path, body, token = self.build_request(name, index, users, tokens)
+            return client.request(method, path, body, token)[:2]
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            outcomes = list(executor.map(send, range(count)))
+        elapsed = time.perf_counter() - started
+
+        statuses = Counter(str(status) if status else 'error' for status, _ in outcomes)
+        latencies = sorted(latency * 1000 for status, latency in outcomes if status and status < 400)
+        return {
+            'requests': count,
+            'errors': count - len(latencies),
+            'status_codes': dict(statuses),
+            'duration_s': round(elapsed, 3),
+            'throughput_rps': round(len(latencies) / elapsed, 2) if elapsed else None,
+            'latency_ms': {
+                'min': round(latencies[0], 2) if latencies else None,
+                'mean': round(sum(latencies) / len(latencies), 2) if latencies else None,
+                **{
+                    f'p{percent}': round(percentile(latencies, percent), 2) if latencies else None
+                    for percent in PERCENTILES
+                },
+                'max': round(latencies[-1], 2) if latencies else None,
+            },
+        }
+
+    def print_table(self, results):
+        columns = ['rps', 'p50', 'p95', 'p99', 'errors']
+        self.stderr.write(f"{'endpoint':<14}" + ''.join(f'{column:>10}' for column in columns))
+        for name, result in results.items():
+            latency = result['latency_ms']
+            values = [result['throughput_rps'], latency['p50'], latency['p95'], latency['p99'], result['errors']]
+            self.stderr.write(f'{name:<14}' + ''.join(f"{'-' if value is None else value:>10}" for value in values))
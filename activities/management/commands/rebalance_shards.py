@@ -0,0 +1,172 @@
+from collections import Counter
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS, transaction
+from django.db.models import Count
+from django.db.models.deletion import Collector
+
+from activities.cache import bump_data_version
+from activities.db import copy_rows, delete_rows, is_sharded, move_user_to_shard, scatter
+from activities.models import Activity, ActivityDailyRollup, ActivityStats, ArchivedActivity, UserShard
+
+
+class Command(BaseCommand):
+    help = (
+        'Move users, with their activities and rollups, between shards until '
+        'every shard holds about as many activities. Activities found on a '
+        'shard their user is no longer on, e.g. written by a worker that had '
+        'not yet seen a move, are moved first. Run it again to pick those up.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--tolerance', type=float, default=0.05,
+            help='Stop once no shard is more than this fraction above the mean (default: 0.05).',
+        )
+        parser.add_argument(
+            '--max-moves', type=int, default=None,
+            help='Move at most this many users to balance the shards (default: no limit).',
+        )
+        parser.add_argument(
+            '--user', type=int, default=None,
+            help='Only move this user, to the shard given by --to.',
+        )
+        parser.add_argument(
+            '--to', default=None,
+            help='Shard alias to move --user to, e.g. shard_1 or default.',
+        )
+        parser.add_argument(
+            '--batch-size', type=int, default=1000,
+            help='Number of activities copied per statement (default: 1000).',
+        )
+        parser.add_argument(
+            '--dry-run', action='store_true',
+            help='Print the moves without making them.',
+        )
+
+    def handle(self, *args, **options):
+        if not is_sharded():
+            raise CommandError('No shards are configured. Set DATABASE_SHARD_URLS.')
+        if (options['user'] is None) != (options['to'] is None):
+            raise CommandError('--user and --to must be given together.')
+        if options['to'] is not None and options['to'] not in settings.DATABASE_SHARDS:
+            raise CommandError(f"Unknown shard '{options['to']}'. Shards: {', '.join(settings.DATABASE_SHARDS)}.")
+
+        # shard -> {user id: activities on that shard}
+        counts = scatter(lambda alias: dict(
+            Activity.objects.using(alias).order_by().values_list('user_id').annotate(count=Count('id'))
+        ))
+        homes = dict(UserShard.objects.using(DEFAULT_DB_ALIAS).values_list('user_id', 'database'))
+
+        if options['user'] is not None:
+            moves = self.plan_user_move(options['user'], options['to'], counts, homes)
+        else:
+            moves = self.plan_sweep(counts, homes) + self.plan_balance(counts, homes, options)
+
+        users = User.objects.in_bulk({user_id for user_id, _, _ in moves})
+        moved = 0
+        for user_id, source, target in moves:
+            if user_id not in users:
+                self.stdout.write(f"Skipping activities of deleted user {user_id} on {source}.")
+                continue
+            if options['dry_run']:
+                self.stdout.write(f"Would move user {user_id} from {source} to {target}.")
+                continue
+            copied = self.move(users[user_id], source, target, options['batch_size'])
+            moved += copied
+            self.stdout.write(f"Moved user {user_id} from {source} to {target} ({copied} activities).")
+
+        if not options['dry_run']:
+            loads = scatter(lambda alias: Activity.objects.using(alias).count())
+            summary = ', '.join(f'{alias} {count}' for alias, count in loads.items())
+            self.stdout.write(self.style.SUCCESS(f"Moved {moved} activities. Activities per shard: {summary}."))
+
+    def plan_user_move(self, user_id, target, counts, homes):
+        """Move every activity of one user, and the user's directory entry, to ``target``."""
+        moves = [(user_id, alias, target) for alias in settings.DATABASE_SHARDS
+                 if alias != target and user_id in counts[alias]]
+        if not moves and homes.get(user_id, DEFAULT_DB_ALIAS) != target:
+            # No activities yet, only the directory changes
+            moves = [(user_id, homes.get(user_id, DEFAULT_DB_ALIAS), target)]
+        return moves
+
+    def plan_sweep(self, counts, homes):
+        """Move activities that are not on their user's shard back to it."""
+        moves = []
+        for alias, users in counts.items():
+            for user_id in users:
+                home = homes.get(user_id, DEFAULT_DB_ALIAS)
+                if home != alias:
+                    moves.append((user_id, alias, home))
+        return moves
+
+    def plan_balance(self, counts, homes, options):
+        """
+        Repeatedly move the user of the most loaded shard whose activities
+        bring it and the least loaded shard closest to each other.
+        """
+        shards = settings.DATABASE_SHARDS
+        # Where the activities will be once swept
+        by_shard = {alias: Counter() for alias in shards}
+        for users in counts.values():
+            for user_id, count in users.items():
+                by_shard[homes.get(user_id, DEFAULT_DB_ALIAS)][user_id] += count
+        loads = {alias: sum(users.values()) for alias, users in by_shard.items()}
+        mean = sum(loads.values()) / len(shards)
+
+        moves = []
+        while options['max_moves'] is None or len(moves) < options['max_moves']:
+            heaviest = max(shards, key=loads.get)
+            lightest = min(shards, key=loads.get)
+            gap = loads[heaviest] - loads[lightest]
+            if loads[heaviest] - mean <= options['tolerance'] * mean:
+                break
+            candidates = [
+                (abs(gap - 2 * count), user_id)
+                for user_id, count in by_shard[heaviest].items()
+                if count < gap
+            ]
+            if not candidates:
+                break
+            _, user_id = min(candidates)
+            count = by_shard[heaviest].pop(user_id)
+            by_shard[lightest][user_id] = count
+            loads[heaviest] -= count
+            loads[lightest] += count
+            moves.append((user_id, heaviest, lightest))
+        return moves
+
+    def move(self, user, source, target, batch_size):
+        """
+        Copy the user's activities on ``source``, archived ones included,
+        to ``target`` with their ids and timestamps, point the directory at
+        ``target`` and delete the copied rows from ``source``. On
+        PostgreSQL the rows stay locked until then; rows written to
+        ``source`` meanwhile are left for the next run. Returns the number
+        of activities moved, not counting archived ones.
+        """
+        with transaction.atomic(using=source):
+            activities = list(Activity.objects.using(source).select_for_update().filter(user_id=user.pk))
+            archived = list(ArchivedActivity.objects.using(source).select_for_update().filter(user_id=user.pk))
+            with transaction.atomic(using=target):
+                for model, rows in ((Activity, activities), (ArchivedActivity, archived)):
+                    # Ids are unique across shards, so a row already on
+                    # target is a copy left by an interrupted move
+                    present = set(model.objects.using(target).filter(user_id=user.pk).values_list('pk', flat=True))
+                    copy_rows(model, [row for row in rows if row.pk not in present], target, batch_size)
+                ActivityDailyRollup.objects.db_manager(target).rebuild(user_ids=[user.pk])
+                ActivityStats.objects.db_manager(target).rebuild(user_ids=[user.pk])
+            move_user_to_shard(user.pk, target)
+
+            # The user as origin skips the per-activity rollup updates, as in
+            # a cascade; the rollups and stats left on source are rebuilt instead
+            collector = Collector(using=source, origin=user)
+            collector.collect(activities)
+            collector.delete()
+            delete_rows(ArchivedActivity, [row.pk for row in archived], source, batch_size)
+            ActivityDailyRollup.objects.db_manager(source).rebuild(user_ids=[user.pk])
+            ActivityStats.objects.db_manager(source).rebuild(user_ids=[user.pk])
+        bump_data_version(user.pk)
+        return len(activities)
@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand
+
+from activities.models import LeaderboardEntry
+
+
+class Command(BaseCommand):
+    help = (
+        'Rebuild the weekly and monthly leaderboards from the activities on '
+        'every shard, archived ones included. Run it while no activities are '
+        'being written, e.g. to recover from updates lost in a crash.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size', type=int, default=1000,
+            help='Number of users whose activities are read at a time (default: 1000).',
+        )
+
+    def handle(self, *args, **options):
+        written = LeaderboardEntry.objects.rebuild(batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt {written} leaderboard entries."))
@@ -0,0 +1,41 @@
+from django.core.management.base import BaseCommand
+
+from activities.db import scatter
+from activities.models import ActivityDailyRollup, ActivityStats
+
+
+class Command(BaseCommand):
+    help = (
+        'Rebuild the per-user daily activity rollups, streaks and personal records '
+        'from the activities, archived ones included.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--user', type=int, action='append', dest='user_ids',
+            help='Only rebuild rollups and stats for this user id (can be repeated).',
+        )
+        parser.add_argument(
+            '--batch-size', type=int, default=1000,
+            help='Number of rows inserted per statement (default: 1000).',
+        )
+
+    def handle(self, *args, **options):
+        # Each shard rebuilds the rollups of the activities it holds, and
+        # then the stats, whose streaks are read from the rollups
+        def rebuild(alias):
+            rollups = ActivityDailyRollup.objects.db_manager(alias).rebuild(
+                user_ids=options['user_ids'],
+                batch_size=options['batch_size'],
+            )
+            stats = ActivityStats.objects.db_manager(alias).rebuild(
+                user_ids=options['user_ids'],
+                batch_size=options['batch_size'],
+            )
+            return rollups, stats
+
+        written = scatter(rebuild).values()
+        self.stdout.write(self.style.SUCCESS(
+            f"Rebuilt {sum(rollups for rollups, _ in written)} daily rollup rows "
+            f"and the stats of {sum(stats for _, stats in written)} users."
+        ))
@@ -0,0 +1,166 @@
+import math
+import random
+import time
+from datetime import timedelta
+
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils import timezone
+
+from activities.db import assign_shards, scatter
+from activities.models import Activity, ActivityDailyRollup, ActivityStats, LeaderboardEntry
+
+
+# activity_type -> (relative frequency, mean and standard deviation of the
+# duration in minutes, speed in km/h or None when no distance is covered,
+# calories burned per minute)
+TYPE_PROFILES = {
+    'running': (30, 40, 15, 10.0, 11),
+    'walking': (22, 45, 20, 5.0, 4),
+    'cycling': (15, 60, 25, 20.0, 8),
+    'gym': (12, 55, 15, None, 7),
+    'yoga': (8, 45, 15, None, 3),
+    'swimming': (6, 35, 12, 2.5, 9),
+    'hiking': (4, 150, 60, 4.0, 6),
+    'other': (3, 40, 20, None, 5),
+}
+# Share of activities that record a distance (when one is covered) and calories
+DISTANCE_RATE = 0.85
+CALORIES_RATE = 0.6
+NOTES = ['Felt great', 'Easy pace', 'Intervals', 'With friends', 'Tired legs', 'New route']
+
+
+class Command(BaseCommand):
+    help = (
+        'Generate users with realistic activity histories using bulk inserts, '
+        'to reproduce production scale locally. The daily rollups and stats are '
+        'rebuilt and the leaderboards updated for the new users. Every user gets the '
+        'same password.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--users', type=int, default=100,
+            help='Number of users to create (default: 100).',
+        )
+        parser.add_argument(
+            '--activities', type=int, default=150,
+            help=(
+                'Median number of activities per user (default: 150). Counts '
+                'follow a log-normal distribution, so a few users have many more.'
+            ),
+        )
+        parser.add_argument(
+            '--years', type=float, default=3,
+            help='How far back the oldest activities go, in years (default: 3).',
+        )
+        parser.add_argument(
+            '--prefix', default='loadtest',
+            help="Username prefix; users are named '<prefix>-<n>' (default: loadtest).",
+        )
+        parser.add_argument(
+            '--password', default='loadtest-Password-1',
+            help='Password of every generated user (default: loadtest-Password-1).',
+        )
+        parser.add_argument(
+            '--clear', action='store_true',
+            help='Delete the users with the same prefix, and their activities, first.',
+        )
+        parser.add_argument(
+            '--seed', type=int, default=0,
+            help='Random seed, so that a data set can be reproduced (default: 0).',
+        )
+        parser.add_argument(
+            '--batch-size', type=int, default=100,
+            help='Number of users generated per transaction (default: 100).',
+        )
+
+    def handle(self, *args, **options):
+        prefix = options['prefix']
+        existing = User.objects.filter(username__startswith=f'{prefix}-')
+        if options['clear']:
+            deleted, _ = existing.delete()
+            self.stdout.write(f"Deleted {deleted} rows of previously generated data.")
+        elif existing.exists():
+            raise CommandError(f"Users named '{prefix}-<n>' already exist. Use --clear or another --prefix.")
+
+        rng = random.Random(options['seed'])
+        # Hashing is deliberately slow, so hash the shared password only once
+        password = make_password(options['password'])
+        started = time.perf_counter()
+        users = activities = rollups = 0
+        for first in range(0, options['users'], options['batch_size']):
+            count = min(options['batch_size'], options['users'] - first)
+            with transaction.atomic():
+                user_ids = self.create_users(prefix, first, count, password)
+                activities += self.create_activities(rng, user_ids, options)
+                rollups += sum(scatter(
+                    lambda alias: ActivityDailyRollup.objects.db_manager(alias).rebuild(user_ids=user_ids)
+                ).values())
+                scatter(lambda alias: ActivityStats.objects.db_manager(alias).rebuild(user_ids=user_ids))
+            users += count
+            self.stdout.write(f"{users}/{options['users']} users, {activities} activities")
+
+        elapsed = time.perf_counter() - started
+        self.stdout.write(self.style.SUCCESS(
+            f"Created {users} users, {activities} activities and {rollups} daily "
+            f"rollup rows in {elapsed:.1f}s."
+        ))
+
+    def create_users(self, prefix, first, count, password):
+        """Insert ``count`` users and return their ids."""
+        usernames = [f'{prefix}-{index}' for index in range(first, first + count)]
+        User.objects.bulk_create([
+            User(username=username, email=f'{username}@example.com', password=password)
+            for username in usernames
+        ])
+        user_ids = list(User.objects.filter(username__in=usernames).values_list('id', flat=True))
+        # bulk_create sends no post_save, so put the users on shards here
+        assign_shards(user_ids)
+        return user_ids
+
+    def create_activities(self, rng, user_ids, options):
+        """Insert a random history for every user and return how many rows."""
+        today = timezone.now().date()
+        types = list(TYPE_PROFILES)
+        weights = [TYPE_PROFILES[activity_type][0] for activity_type in types]
+        batch = []
+        created = 0
+        for user_id in user_ids:
+            # Users joined at different times and log at different rates
+            span = max(1, int(rng.uniform(0.1, 1) * options['years'] * 365))
+            count = max(1, int(rng.lognormvariate(math.log(max(options['activities'], 1)), 0.6)))
+            for _ in range(count):
+                activity_type = rng.choices(types, weights)[0]
+                batch.append(self.make_activity(rng, user_id, activity_type, today, span))
+            if len(batch) >= 5000:
+                Activity.objects.bulk_create(batch, batch_size=1000)
+                LeaderboardEntry.objects.add_activities(batch)
+                created += len(batch)
+                batch = []
+        Activity.objects.bulk_create(batch, batch_size=1000)
+        LeaderboardEntry.objects.add_activities(batch)
+        return created + len(batch)
+
+    def make_activity(self, rng, user_id, activity_type, today, span):
+        _, mean, deviation, speed, calories_per_minute = TYPE_PROFILES[activity_type]
+        duration = min(1440, max(5, round(rng.gauss(mean, deviation))))
+        distance = None
+        if speed is not None and rng.random() < DISTANCE_RATE:
+            distance = round(duration / 60 * speed * rng.uniform(0.7, 1.3), 2)
+        calories = None
+        if rng.random() < CALORIES_RATE:
+            calories = round(duration * calories_per_minute * rng.uniform(0.8, 1.2))
+        # Recent days are a little busier than old ones
+        days_ago = int(span * rng.random() ** 1.3)
+        return Activity(
+            user_id=user_id,
+            activity_type=activity_type,
+            duration=duration,
+            distance=distance,
+            calories_burned=calories,
+            notes=rng.choice(NOTES) if rng.random() < 0.2 else '',
+            date=today - timedelta(days=days_ago),
+        )
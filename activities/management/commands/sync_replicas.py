@@ -0,0 +1,51 @@
+import sqlite3
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+
+
+class Command(BaseCommand):
+    help = (
+        'Copy the primary SQLite database over the SQLite files configured '
+        'as replicas, to try read replica routing locally. Real replicas are '
+        'kept up to date by the database server instead.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--interval', type=float, default=None,
+            help='Keep copying every INTERVAL seconds, which simulates replication lag.',
+        )
+
+    def handle(self, *args, **options):
+        primary = connections.settings['default']
+        if not settings.DATABASE_REPLICAS:
+            raise CommandError('No replicas are configured. Set DATABASE_REPLICA_URLS.')
+        aliases = ['default'] + settings.DATABASE_REPLICAS
+        engines = {connections.settings[alias]['ENGINE'] for alias in aliases}
+        if engines != {'django.db.backends.sqlite3'}:
+            raise CommandError('Only SQLite primaries and replicas can be synced.')
+
+        while True:
+            started = time.perf_counter()
+            source = sqlite3.connect(primary['NAME'])
+            try:
+                for alias in settings.DATABASE_REPLICAS:
+                    target = sqlite3.connect(connections.settings[alias]['NAME'])
+                    try:
+                        # The backup API copies a consistent snapshot while
+                        # the primary is being written to
+                        source.backup(target)
+                    finally:
+                        target.close()
+            finally:
+                source.close()
+            self.stdout.write(
+                f"Copied {primary['NAME']} to {len(settings.DATABASE_REPLICAS)} "
+                f"replica(s) in {(time.perf_counter() - started) * 1000:.0f} ms."
+            )
+            if options['interval'] is None:
+                break
+            time.sleep(options['interval'])
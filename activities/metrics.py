@@ -0,0 +1,232 @@
+import atexit
+import json
+import logging
+import math
+import os
+import sqlite3
+import threading
+import time
+from bisect import bisect_left
+from collections import defaultdict
+
+from django.conf import settings
+
+
+logger = logging.getLogger('activities.metrics')
+
+# Upper bounds of the latency histogram buckets, in seconds
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, math.inf)
+# Methods outside this set are counted as 'other', so that clients cannot
+# create any number of label values
+METHODS = {'GET', 'HEAD', 'POST', 'PUT', 'PATCH', 'DELETE', 'OPTIONS'}
+
+# name -> (type, help, label names)
+METRICS = {
+    'http_requests_total': (
+        'counter', 'Requests handled, by view, method and status code.',
+        ('view', 'method', 'status'),
+    ),
+    'http_request_errors_total': (
+        'counter', 'Requests that failed with a server error (5xx), by view and method.',
+        ('view', 'method'),
+    ),
+    'http_request_duration_seconds': (
+        'histogram', 'Time taken to handle requests, by view and method.',
+        ('view', 'method'),
+    ),
+    'db_queries_total': (
+        'counter', 'Database queries run by requests, by view.',
+        ('view',),
+    ),
+    'db_query_duration_seconds_total': (
+        'counter', 'Time spent in database queries by requests, by view.',
+        ('view',),
+    ),
+    'cache_requests_total': (
+        'counter', 'Statistics cache lookups, by endpoint and result (hit or miss).',
+        ('endpoint', 'result'),
+    ),
+}
+
+_lock = threading.Lock()
+# (sample name, labels) -> increment not yet written to the store
+_pending = defaultdict(float)
+# Process whose flusher thread is running; worker processes forked from
+# the one that started it need their own
+_flusher_pid = None
+
+_SCHEMA = """
+    CREATE TABLE IF NOT EXISTS samples (
+        name TEXT NOT NULL,
+        labels TEXT NOT NULL,
+        value REAL NOT NULL,
+        PRIMARY KEY (name, labels)
+    )
+"""
+_UPSERT = """
+    INSERT INTO samples (name, labels, value) VALUES (?, ?, ?)
+    ON CONFLICT (name, labels) DO UPDATE SET value = value + excluded.value
+"""
+
+
+def enabled():
+    return settings.METRICS_ENABLED
+
+
+def _labels(metric, values, **extra):
+    labels = dict(zip(METRICS[metric][2], values), **extra)
+    return json.dumps(labels, separators=(',', ':'))
+
+
+def increment(metric, *labels, amount=1):
+    """Add ``amount`` to a counter. ``labels`` are given in METRICS order."""
+    _start_flusher()
+    with _lock:
+        _pending[(metric, _labels(metric, labels))] += amount
+
+
+def observe(metric, value, *labels):
+    """Record ``value`` in a histogram."""
+    _start_flusher()
+    first = bisect_left(LATENCY_BUCKETS, value)
+    with _lock:
+        for index, bound in enumerate(LATENCY_BUCKETS):
+            # Every bucket is written, so that each series has all of them
+            le = '+Inf' if bound == math.inf else repr(bound)
+            _pending[(f'{metric}_bucket', _labels(metric, labels, le=le))] += 1 if index >= first else 0
+        key = _labels(metric, labels)
+        _pending[(f'{metric}_sum', key)] += value
+        _pending[(f'{metric}_count', key)] += 1
+
+
+def record_request(view, method, status, duration, queries, db_time):
+    """Record one handled request."""
+    method = method if method in METHODS else 'other'
+    increment('http_requests_total', view, method, str(status))
+    if status >= 500:
+        increment('http_request_errors_total', view, method)
+    observe('http_request_duration_seconds', duration, view, method)
+    increment('db_queries_total', view, amount=queries)
+    increment('db_query_duration_seconds_total', view, amount=db_time)
+
+
+def record_cache(endpoint, result):
+    """Record a statistics cache lookup, ``result`` being 'hit' or 'miss'."""
+    if enabled():
+        increment('cache_requests_total', endpoint, result)
+
+
+def _connect():
+    connection = sqlite3.connect(settings.METRICS_STORE, timeout=10)
+    connection.execute('PRAGMA journal_mode=WAL')
+    connection.execute(_SCHEMA)
+    return connection
+
+
+def flush():
+    """
+    Add this process's pending increments to the store shared by all
+    worker processes. Increments are kept for the next flush if the store
+    cannot be written.
+    """
+    with _lock:
+        pending = dict(_pending)
+        _pending.clear()
+    if not pending:
+        return
+    try:
+        connection = _connect()
+        try:
+            with connection:
+                connection.executemany(
+                    _UPSERT, [(name, labels, value) for (name, labels), value in pending.items()]
+                )
+        finally:
+            connection.close()
+    except sqlite3.Error:
+        with _lock:
+            for key, value in pending.items():
+                _pending[key] += value
+        raise
+
+
+def _flush_quietly():
+    try:
+        flush()
+    except sqlite3.Error:
+        logger.exception('Could not write metrics to %s', settings.METRICS_STORE)
+
+
+def _flush_periodically():
+    while True:
+        time.sleep(settings.METRICS_FLUSH_INTERVAL)
+        _flush_quietly()
+
+
+def _start_flusher():
+    """Flush in a background thread, so requests never wait on the store."""
+    global _flusher_pid
+    if _flusher_pid == os.getpid():
+        return
+    with _lock:
+        if _flusher_pid == os.getpid():
+            return
+        _flusher_pid = os.getpid()
+    threading.Thread(target=_flush_periodically, name='metrics-flusher', daemon=True).start()
+
+
+def _flush_at_exit():
+    if _flusher_pid == os.getpid():
+        _flush_quietly()
+
+
+atexit.register(_flush_at_exit)
+
+
+def _escape(value):
+    return value.replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _format_value(value):
+    if value == int(value):
+        return str(int(value))
+    return repr(value)
+
+
+def render():
+    """
+    Return every metric, summed over all worker processes, in the
+    Prometheus text exposition format.
+    """
+    flush()
+    connection = _connect()
+    try:
+        rows = connection.execute('SELECT name, labels, value FROM samples').fetchall()
+    finally:
+        connection.close()
+
+    families = defaultdict(list)
+    for name, labels, value in rows:
+        family = name
+        for suffix in ('_bucket', '_sum', '_count'):
+            if name.endswith(suffix) and METRICS.get(name[:-len(suffix)], ('',))[0] == 'histogram':
+                family = name[:-len(suffix)]
+        if family in METRICS:
+            families[family].append((name, json.loads(labels), value))
+
+    lines = []
+    for family, (kind, help_text, _) in METRICS.items():
+        lines.append(f'# HELP {family} {help_text}')
+        lines.append(f'# TYPE {family} {kind}')
+        for name, labels, value in sorted(families[family], key=_sort_key):
+            label_text = ','.join(f'{key}="{_escape(label)}"' for key, label in labels.items())
+            lines.append(f'{name}{{{label_text}}} {_format_value(value)}')
+    return '\n'.join(lines) + '\n'
+
+
+def _sort_key(sample):
+    # Buckets in increasing order, followed by the sum and the count
+    name, labels, _ = sample
+    series = sorted((key, value) for key, value in labels.items() if key != 'le')
+    le = float(labels.get('le', 'inf'))
+    return series, not name.endswith('_bucket'), name, le
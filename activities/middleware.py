@@ -0,0 +1,250 @@
+import json
+import logging
+import random
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.core.signals import request_started
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.utils.functional import SimpleLazyObject, empty
+
+from . import metrics
+
+
+logger = logging.getLogger('activities.profiling')
+
+# Query counters of the request being handled. Context variables follow the
+# request into the threads that sync_to_async runs queries in.
+_query_counters = ContextVar('query_counters', default=())
+
+
+class QueryCounter:
+    """Number of queries run and their total time in seconds."""
+
+    def __init__(self):
+        self.queries = 0
+        self.db_time = 0.0
+
+
+class RequestProfile(QueryCounter):
+    """Timings collected for one request, in seconds."""
+
+    def __init__(self, sampled):
+        super().__init__()
+        self.sampled = sampled
+        self.started = time.perf_counter()
+        self.view_started = None
+        self.view_ended = None
+
+    def timings(self, ended):
+        """Return ``(db, view, render, total)`` in milliseconds."""
+        total = ended - self.started
+        view = render = 0.0
+        if self.view_started is not None:
+            view_ended = self.view_ended if self.view_ended is not None else ended
+            view = view_ended - self.view_started
+            render = ended - view_ended
+        return tuple(round(value * 1000, 2) for value in (self.db_time, view, render, total))
+
+
+def _record_query(execute, sql, params, many, context):
+    counters = _query_counters.get()
+    if not counters:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        elapsed = time.perf_counter() - started
+        for counter in counters:
+            counter.queries += 1
+            counter.db_time += elapsed
+
+
+def _install_query_recorder(connection, **kwargs):
+    # Wrappers live on the connection object, which outlives reconnections
+    if _record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(_record_query)
+
+
+def _install_query_recorders(**kwargs):
+    # Connections are per thread. request_started is sent from the thread
+    # that runs the request's queries, under WSGI and ASGI alike.
+    for connection in connections.all(initialized_only=True):
+        _install_query_recorder(connection)
+
+
+def install_query_recorder():
+    """Count the queries of every connection in the active QueryCounters."""
+    connection_created.connect(_install_query_recorder, dispatch_uid='activities.query_recorder')
+    request_started.connect(_install_query_recorders, dispatch_uid='activities.query_recorder')
+
+
+@contextmanager
+def count_queries(counter):
+    """Add the queries run in this context to ``counter``."""
+    token = _query_counters.set(_query_counters.get() + (counter,))
+    try:
+        yield counter
+    finally:
+        _query_counters.reset(token)
+
+
+class RequestProfilingMiddleware:
+    """
+    Measure the number of queries, the database time, the view time and the
+    render time of a request. They are added to the response as a
+    Server-Timing header and logged as one JSON line to the
+    ``activities.profiling`` logger.
+
+    Every request is profiled when REQUEST_PROFILING is set, otherwise a
+    REQUEST_PROFILING_SAMPLE_RATE fraction of them. With neither the
+    middleware removes itself at startup, so it costs nothing.
+
+    The view time runs from the view being called until it returns, and the
+    render time from then until the response is rendered. Streamed bodies
+    are produced after the response leaves the middleware and are not
+    included.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.always = settings.REQUEST_PROFILING
+        self.sample_rate = settings.REQUEST_PROFILING_SAMPLE_RATE
+        if not self.always and self.sample_rate <= 0:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        install_query_recorder()
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+            # Hooks must be coroutines too, or Django runs them in a thread
+            self.process_view = self.aprocess_view
+            self.process_template_response = self.aprocess_template_response
+
+    def start(self):
+        """Return a new profile if this request is to be profiled."""
+        if self.always:
+            return RequestProfile(sampled=False)
+        if random.random() < self.sample_rate:
+            return RequestProfile(sampled=True)
+        return None
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        profile = self.start()
+        if profile is None:
+            return self.get_response(request)
+        request._profile = profile
+        with count_queries(profile):
+            response = self.get_response(request)
+        return self.finish(request, response, profile)
+
+    async def __acall__(self, request):
+        profile = self.start()
+        if profile is None:
+            return await self.get_response(request)
+        request._profile = profile
+        with count_queries(profile):
+            response = await self.get_response(request)
+        return self.finish(request, response, profile)
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        profile = getattr(request, '_profile', None)
+        if profile is not None:
+            profile.view_started = time.perf_counter()
+
+    def process_template_response(self, request, response):
+        # Called once the view has returned and before the response is rendered
+        profile = getattr(request, '_profile', None)
+        if profile is not None:
+            profile.view_ended = time.perf_counter()
+        return response
+
+    async def aprocess_view(self, request, view_func, view_args, view_kwargs):
+        return self.process_view(request, view_func, view_args, view_kwargs)
+
+    async def aprocess_template_response(self, request, response):
+        return self.process_template_response(request, response)
+
+    def finish(self, request, response, profile):
+        db, view, render, total = profile.timings(time.perf_counter())
+        timing = (
+            f'db;dur={db};desc="{profile.queries} queries", '
+            f'view;dur={view}, render;dur={render}, total;dur={total}'
+        )
+        if response.has_header('Server-Timing'):
+            timing = f"{response['Server-Timing']}, {timing}"
+        response['Server-Timing'] = timing
+
+        logger.info(json.dumps({
+            'method': request.method,
+            'path': request.path,
+            'status': response.status_code,
+            'user_id': self.user_id(request),
+            'queries': profile.queries,
+            'db_ms': db,
+            'view_ms': view,
+            'render_ms': render,
+            'total_ms': total,
+            'sampled': profile.sampled,
+        }, separators=(',', ':')))
+        return response
+
+    def user_id(self, request):
+        user = getattr(request, 'user', None)
+        # Never load a session user just for the log line
+        if user is None or (isinstance(user, SimpleLazyObject) and user._wrapped is empty):
+            return None
+        return user.pk if user.is_authenticated else None
+
+
+class MetricsMiddleware:
+    """
+    Record the count, the latency, the server errors and the database
+    queries of every request in ``activities.metrics``, labelled with the
+    URL name of the view, such as ``activity-summary``.
+
+    Each process keeps its increments in memory and a background thread adds
+    them to the shared store every METRICS_FLUSH_INTERVAL seconds. The
+    middleware removes itself at startup unless METRICS_ENABLED is set.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not settings.METRICS_ENABLED:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        install_query_recorder()
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        started = time.perf_counter()
+        with count_queries(QueryCounter()) as counter:
+            response = self.get_response(request)
+        self.record(request, response, time.perf_counter() - started, counter)
+        return response
+
+    async def __acall__(self, request):
+        started = time.perf_counter()
+        with count_queries(QueryCounter()) as counter:
+            response = await self.get_response(request)
+        self.record(request, response, time.perf_counter() - started, counter)
+        return response
+
+    def record(self, request, response, duration, counter):
+        match = request.resolver_match
+        view = match.view_name if match is not None else 'unmatched'
+        metrics.record_request(
+            view, request.method, response.status_code, duration, counter.queries, counter.db_time
+        )
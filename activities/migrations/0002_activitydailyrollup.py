@@ -0,0 +1,62 @@
+# Generated by Django 4.2.7 on 2026-10-17 03:49
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def populate_rollups(apps, schema_editor):
+    Activity = apps.get_model('activities', 'Activity')
+    ActivityDailyRollup = apps.get_model('activities', 'ActivityDailyRollup')
+    rows = (
+        Activity.objects.order_by()
+        .values('user_id', 'date', 'activity_type')
+        .annotate(
+            activity_count=models.Count('id'),
+            total_duration=models.Sum('duration'),
+            total_distance=models.Sum('distance'),
+            distance_count=models.Count('distance'),
+            total_calories=models.Sum('calories_burned'),
+            calories_count=models.Count('calories_burned'),
+        )
+    )
+    batch = []
+    for row in rows.iterator():
+        row['total_distance'] = row['total_distance'] or 0
+        row['total_calories'] = row['total_calories'] or 0
+        batch.append(ActivityDailyRollup(**row))
+        if len(batch) >= 1000:
+            ActivityDailyRollup.objects.bulk_create(batch)
+            batch = []
+    ActivityDailyRollup.objects.bulk_create(batch)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('activities', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ActivityDailyRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('activity_type', models.CharField(choices=[('running', 'Running'), ('cycling', 'Cycling'), ('swimming', 'Swimming'), ('walking', 'Walking'), ('gym', 'Gym'), ('yoga', 'Yoga'), ('hiking', 'Hiking'), ('other', 'Other')], max_length=20)),
+                ('activity_count', models.IntegerField(default=0)),
+                ('total_duration', models.IntegerField(default=0, help_text='Duration in minutes')),
+                ('total_distance', models.FloatField(default=0, help_text='Distance in kilometers')),
+                ('distance_count', models.IntegerField(default=0, help_text='Activities with a distance')),
+                ('total_calories', models.IntegerField(default=0)),
+                ('calories_count', models.IntegerField(default=0, help_text='Activities with calories burned')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='daily_rollups', to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='activitydailyrollup',
+            constraint=models.UniqueConstraint(fields=('user', 'date', 'activity_type'), name='unique_daily_rollup'),
+        ),
+        migrations.RunPython(populate_rollups, migrations.RunPython.noop),
+    ]
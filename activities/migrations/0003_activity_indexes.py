@@ -0,0 +1,41 @@
+# Generated by Django 4.2.7 on 2026-10-17 03:51
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('activities', '0002_activitydailyrollup'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='activity',
+            index=models.Index(fields=['user', '-date', '-created_at'], name='activity_user_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='activity',
+            index=models.Index(fields=['user', 'activity_type', '-date', '-created_at'], name='activity_user_type_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='activity',
+            index=models.Index(fields=['user', 'duration'], name='activity_user_duration_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='activity',
+            index=models.Index(fields=['user', 'activity_type', 'duration'], name='activity_user_type_dur_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='activity',
+            index=models.Index(fields=['user', 'calories_burned'], name='activity_user_calories_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='activity',
+            index=models.Index(fields=['user', 'activity_type', 'calories_burned'], name='activity_user_type_cal_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='activity',
+            index=models.Index(fields=['user', 'created_at'], name='activity_user_created_idx'),
+        ),
+    ]
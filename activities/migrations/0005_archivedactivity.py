@@ -0,0 +1,36 @@
+# Generated by Django 4.2.7 on 2026-10-17 05:01
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('activities', '0004_sharding'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ArchivedActivity',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('activity_type', models.CharField(choices=[('running', 'Running'), ('cycling', 'Cycling'), ('swimming', 'Swimming'), ('walking', 'Walking'), ('gym', 'Gym'), ('yoga', 'Yoga'), ('hiking', 'Hiking'), ('other', 'Other')], max_length=20)),
+                ('duration', models.IntegerField(help_text='Duration in minutes')),
+                ('distance', models.FloatField(blank=True, help_text='Distance in kilometers', null=True)),
+                ('calories_burned', models.IntegerField(blank=True, null=True)),
+                ('notes', models.TextField(blank=True)),
+                ('date', models.DateField()),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('user', models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.CASCADE, related_name='archived_activities', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name_plural': 'Archived activities',
+                'ordering': ['-date', '-created_at'],
+                'indexes': [models.Index(fields=['user', '-date', '-created_at'], name='archived_user_date_idx'), models.Index(fields=['user', 'activity_type', '-date', '-created_at'], name='archived_user_type_date_idx'), models.Index(fields=['user', 'duration'], name='archived_user_duration_idx'), models.Index(fields=['user', 'activity_type', 'duration'], name='archived_user_type_dur_idx'), models.Index(fields=['user', 'calories_burned'], name='archived_user_calories_idx'), models.Index(fields=['user', 'activity_type', 'calories_burned'], name='archived_user_type_cal_idx'), models.Index(fields=['user', 'created_at'], name='archived_user_created_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,144 @@
+# Generated by Django 4.2.7 on 2026-10-17 05:13
+
+from collections import defaultdict
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections, migrations, models
+import django.db.models.deletion
+
+
+# Period -> first day of the period holding a date
+PERIODS = {
+    'weekly': lambda day: day - timedelta(days=day.weekday()),
+    'monthly': lambda day: day.replace(day=1),
+}
+# Metric -> LeaderboardEntry field holding it
+METRICS = {
+    'duration': 'total_duration',
+    'distance': 'total_distance',
+    'calories': 'total_calories',
+}
+
+
+def populate_leaderboards(apps, schema_editor):
+    # The leaderboards are on the default database, built from the
+    # activities on every shard that has them
+    if schema_editor.connection.alias != DEFAULT_DB_ALIAS:
+        return
+    User = apps.get_model(settings.AUTH_USER_MODEL)
+    LeaderboardEntry = apps.get_model('activities', 'LeaderboardEntry')
+    LeaderboardScore = apps.get_model('activities', 'LeaderboardScore')
+    sources = []
+    for alias in settings.DATABASE_SHARDS:
+        tables = connections[alias].introspection.table_names()
+        for name in ('Activity', 'ArchivedActivity'):
+            model = apps.get_model('activities', name)
+            if model._meta.db_table in tables:
+                sources.append(model.objects.using(alias))
+
+    user_ids = list(User.objects.using(DEFAULT_DB_ALIAS).order_by('pk').values_list('pk', flat=True))
+    for start in range(0, len(user_ids), 1000):
+        # (user, period, period start, activity type) -> [count, duration, meters, calories]
+        totals = defaultdict(lambda: [0, 0, 0, 0])
+        for activities in sources:
+            rows = (
+                activities.filter(user_id__in=user_ids[start:start + 1000])
+                .order_by()
+                .values_list('user_id', 'date', 'activity_type', 'duration', 'distance', 'calories_burned')
+            )
+            for user_id, day, activity_type, duration, distance, calories in rows.iterator():
+                for period, start_of in PERIODS.items():
+                    total = totals[user_id, period, start_of(day), activity_type]
+                    total[0] += 1
+                    total[1] += duration
+                    total[2] += round((distance or 0) * 1000)
+                    total[3] += calories or 0
+        LeaderboardEntry.objects.using(DEFAULT_DB_ALIAS).bulk_create([
+            LeaderboardEntry(
+                user_id=user_id, period=period, period_start=period_start, activity_type=activity_type,
+                activity_count=total[0], total_duration=total[1], total_distance=total[2], total_calories=total[3],
+            )
+            for (user_id, period, period_start, activity_type), total in totals.items()
+        ], batch_size=1000)
+
+    for metric, field in METRICS.items():
+        rows = (
+            LeaderboardEntry.objects.using(DEFAULT_DB_ALIAS)
+            .filter(**{f'{field}__gt': 0})
+            .order_by()
+            .values('period', 'period_start', 'activity_type', field)
+            .annotate(users=models.Count('pk'))
+        )
+        LeaderboardScore.objects.using(DEFAULT_DB_ALIAS).bulk_create([
+            LeaderboardScore(
+                period=row['period'], period_start=row['period_start'], activity_type=row['activity_type'],
+                metric=metric, total=row[field], users=row['users'],
+            )
+            for row in rows.iterator()
+        ], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('activities', '0005_archivedactivity'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LeaderboardEntry',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('period', models.CharField(choices=[('weekly', 'Weekly'), ('monthly', 'Monthly')], max_length=10)),
+                ('period_start', models.DateField(help_text='First day of the week or month')),
+                ('activity_type', models.CharField(choices=[('running', 'Running'), ('cycling', 'Cycling'), ('swimming', 'Swimming'), ('walking', 'Walking'), ('gym', 'Gym'), ('yoga', 'Yoga'), ('hiking', 'Hiking'), ('other', 'Other')], max_length=20)),
+                ('activity_count', models.IntegerField(default=0)),
+                ('total_duration', models.IntegerField(default=0, help_text='Duration in minutes')),
+                ('total_distance', models.BigIntegerField(default=0, help_text='Distance in meters')),
+                ('total_calories', models.IntegerField(default=0)),
+            ],
+            options={
+                'verbose_name_plural': 'Leaderboard entries',
+            },
+        ),
+        migrations.CreateModel(
+            name='LeaderboardScore',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('period', models.CharField(choices=[('weekly', 'Weekly'), ('monthly', 'Monthly')], max_length=10)),
+                ('period_start', models.DateField()),
+                ('activity_type', models.CharField(choices=[('running', 'Running'), ('cycling', 'Cycling'), ('swimming', 'Swimming'), ('walking', 'Walking'), ('gym', 'Gym'), ('yoga', 'Yoga'), ('hiking', 'Hiking'), ('other', 'Other')], max_length=20)),
+                ('metric', models.CharField(choices=[('duration', 'Duration'), ('distance', 'Distance'), ('calories', 'Calories')], max_length=10)),
+                ('total', models.BigIntegerField()),
+                ('users', models.IntegerField(default=0)),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='leaderboardscore',
+            constraint=models.UniqueConstraint(fields=('period', 'period_start', 'activity_type', 'metric', 'total'), name='unique_leaderboard_score'),
+        ),
+        migrations.AddField(
+            model_name='leaderboardentry',
+            name='user',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='leaderboard_entries', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddIndex(
+            model_name='leaderboardentry',
+            index=models.Index(fields=['period', 'period_start', 'activity_type', '-total_duration', 'user'], name='leaderboard_duration_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='leaderboardentry',
+            index=models.Index(fields=['period', 'period_start', 'activity_type', '-total_distance', 'user'], name='leaderboard_distance_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='leaderboardentry',
+            index=models.Index(fields=['period', 'period_start', 'activity_type', '-total_calories', 'user'], name='leaderboard_calories_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='leaderboardentry',
+            constraint=models.UniqueConstraint(fields=('user', 'period', 'period_start', 'activity_type'), name='unique_leaderboard_entry'),
+        ),
+        migrations.RunPython(populate_leaderboards, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,106 @@
+# Generated by Django 4.2.7 on 2026-10-17 05:22
+
+from datetime import date, timedelta
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def record_key(record):
+    # The higher value wins, and of equal values the one achieved first
+    return (record['value'], -date.fromisoformat(record['date']).toordinal(), -record['activity_id'])
+
+
+def populate_stats(apps, schema_editor):
+    # Every database holding activities is migrated, each from its own rows
+    alias = schema_editor.connection.alias
+    ActivityStats = apps.get_model('activities', 'ActivityStats')
+    ActivityStreak = apps.get_model('activities', 'ActivityStreak')
+    ActivityDailyRollup = apps.get_model('activities', 'ActivityDailyRollup')
+    stats = {}
+
+    def stats_for(user_id):
+        if user_id not in stats:
+            stats[user_id] = ActivityStats(user_id=user_id, records={})
+        return stats[user_id]
+
+    # Streaks are the runs of consecutive days with activities
+    runs = []
+    days = ActivityDailyRollup.objects.using(alias).order_by('user_id', 'date').values_list('user_id', 'date').distinct()
+    for user_id, day in days.iterator():
+        if runs and runs[-1].user_id == user_id and runs[-1].end_date == day - timedelta(days=1):
+            runs[-1].end_date = day
+            runs[-1].days += 1
+        else:
+            runs.append(ActivityStreak(user_id=user_id, start_date=day, end_date=day, days=1))
+    for run in runs:
+        user_stats = stats_for(run.user_id)
+        # Runs come in date order, so the last one is the latest
+        user_stats.current_streak_start, user_stats.current_streak_end = run.start_date, run.end_date
+        if run.days >= user_stats.longest_streak:
+            user_stats.longest_streak = run.days
+            user_stats.longest_streak_start, user_stats.longest_streak_end = run.start_date, run.end_date
+    ActivityStreak.objects.using(alias).bulk_create(runs, batch_size=1000)
+
+    # Records are the longest distance and duration per activity type
+    for name in ('Activity', 'ArchivedActivity'):
+        rows = (
+            apps.get_model('activities', name).objects.using(alias)
+            .order_by()
+            .values_list('pk', 'user_id', 'date', 'activity_type', 'distance', 'duration')
+        )
+        for pk, user_id, day, activity_type, distance, duration in rows.iterator():
+            for field, value in (('distance', distance), ('duration', duration)):
+                if not value or value <= 0:
+                    continue
+                candidate = {'value': value, 'activity_id': pk, 'date': day.isoformat()}
+                records = stats_for(user_id).records.setdefault(activity_type, {})
+                if field not in records or record_key(candidate) > record_key(records[field]):
+                    records[field] = candidate
+    ActivityStats.objects.using(alias).bulk_create(stats.values(), batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auth', '0012_alter_user_first_name_max_length'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('activities', '0006_leaderboards'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ActivityStats',
+            fields=[
+                ('user', models.OneToOneField(db_constraint=False, on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='activity_stats', serialize=False, to=settings.AUTH_USER_MODEL)),
+                ('current_streak_start', models.DateField(blank=True, help_text='First day of the latest streak', null=True)),
+                ('current_streak_end', models.DateField(blank=True, help_text='Last day with an activity', null=True)),
+                ('longest_streak', models.IntegerField(default=0, help_text='Length in days')),
+                ('longest_streak_start', models.DateField(blank=True, null=True)),
+                ('longest_streak_end', models.DateField(blank=True, null=True)),
+                ('records', models.JSONField(blank=True, default=dict)),
+            ],
+            options={
+                'verbose_name_plural': 'Activity stats',
+            },
+        ),
+        migrations.CreateModel(
+            name='ActivityStreak',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('start_date', models.DateField()),
+                ('end_date', models.DateField()),
+                ('days', models.IntegerField()),
+                ('user', models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.CASCADE, related_name='activity_streaks', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['user', '-end_date'], name='streak_user_end_idx'), models.Index(fields=['user', '-days', '-end_date'], name='streak_user_days_idx')],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='activitystreak',
+            constraint=models.UniqueConstraint(fields=('user', 'start_date'), name='unique_activity_streak'),
+        ),
+        migrations.RunPython(populate_stats, migrations.RunPython.noop),
+    ]
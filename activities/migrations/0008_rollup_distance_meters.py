@@ -0,0 +1,49 @@
+# Generated by Django 4.2.7 on 2026-10-17 06:08
+
+from collections import defaultdict
+
+from django.db import migrations, models
+
+
+def distances_to_meters(apps, schema_editor):
+    # Every database holding activities is migrated, each from its own rows.
+    # The totals are summed again from the activities, rounded to meters one
+    # by one like later writes subtract them.
+    alias = schema_editor.connection.alias
+    ActivityDailyRollup = apps.get_model('activities', 'ActivityDailyRollup')
+    totals = defaultdict(int)
+    for name in ('Activity', 'ArchivedActivity'):
+        activities = (
+            apps.get_model('activities', name).objects.using(alias)
+            .filter(distance__isnull=False)
+            .values_list('user_id', 'date', 'activity_type', 'distance')
+        )
+        for user_id, day, activity_type, distance in activities.iterator():
+            totals[user_id, day, activity_type] += round(distance * 1000)
+    rollups = list(ActivityDailyRollup.objects.using(alias).only('user_id', 'date', 'activity_type', 'total_distance'))
+    for rollup in rollups:
+        rollup.total_distance = totals.get((rollup.user_id, rollup.date, rollup.activity_type), 0)
+    ActivityDailyRollup.objects.using(alias).bulk_update(rollups, ['total_distance'], batch_size=1000)
+
+
+def distances_to_kilometers(apps, schema_editor):
+    ActivityDailyRollup = apps.get_model('activities', 'ActivityDailyRollup')
+    ActivityDailyRollup.objects.using(schema_editor.connection.alias).update(
+        total_distance=models.F('total_distance') / 1000.0,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('activities', '0007_activity_stats'),
+    ]
+
+    operations = [
+        migrations.RunPython(distances_to_meters, distances_to_kilometers),
+        migrations.AlterField(
+            model_name='activitydailyrollup',
+            name='total_distance',
+            field=models.BigIntegerField(default=0, help_text='Distance in meters'),
+        ),
+    ]
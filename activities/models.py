@@ -1,10 +1,61 @@
-from django.db import models
+import bisect
+import heapq
+import os
+import threading
+from collections import defaultdict
+from datetime import date, timedelta
+from itertools import groupby
+from operator import itemgetter
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, IntegrityError, connections, models, router, transaction
+from django.db.models import Count, F, Max, Sum
 from django.contrib.auth.models import User
 
 
-class Activity(models.Model):
+class ShardedQuerySet(models.QuerySet):
     """
-    Model to store fitness activities logged by users.
+    QuerySet of a model whose rows live on their user's shard. Rows created
+    without an explicit database go to their user's shard rather than to
+    the default database, even those of different users in one bulk_create().
+    """
+
+    def create(self, **kwargs):
+        if self._db is not None:
+            return super().create(**kwargs)
+        obj = self.model(**kwargs)
+        self._for_write = True
+        # Routed by the instance, i.e. by its user
+        obj.save(force_insert=True)
+        return obj
+
+    def bulk_create(self, objs, *args, **kwargs):
+        objs = list(objs)
+        if self._db is not None:
+            return super().bulk_create(objs, *args, **kwargs)
+        shards = {}
+        by_shard = defaultdict(list)
+        for obj in objs:
+            if obj.user_id not in shards:
+                shards[obj.user_id] = router.db_for_write(self.model, instance=obj)
+            by_shard[shards[obj.user_id]].append(obj)
+        for alias, group in by_shard.items():
+            self.using(alias).bulk_create(group, *args, **kwargs)
+        return objs
+
+
+class ActivityQuerySet(ShardedQuerySet):
+
+    def bulk_create(self, objs, *args, **kwargs):
+        objs = list(objs)
+        IdSequence.objects.assign(objs)
+        return super().bulk_create(objs, *args, **kwargs)
+
+
+class ActivityFields(models.Model):
+    """
+    Columns shared by Activity and ArchivedActivity, so that rows can move
+    between the two tables as they are.
     """
     ACTIVITY_TYPES = [
         ('running', 'Running'),
@@ -17,7 +68,6 @@ class Activity(models.Model):
         ('other', 'Other'),
     ]
 
-    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='activities')
     activity_type = models.CharField(max_length=20, choices=ACTIVITY_TYPES)
     duration = models.IntegerField(help_text="Duration in minutes")
     distance = models.FloatField(help_text="Distance in kilometers", null=True, blank=True)
@@ -27,11 +77,1073 @@ class Activity(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    class Meta:
+        abstract = True
+
+
+class Activity(ActivityFields):
+    """
+    Model to store fitness activities logged by users.
+    """
+    # No foreign key constraint, as the activity may be on another shard
+    # than the user
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='activities', db_constraint=False)
+
+    objects = ActivityQuerySet.as_manager()
+
     class Meta:
         ordering = ['-date', '-created_at']
         verbose_name_plural = 'Activities'
+        # Every query is scoped to one user, so each index leads with user
+        # and then matches a filter or one of the sort_by orderings.
+        indexes = [
+            models.Index(fields=['user', '-date', '-created_at'], name='activity_user_date_idx'),
+            models.Index(fields=['user', 'activity_type', '-date', '-created_at'], name='activity_user_type_date_idx'),
+            models.Index(fields=['user', 'duration'], name='activity_user_duration_idx'),
+            models.Index(fields=['user', 'activity_type', 'duration'], name='activity_user_type_dur_idx'),
+            models.Index(fields=['user', 'calories_burned'], name='activity_user_calories_idx'),
+            models.Index(fields=['user', 'activity_type', 'calories_burned'], name='activity_user_type_cal_idx'),
+            models.Index(fields=['user', 'created_at'], name='activity_user_created_idx'),
+        ]
 
     def __str__(self):
         return f"{self.user.username} - {self.activity_type} on {self.date}"
 
+    def save(self, *args, **kwargs):
+        """Save the activity and keep the daily rollup, stats and leaderboards in step with it."""
+        # The user's shard, unless saved to a database explicitly
+        using = kwargs.get('using') or router.db_for_write(Activity, instance=self)
+        kwargs['using'] = using
+        new = self.pk is None
+        if new:
+            IdSequence.objects.assign([self])
+        with transaction.atomic(using=using):
+            previous = None
+            if not new:
+                previous = (
+                    Activity.objects.using(using)
+                    .select_for_update()
+                    .filter(pk=self.pk)
+                    .values(*ROLLUP_SOURCE_FIELDS)
+                    .first()
+                )
+                if previous is None:
+                    # Archived since it was read: the save below puts it
+                    # back in this table, so take it out of the archive
+                    archived = ArchivedActivity.objects.using(using).select_for_update().filter(pk=self.pk)
+                    previous = archived.values(*ROLLUP_SOURCE_FIELDS).first()
+                    if previous is not None:
+                        archived.delete()
+            super().save(*args, **kwargs)
+            current = rollup_snapshot(self)
+            ActivityDailyRollup.objects.db_manager(using).apply_change(previous, current)
+            ActivityStats.objects.db_manager(using).apply_change(self.pk, previous, current)
+            # The leaderboards are on the default database, so they follow
+            # once the activity is committed on its shard
+            transaction.on_commit(lambda: LeaderboardEntry.objects.apply_change(previous, current), using=using)
+
+
+class ArchivedActivity(ActivityFields):
+    """
+    Activity dated before the archive cutoff, moved out of the Activity
+    table by ``manage.py archive_activities`` so that the hot table and its
+    indexes only hold recent history. Rows keep their ids and timestamps
+    and are still counted by the daily rollups. Read through
+    activities.archive, which adds them to queries reaching past the cutoff.
+    """
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='archived_activities', db_constraint=False)
+
+    objects = ShardedQuerySet.as_manager()
+
+    class Meta:
+        ordering = ['-date', '-created_at']
+        verbose_name_plural = 'Archived activities'
+        # The access paths of Activity, so that reads reaching into the
+        # archive are served from indexes as well
+        indexes = [
+            models.Index(fields=['user', '-date', '-created_at'], name='archived_user_date_idx'),
+            models.Index(fields=['user', 'activity_type', '-date', '-created_at'], name='archived_user_type_date_idx'),
+            models.Index(fields=['user', 'duration'], name='archived_user_duration_idx'),
+            models.Index(fields=['user', 'activity_type', 'duration'], name='archived_user_type_dur_idx'),
+            models.Index(fields=['user', 'calories_burned'], name='archived_user_calories_idx'),
+            models.Index(fields=['user', 'activity_type', 'calories_burned'], name='archived_user_type_cal_idx'),
+            models.Index(fields=['user', 'created_at'], name='archived_user_created_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.user_id} - {self.activity_type} on {self.date} (archived)"
+
+
+# Activity fields that feed ActivityDailyRollup
+ROLLUP_SOURCE_FIELDS = ('user_id', 'date', 'activity_type', 'duration', 'distance', 'calories_burned')
+# ActivityDailyRollup fields that add up
+ROLLUP_TOTAL_FIELDS = (
+    'activity_count', 'total_duration', 'total_distance', 'distance_count', 'total_calories', 'calories_count',
+)
+
+
+def rollup_snapshot(activity):
+    """Return the rollup-relevant values of an activity as a dict."""
+    return {field: getattr(activity, field) for field in ROLLUP_SOURCE_FIELDS}
+
+
+class ActivityDailyRollupManager(models.Manager.from_queryset(ShardedQuerySet)):
+    """
+    Manager that keeps ActivityDailyRollup rows in step with Activity writes.
+    Its methods work on one database: pick the activities' shard with
+    ``db_manager()``.
+    """
+
+    def apply_change(self, previous, current):
+        """
+        Move an activity's contribution from its previous values to its
+        current ones. Either side may be None for creates and deletes.
+        """
+        if previous == current:
+            return
+        if previous is not None:
+            self._apply(*self._contribution(previous, -1))
+        if current is not None:
+            self._apply(*self._contribution(current, 1))
+
+    def add_activities(self, activities):
+        """
+        Add many newly inserted activities at once, e.g. after bulk_create(),
+        with one statement per distinct (user, date, activity_type).
+        """
+        totals = {}
+        for activity in activities:
+            key, deltas = self._contribution(rollup_snapshot(activity), 1)
+            group = tuple(key.values())
+            if group not in totals:
+                totals[group] = (key, deltas)
+            else:
+                for field, delta in deltas.items():
+                    totals[group][1][field] += delta
+        if not totals:
+            return
+
+        # Rows that already exist are updated in place, the rest are
+        # inserted together unless a concurrent writer got there first
+        existing = set(
+            self.filter(
+                user_id__in={key[0] for key in totals},
+                date__in={key[1] for key in totals},
+            ).values_list('user_id', 'date', 'activity_type')
+        )
+        new = [group for group in totals if group not in existing]
+        try:
+            with transaction.atomic(using=self.db):
+                self.bulk_create([self.model(**totals[group][0], **totals[group][1]) for group in new])
+        except IntegrityError:
+            existing = set(totals)
+        for group, (key, deltas) in totals.items():
+            if group in existing:
+                self._apply(key, deltas)
+
+    def _contribution(self, values, sign):
+        """Return the rollup key and the deltas for one activity."""
+        key = {
+            'user_id': values['user_id'],
+            'date': values['date'],
+            'activity_type': values['activity_type'],
+        }
+        distance = values['distance']
+        calories = values['calories_burned']
+        deltas = {
+            'activity_count': sign,
+            'total_duration': sign * values['duration'],
+            # Kept in meters, so that adding and subtracting stays exact
+            'total_distance': sign * round((distance or 0) * 1000),
+            'distance_count': sign if distance is not None else 0,
+            'total_calories': sign * (calories or 0),
+            'calories_count': sign if calories is not None else 0,
+        }
+        return key, deltas
+
+    def _apply(self, key, deltas):
+        updates = {field: F(field) + delta for field, delta in deltas.items()}
+
+        if deltas['activity_count'] < 0:
+            self.filter(**key).update(**updates)
+            self.filter(activity_count__lte=0, **key).delete()
+            return
+
+        if self.filter(**key).update(**updates):
+            return
+        try:
+            with transaction.atomic(using=self.db):
+                self.create(**key, **deltas)
+        except IntegrityError:
+            # Another writer created the row first
+            self.filter(**key).update(**updates)
+
+    def rebuild(self, user_ids=None, batch_size=1000):
+        """
+        Recompute rollups from the Activity and ArchivedActivity tables, for
+        every user or only for ``user_ids``. Returns the number of rollup
+        rows written.
+        """
+        rollups = self.all()
+        if user_ids is not None:
+            rollups = rollups.filter(user_id__in=user_ids)
+
+        def activities(model):
+            queryset = model.objects.using(self.db)
+            if user_ids is not None:
+                queryset = queryset.filter(user_id__in=user_ids)
+            return (
+                queryset.order_by('user_id', 'date', 'activity_type')
+                .values(*ROLLUP_SOURCE_FIELDS)
+                .iterator()
+            )
+
+        # A day may have activities in both tables, e.g. one logged late
+        # for a day already archived, so both are merged before grouping.
+        # The totals are added up here rather than with SUM() so that
+        # distances are rounded to meters exactly as apply_change() does.
+        key = itemgetter('user_id', 'date', 'activity_type')
+        rows = heapq.merge(activities(Activity), activities(ArchivedActivity), key=key)
+
+        written = 0
+        with transaction.atomic(using=self.db):
+            rollups.delete()
+            batch = []
+            for _, group in groupby(rows, key=key):
+                totals = None
+                for values in group:
+                    fields, deltas = self._contribution(values, 1)
+                    if totals is None:
+                        totals = deltas
+                    else:
+                        for field in ROLLUP_TOTAL_FIELDS:
+                            totals[field] += deltas[field]
+                if len(batch) >= batch_size:
+                    self.bulk_create(batch)
+                    written += len(batch)
+                    batch = []
+                batch.append(self.model(**fields, **totals))
+            if batch:
+                self.bulk_create(batch)
+                written += len(batch)
+        return written
+
+
+class ActivityDailyRollup(models.Model):
+    """
+    Per-user daily totals for each activity type.
+
+    Maintained incrementally on every Activity save and delete so that
+    aggregate endpoints scale with the number of active days rather than
+    the number of activities. Rebuild with ``manage.py rebuild_rollups``.
+    """
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='daily_rollups', db_constraint=False)
+    date = models.DateField()
+    activity_type = models.CharField(max_length=20, choices=Activity.ACTIVITY_TYPES)
+    activity_count = models.IntegerField(default=0)
+    total_duration = models.IntegerField(default=0, help_text="Duration in minutes")
+    total_distance = models.BigIntegerField(default=0, help_text="Distance in meters")
+    distance_count = models.IntegerField(default=0, help_text="Activities with a distance")
+    total_calories = models.IntegerField(default=0)
+    calories_count = models.IntegerField(default=0, help_text="Activities with calories burned")
+
+    objects = ActivityDailyRollupManager()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'date', 'activity_type'],
+                name='unique_daily_rollup',
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.user_id} - {self.activity_type} on {self.date}"
+
+
+class ActivityStreakManager(models.Manager.from_queryset(ShardedQuerySet)):
+    """
+    Manager that keeps a user's ActivityStreak rows covering exactly the
+    days with activities. Its methods work on one database, like those of
+    the rollups.
+    """
+
+    def add_day(self, user_id, day):
+        """
+        Mark ``day`` as active, extending or joining the runs next to it.
+        Returns the run now holding it, or None if it already was active.
+        """
+        runs = self.add_days(user_id, [day])
+        return runs[0] if runs else None
+
+    def add_days(self, user_id, days):
+        """
+        Mark ``days`` as active, extending or joining the runs next to them.
+        The runs they touch are loaded with one query and written with at
+        most one delete, update and insert, however many days there are.
+        Returns the runs now holding the days that were not active yet.
+        """
+        days = sorted(set(days))
+        if not days:
+            return []
+        one_day = timedelta(days=1)
+        runs = list(
+            self.filter(user_id=user_id, start_date__lte=days[-1] + one_day, end_date__gte=days[0] - one_day)
+            .order_by('start_date')
+        )
+        starts = [run.start_date for run in runs]
+        new_days = []
+        for day in days:
+            index = bisect.bisect_right(starts, day) - 1
+            if index < 0 or runs[index].end_date < day:
+                new_days.append(day)
+        if not new_days:
+            return []
+
+        # Merge the runs and the new days, both in date order, into the runs
+        # they make up, each with the existing runs it absorbs
+        spans = heapq.merge(
+            ((run.start_date, run.end_date, run) for run in runs),
+            ((day, day, None) for day in new_days),
+            key=itemgetter(0),
+        )
+        merged = []
+        for start, end, run in spans:
+            if merged and start <= merged[-1][1] + one_day:
+                merged[-1][1] = max(merged[-1][1], end)
+            else:
+                merged.append([start, end, []])
+            if run is not None:
+                merged[-1][2].append(run)
+
+        deleted, updated, created, changed = [], [], [], []
+        for start, end, absorbed in merged:
+            days_count = (end - start).days + 1
+            if not absorbed:
+                run = self.model(user_id=user_id, start_date=start, end_date=end, days=days_count)
+                created.append(run)
+                changed.append(run)
+                continue
+            # The earliest run is kept: the others start after it, so no
+            # two rows ever have the same start
+            run, *rest = absorbed
+            deleted.extend(other.pk for other in rest)
+            if (run.start_date, run.end_date) != (start, end):
+                run.start_date, run.end_date, run.days = start, end, days_count
+                updated.append(run)
+                changed.append(run)
+        if deleted:
+            self.filter(pk__in=deleted).delete()
+        if updated:
+            self.bulk_update(updated, ['start_date', 'end_date', 'days'])
+        if created:
+            self.bulk_create(created)
+        return changed
+
+    def remove_day(self, user_id, day):
+        """
+        Mark ``day`` as inactive, shortening or splitting the run holding it.
+        Returns the run as it was before, or None if it already was inactive.
+        """
+        run = self.filter(user_id=user_id, start_date__lte=day).order_by('-start_date').first()
+        if run is None or run.end_date < day:
+            return None
+        cut = self.model(user_id=user_id, start_date=run.start_date, end_date=run.end_date, days=run.days)
+        if run.start_date == run.end_date:
+            run.delete()
+            return cut
+        if day < run.end_date and day > run.start_date:
+            self.create(
+                user_id=user_id, start_date=day + timedelta(days=1), end_date=run.end_date,
+                days=(run.end_date - day).days,
+            )
+        if day == run.start_date:
+            run.start_date = day + timedelta(days=1)
+        else:
+            run.end_date = day - timedelta(days=1)
+        run.days = (run.end_date - run.start_date).days + 1
+        run.save(update_fields=['start_date', 'end_date', 'days'])
+        return cut
+
+
+class ActivityStreak(models.Model):
+    """
+    A run of consecutive days on which a user logged activities, archived
+    ones included. Kept on the user's shard and maintained by
+    ActivityStatsManager, so that a day added or removed anywhere in the
+    history only touches the runs next to it.
+    """
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='activity_streaks', db_constraint=False)
+    start_date = models.DateField()
+    end_date = models.DateField()
+    days = models.IntegerField()
+
+    objects = ActivityStreakManager()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'start_date'], name='unique_activity_streak'),
+        ]
+        indexes = [
+            models.Index(fields=['user', '-end_date'], name='streak_user_end_idx'),
+            models.Index(fields=['user', '-days', '-end_date'], name='streak_user_days_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.user_id} - {self.days} days from {self.start_date}"
+
+
+# Activity fields whose best value is kept per activity type
+RECORD_FIELDS = ('distance', 'duration')
+
+
+def _record_key(record):
+    """
+    Sort key of a personal record: the higher value wins, and of equal
+    values the one achieved first.
+    """
+    return (record['value'], -date.fromisoformat(record['date']).toordinal(), -record['activity_id'])
+
+
+class ActivityStatsManager(models.Manager.from_queryset(ShardedQuerySet)):
+    """
+    Manager that keeps ActivityStats and ActivityStreak rows in step with
+    Activity writes, after the rollups. Its methods work on one database:
+    pick the activities' shard with ``db_manager()``.
+    """
 
+    def apply_change(self, activity_id, previous, current):
+        """
+        Update the owner's streaks and records for an activity going from
+        its previous values, as rollup_snapshot() dicts, to its current
+        ones. Either side may be None for creates and deletes.
+        """
+        if previous == current:
+            return
+        stats = self._lock((current or previous)['user_id'])
+        previous_day = previous['date'] if previous is not None else None
+        current_day = current['date'] if current is not None else None
+        if previous_day != current_day:
+            self._update_streaks(
+                stats,
+                [current_day] if current_day is not None else [],
+                [previous_day] if previous_day is not None else [],
+            )
+
+        stale = set()
+        for field in RECORD_FIELDS:
+            if previous is not None:
+                record = stats.records.get(previous['activity_type'], {}).get(field)
+                if record is not None and record['activity_id'] == activity_id:
+                    # The record holder changed. Unless it only improved
+                    # on the same day, another activity may now be best.
+                    improved = (
+                        current is not None
+                        and current['activity_type'] == previous['activity_type']
+                        and current['date'] == previous['date']
+                        and (current[field] or 0) >= record['value']
+                    )
+                    if not improved:
+                        stale.add((previous['activity_type'], field))
+            if current is not None and (current['activity_type'], field) not in stale:
+                self._offer(stats, activity_id, current, field)
+        for activity_type, field in stale:
+            self._recompute(stats, activity_type, field)
+        stats.save()
+
+    def add_activities(self, activities):
+        """Add many newly inserted activities at once, e.g. after bulk_create()."""
+        by_user = defaultdict(list)
+        for activity in activities:
+            by_user[activity.user_id].append(activity)
+        for user_id, user_activities in by_user.items():
+            stats = self._lock(user_id)
+            self._update_streaks(stats, sorted({activity.date for activity in user_activities}), [])
+            for activity in user_activities:
+                for field in RECORD_FIELDS:
+                    self._offer(stats, activity.pk, rollup_snapshot(activity), field)
+            stats.save()
+
+    def _lock(self, user_id):
+        """Return the user's stats row, created if needed, locked until the end of the transaction."""
+        stats = self.select_for_update().filter(user_id=user_id).first()
+        if stats is not None:
+            return stats
+        try:
+            with transaction.atomic(using=self.db):
+                return self.create(user_id=user_id)
+        except IntegrityError:
+            # Another writer created the row first
+            return self.select_for_update().get(user_id=user_id)
+
+    def _update_streaks(self, stats, added, removed):
+        """
+        Apply days that may have become active or inactive. A day only
+        becomes inactive once the rollups, already updated, have no
+        activity left on it.
+        """
+        streaks = ActivityStreak.objects.db_manager(self.db)
+        for run in streaks.add_days(stats.user_id, added):
+            if stats.current_streak_end is None or run.end_date >= stats.current_streak_end:
+                stats.current_streak_start, stats.current_streak_end = run.start_date, run.end_date
+            if (run.days, run.end_date) > (stats.longest_streak, stats.longest_streak_end or date.min):
+                stats.longest_streak = run.days
+                stats.longest_streak_start, stats.longest_streak_end = run.start_date, run.end_date
+
+        if not removed:
+            return
+        active = set(
+            ActivityDailyRollup.objects.db_manager(self.db)
+            .filter(user_id=stats.user_id, date__in=removed)
+            .values_list('date', flat=True)
+        )
+        for day in removed:
+            if day in active:
+                continue
+            cut = streaks.remove_day(stats.user_id, day)
+            if cut is None:
+                continue
+            # Only cutting the latest or the longest run changes them, and
+            # then the runs left are looked up again
+            if cut.start_date == stats.current_streak_start:
+                latest = streaks.filter(user_id=stats.user_id).order_by('-end_date').first()
+                stats.current_streak_start = latest.start_date if latest is not None else None
+                stats.current_streak_end = latest.end_date if latest is not None else None
+            if cut.start_date == stats.longest_streak_start:
+                longest = streaks.filter(user_id=stats.user_id).order_by('-days', '-end_date').first()
+                stats.longest_streak = longest.days if longest is not None else 0
+                stats.longest_streak_start = longest.start_date if longest is not None else None
+                stats.longest_streak_end = longest.end_date if longest is not None else None
+
+    def _offer(self, stats, activity_id, values, field):
+        """Make an activity the record for ``field`` if it beats the current one."""
+        if not values[field] or values[field] <= 0:
+            return
+        candidate = {'value': values[field], 'activity_id': activity_id, 'date': values['date'].isoformat()}
+        records = stats.records.setdefault(values['activity_type'], {})
+        if field not in records or _record_key(candidate) > _record_key(records[field]):
+            records[field] = candidate
+
+    def _recompute(self, stats, activity_type, field):
+        """Find the record for ``field`` again among the user's activities, archived ones included."""
+        records = stats.records.setdefault(activity_type, {})
+        records.pop(field, None)
+        # Without archiving the archive is empty, see archive_activities --restore
+        models_searched = (Activity, ArchivedActivity) if settings.ACTIVITY_ARCHIVE_DAYS else (Activity,)
+        for model in models_searched:
+            best = (
+                model.objects.using(self.db)
+                .filter(user_id=stats.user_id, activity_type=activity_type, **{f'{field}__gt': 0})
+                .order_by(f'-{field}', 'date', 'pk')
+                .values('pk', field, 'date')
+                .first()
+            )
+            if best is not None:
+                self._offer(stats, best['pk'], {'activity_type': activity_type, **best}, field)
+        if not records:
+            del stats.records[activity_type]
+
+    def rebuild(self, user_ids=None, batch_size=1000):
+        """
+        Recompute streaks from the rollups and records from the Activity
+        and ArchivedActivity tables, for every user or only for
+        ``user_ids``. Returns the number of stats rows written.
+        """
+        streaks = ActivityStreak.objects.db_manager(self.db)
+        rollups = ActivityDailyRollup.objects.db_manager(self.db).all()
+        existing = self.all()
+        if user_ids is not None:
+            rollups = rollups.filter(user_id__in=user_ids)
+            existing = existing.filter(user_id__in=user_ids)
+            streaks_query = streaks.filter(user_id__in=user_ids)
+        else:
+            streaks_query = streaks.all()
+
+        stats = {}
+
+        def stats_for(user_id):
+            if user_id not in stats:
+                stats[user_id] = self.model(user_id=user_id)
+            return stats[user_id]
+
+        with transaction.atomic(using=self.db):
+            existing.delete()
+            streaks_query.delete()
+
+            runs = []
+            days = rollups.order_by('user_id', 'date').values_list('user_id', 'date').distinct()
+            for user_id, day in days.iterator():
+                if runs and runs[-1].user_id == user_id and runs[-1].end_date == day - timedelta(days=1):
+                    runs[-1].end_date = day
+                    runs[-1].days += 1
+                else:
+                    runs.append(ActivityStreak(user_id=user_id, start_date=day, end_date=day, days=1))
+            for run in runs:
+                user_stats = stats_for(run.user_id)
+                # Runs come in date order, so the last one is the latest
+                user_stats.current_streak_start, user_stats.current_streak_end = run.start_date, run.end_date
+                if run.days >= user_stats.longest_streak:
+                    user_stats.longest_streak = run.days
+                    user_stats.longest_streak_start, user_stats.longest_streak_end = run.start_date, run.end_date
+            streaks.bulk_create(runs, batch_size=batch_size)
+
+            for model in (Activity, ArchivedActivity):
+                activities = model.objects.using(self.db)
+                if user_ids is not None:
+                    activities = activities.filter(user_id__in=user_ids)
+                for values in activities.order_by().values('pk', *ROLLUP_SOURCE_FIELDS).iterator():
+                    for field in RECORD_FIELDS:
+                        self._offer(stats_for(values['user_id']), values['pk'], values, field)
+
+            self.bulk_create(stats.values(), batch_size=batch_size)
+        return len(stats)
+
+
+class ActivityStats(models.Model):
+    """
+    A user's current and longest streaks of consecutive active days and
+    their personal records per activity type, so that reading them is a
+    single row lookup. Kept on the user's shard and maintained on every
+    Activity save and delete, like the rollups. Rebuild with
+    ``manage.py rebuild_rollups``.
+    """
+    user = models.OneToOneField(
+        User, on_delete=models.CASCADE, primary_key=True, related_name='activity_stats', db_constraint=False,
+    )
+    current_streak_start = models.DateField(null=True, blank=True, help_text="First day of the latest streak")
+    current_streak_end = models.DateField(null=True, blank=True, help_text="Last day with an activity")
+    longest_streak = models.IntegerField(default=0, help_text="Length in days")
+    longest_streak_start = models.DateField(null=True, blank=True)
+    longest_streak_end = models.DateField(null=True, blank=True)
+    # activity type -> field -> {'value', 'activity_id', 'date'}
+    records = models.JSONField(default=dict, blank=True)
+
+    objects = ActivityStatsManager()
+
+    class Meta:
+        verbose_name_plural = 'Activity stats'
+
+    def __str__(self):
+        return f"{self.user_id} - longest streak {self.longest_streak} days"
+
+    def current_streak(self, today):
+        """
+        Length in days of the streak still going on ``today``: one that
+        ended yesterday can still be continued, so it counts.
+        """
+        if self.current_streak_end is None or self.current_streak_end < today - timedelta(days=1):
+            return 0
+        return (self.current_streak_end - self.current_streak_start).days + 1
+
+
+# Leaderboard period -> first day of the period containing a day. Weeks start on
+# Monday, like the trends buckets.
+LEADERBOARD_PERIODS = {
+    'weekly': lambda day: day - timedelta(days=day.weekday()),
+    'monthly': lambda day: day.replace(day=1),
+}
+
+# Leaderboard metric -> LeaderboardEntry field holding it
+LEADERBOARD_METRICS = {
+    'duration': 'total_duration',
+    'distance': 'total_distance',
+    'calories': 'total_calories',
+}
+
+
+def _upsert_add(model, key_fields, rows, batch_size=2000):
+    """
+    Insert ``rows``, dicts of ``key_fields`` and counters, into ``model``'s
+    table on the default database, adding the counters to those of the
+    rows already there, and return the resulting rows as tuples of the same
+    fields. Concurrent writers add up without reading first. Needs
+    INSERT ... ON CONFLICT ... RETURNING (PostgreSQL, SQLite 3.35+). Rows
+    are sent ``batch_size`` at a time, staying under the parameter limits
+    of both (32766 on SQLite, 65535 on PostgreSQL).
+    """
+    if not rows:
+        return []
+    connection = connections[DEFAULT_DB_ALIAS]
+    quote = connection.ops.quote_name
+    table = quote(model._meta.db_table)
+    fields = [model._meta.get_field(name) for name in rows[0]]
+    columns = ', '.join(quote(field.column) for field in fields)
+    counters = [field for field in fields if field.name not in key_fields]
+    placeholders = '({})'.format(', '.join(['%s'] * len(fields)))
+    results = []
+    with connection.cursor() as cursor:
+        for start in range(0, len(rows), batch_size):
+            batch = rows[start:start + batch_size]
+            cursor.execute('INSERT INTO {} ({}) VALUES {} ON CONFLICT ({}) DO UPDATE SET {} RETURNING {}'.format(
+                table,
+                columns,
+                ', '.join([placeholders] * len(batch)),
+                ', '.join(quote(model._meta.get_field(name).column) for name in key_fields),
+                ', '.join('{0} = {1}.{0} + EXCLUDED.{0}'.format(quote(field.column), table) for field in counters),
+                columns,
+            ), [field.get_db_prep_save(row[field.name], connection) for row in batch for field in fields])
+            results.extend(
+                tuple(field.to_python(value) for field, value in zip(fields, row)) for row in cursor.fetchall()
+            )
+    return results
+
+
+class LeaderboardEntryManager(models.Manager):
+    """
+    Manager that keeps LeaderboardEntry and LeaderboardScore rows in step
+    with Activity writes, on the default database. Changes are applied
+    once the activity's transaction has committed, as the activity may be
+    on another shard.
+    """
+
+    def apply_change(self, previous, current):
+        """
+        Move an activity's contribution, given as rollup_snapshot() values,
+        from its previous values to its current ones. Either side may be
+        None for creates and deletes.
+        """
+        if previous == current:
+            return
+        deltas = defaultdict(lambda: [0, 0, 0, 0])
+        for values, sign in ((previous, -1), (current, 1)):
+            if values is not None:
+                self._add_contribution(deltas, values, sign)
+        self._apply(deltas)
+
+    def add_activities(self, activities):
+        """Add many newly inserted activities at once, e.g. after bulk_create()."""
+        deltas = defaultdict(lambda: [0, 0, 0, 0])
+        for activity in activities:
+            self._add_contribution(deltas, rollup_snapshot(activity), 1)
+        self._apply(deltas)
+
+    def remove_user(self, user_id):
+        """
+        Take a user's entries out of the scores, before the entries are
+        deleted with the user.
+        """
+        entries = list(self.db_manager(DEFAULT_DB_ALIAS).filter(user_id=user_id).values_list(
+            'period', 'period_start', 'activity_type', *LEADERBOARD_METRICS.values()
+        ))
+        changes = defaultdict(int)
+        for period, start, activity_type, *totals in entries:
+            for metric, total in zip(LEADERBOARD_METRICS, totals):
+                if total > 0:
+                    changes[(period, start, activity_type, metric, total)] -= 1
+        LeaderboardScore.objects.change(changes)
+
+    def _add_contribution(self, deltas, values, sign):
+        """
+        Add one activity's contribution to the ``deltas`` of every entry it
+        counts towards, keyed by (user, period, period start, activity type).
+        Distances are counted in whole meters, so that they add up exactly.
+        """
+        distance = round((values['distance'] or 0) * 1000)
+        for period, start_of in LEADERBOARD_PERIODS.items():
+            delta = deltas[(values['user_id'], period, start_of(values['date']), values['activity_type'])]
+            delta[0] += sign
+            delta[1] += sign * values['duration']
+            delta[2] += sign * distance
+            delta[3] += sign * (values['calories_burned'] or 0)
+
+    def _apply(self, deltas):
+        deltas = {key: delta for key, delta in deltas.items() if any(delta)}
+        if not deltas:
+            return
+        with transaction.atomic(using=DEFAULT_DB_ALIAS):
+            # Returns the new totals, from which the old ones are found by
+            # taking the deltas back off
+            rows = _upsert_add(self.model, ('user', 'period', 'period_start', 'activity_type'), [
+                {
+                    'user': user_id, 'period': period, 'period_start': start, 'activity_type': activity_type,
+                    'activity_count': delta[0], 'total_duration': delta[1],
+                    'total_distance': delta[2], 'total_calories': delta[3],
+                }
+                for (user_id, period, start, activity_type), delta in deltas.items()
+            ])
+            changes = defaultdict(int)
+            for user_id, period, start, activity_type, count, *totals in rows:
+                delta = deltas[(user_id, period, start, activity_type)]
+                for metric, new, change in zip(LEADERBOARD_METRICS, totals, delta[1:]):
+                    old = new - change
+                    if old == new:
+                        continue
+                    if old > 0:
+                        changes[(period, start, activity_type, metric, old)] -= 1
+                    if new > 0:
+                        changes[(period, start, activity_type, metric, new)] += 1
+            LeaderboardScore.objects.change(changes)
+            if any(delta[0] < 0 for delta in deltas.values()):
+                self.db_manager(DEFAULT_DB_ALIAS).filter(
+                    user_id__in={key[0] for key in deltas},
+                    period_start__in={key[2] for key in deltas},
+                    activity_count__lte=0,
+                ).delete()
+
+    def top(self, period, period_start, activity_type, metric, limit):
+        """
+        Return the ``limit`` best users of a leaderboard as dicts of their
+        rank, user id, username and total, read from one index range.
+        Users with the same total share a rank.
+        """
+        field = LEADERBOARD_METRICS[metric]
+        rows = (
+            self.filter(period=period, period_start=period_start, activity_type=activity_type, **{f'{field}__gt': 0})
+            .order_by(f'-{field}', 'user_id')
+            .values_list('user_id', 'user__username', field)[:limit]
+        )
+        results = []
+        for index, (user_id, username, total) in enumerate(rows):
+            rank = index + 1 if not results or results[-1]['total'] != total else results[-1]['rank']
+            results.append({'rank': rank, 'user_id': user_id, 'user': username, 'total': total})
+        return results
+
+    def rank(self, user_id, period, period_start, activity_type, metric):
+        """
+        Return ``(rank, total)`` of a user on a leaderboard, or
+        ``(None, 0)`` when they are not on it. The rank is counted from the
+        scores, so it costs one row per distinct total above the user's
+        rather than one per user.
+        """
+        field = LEADERBOARD_METRICS[metric]
+        total = (
+            self.filter(user_id=user_id, period=period, period_start=period_start, activity_type=activity_type)
+            .values_list(field, flat=True)
+            .first()
+        )
+        if not total:
+            return None, 0
+        above = LeaderboardScore.objects.using(self.db).filter(
+            period=period, period_start=period_start, activity_type=activity_type, metric=metric, total__gt=total,
+        ).aggregate(users=Sum('users'))['users']
+        return (above or 0) + 1, total
+
+    def rebuild(self, batch_size=1000):
+        """
+        Recompute every entry and score from the activities on every shard,
+        archived ones included, ``batch_size`` users at a time. Returns the
+        number of entries written.
+        """
+        entries = self.db_manager(DEFAULT_DB_ALIAS)
+        user_ids = list(User.objects.using(DEFAULT_DB_ALIAS).order_by('pk').values_list('pk', flat=True))
+        written = 0
+        with transaction.atomic(using=DEFAULT_DB_ALIAS):
+            entries.all().delete()
+            LeaderboardScore.objects.using(DEFAULT_DB_ALIAS).all().delete()
+            for start in range(0, len(user_ids), batch_size):
+                batch = user_ids[start:start + batch_size]
+                deltas = defaultdict(lambda: [0, 0, 0, 0])
+                for alias in settings.DATABASE_SHARDS:
+                    for model in (Activity, ArchivedActivity):
+                        activities = model.objects.using(alias).filter(user_id__in=batch)
+                        for values in activities.order_by().values(*ROLLUP_SOURCE_FIELDS).iterator():
+                            self._add_contribution(deltas, values, 1)
+                entries.bulk_create([
+                    self.model(
+                        user_id=user_id, period=period, period_start=period_start, activity_type=activity_type,
+                        activity_count=delta[0], total_duration=delta[1],
+                        total_distance=delta[2], total_calories=delta[3],
+                    )
+                    for (user_id, period, period_start, activity_type), delta in deltas.items()
+                ], batch_size=batch_size)
+                written += len(deltas)
+
+            for metric, field in LEADERBOARD_METRICS.items():
+                scores = (
+                    entries.filter(**{f'{field}__gt': 0})
+                    .order_by()
+                    .values('period', 'period_start', 'activity_type', field)
+                    .annotate(users=Count('pk'))
+                )
+                LeaderboardScore.objects.using(DEFAULT_DB_ALIAS).bulk_create([
+                    LeaderboardScore(
+                        period=row['period'], period_start=row['period_start'], activity_type=row['activity_type'],
+                        metric=metric, total=row[field], users=row['users'],
+                    )
+                    for row in scores.iterator()
+                ], batch_size=batch_size)
+        return written
+
+
+class LeaderboardEntry(models.Model):
+    """
+    A user's totals for one activity type over one week or month, ranked on
+    the leaderboards. Kept on the default database and maintained
+    incrementally on every Activity write. Rebuild with
+    ``manage.py rebuild_leaderboards``.
+    """
+    PERIODS = [('weekly', 'Weekly'), ('monthly', 'Monthly')]
+
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='leaderboard_entries')
+    period = models.CharField(max_length=10, choices=PERIODS)
+    period_start = models.DateField(help_text="First day of the week or month")
+    activity_type = models.CharField(max_length=20, choices=Activity.ACTIVITY_TYPES)
+    activity_count = models.IntegerField(default=0)
+    total_duration = models.IntegerField(default=0, help_text="Duration in minutes")
+    total_distance = models.BigIntegerField(default=0, help_text="Distance in meters")
+    total_calories = models.IntegerField(default=0)
+
+    objects = LeaderboardEntryManager()
+
+    class Meta:
+        verbose_name_plural = 'Leaderboard entries'
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'period', 'period_start', 'activity_type'],
+                name='unique_leaderboard_entry',
+            ),
+        ]
+        # One per metric, so that the top of a leaderboard is read in order
+        indexes = [
+            models.Index(fields=['period', 'period_start', 'activity_type', '-total_duration', 'user'],
+                         name='leaderboard_duration_idx'),
+            models.Index(fields=['period', 'period_start', 'activity_type', '-total_distance', 'user'],
+                         name='leaderboard_distance_idx'),
+            models.Index(fields=['period', 'period_start', 'activity_type', '-total_calories', 'user'],
+                         name='leaderboard_calories_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.user_id} - {self.activity_type} {self.period} from {self.period_start}"
+
+
+class LeaderboardScoreManager(models.Manager):
+
+    def change(self, changes):
+        """
+        Apply ``changes``, numbers of users to add to a (period, period
+        start, activity type, metric, total), and drop the totals no user
+        has any more.
+        """
+        changes = {key: users for key, users in changes.items() if users}
+        if not changes:
+            return
+        keys = ('period', 'period_start', 'activity_type', 'metric', 'total')
+        _upsert_add(self.model, keys, [dict(zip(keys, key), users=users) for key, users in changes.items()])
+        if any(users < 0 for users in changes.values()):
+            self.db_manager(DEFAULT_DB_ALIAS).filter(
+                period_start__in={key[1] for key in changes},
+                activity_type__in={key[2] for key in changes},
+                users__lte=0,
+            ).delete()
+
+
+class LeaderboardScore(models.Model):
+    """
+    Number of users with each total on a leaderboard, from which a user's
+    rank is counted without going through the users ranked above them.
+    Kept on the default database alongside LeaderboardEntry.
+    """
+    period = models.CharField(max_length=10, choices=LeaderboardEntry.PERIODS)
+    period_start = models.DateField()
+    activity_type = models.CharField(max_length=20, choices=Activity.ACTIVITY_TYPES)
+    metric = models.CharField(max_length=10, choices=[(metric, metric.title()) for metric in LEADERBOARD_METRICS])
+    total = models.BigIntegerField()
+    users = models.IntegerField(default=0)
+
+    objects = LeaderboardScoreManager()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['period', 'period_start', 'activity_type', 'metric', 'total'],
+                name='unique_leaderboard_score',
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.users} users with {self.metric} {self.total} ({self.activity_type} {self.period} from {self.period_start})"
+
+
+class UserShard(models.Model):
+    """
+    Shard directory: the database holding a user's activities and rollups,
+    for users not on the default database. Kept on the default database.
+    """
+    user = models.OneToOneField(User, on_delete=models.CASCADE, primary_key=True, related_name='shard')
+    database = models.CharField(max_length=100, help_text="Database alias, e.g. shard_1")
+
+    def __str__(self):
+        return f"{self.user_id} on {self.database}"
+
+
+# Ids reserved at once by each process, so that most new rows need no
+# round trip to the sequence
+ID_BLOCK_SIZE = 100
+
+_id_lock = threading.Lock()
+# Model label -> (process id, next unused id, end of the reserved block)
+_id_blocks = {}
+
+
+class IdSequenceManager(models.Manager):
+
+    def assign(self, objs):
+        """
+        Give the objects without a primary key ids that are unique across
+        all shards, so that rows can move between shards with their ids.
+        Without shards the database's own sequence is used.
+        """
+        if len(settings.DATABASE_SHARDS) < 2:
+            return
+        new = [obj for obj in objs if obj.pk is None]
+        if not new:
+            return
+        model = type(new[0])
+        name = model._meta.label_lower
+        # A block reserved inside a transaction that is then rolled back
+        # would be handed out again, so only keep it in autocommit mode
+        keep = not connections[DEFAULT_DB_ALIAS].in_atomic_block
+        with _id_lock:
+            pid, next_id, end = _id_blocks.get(name, (None, 0, 0))
+            if pid != os.getpid() or not keep:
+                # Worker processes forked from the one that reserved the block need their own
+                next_id = end = 0
+            ids = []
+            while len(ids) < len(new):
+                if next_id == end:
+                    size = max(ID_BLOCK_SIZE, len(new) - len(ids)) if keep else len(new) - len(ids)
+                    next_id = self.allocate(model, size)
+                    end = next_id + size
+                taken = min(end - next_id, len(new) - len(ids))
+                ids.extend(range(next_id, next_id + taken))
+                next_id += taken
+            if keep:
+                _id_blocks[name] = (os.getpid(), next_id, end)
+        for obj, pk in zip(new, ids):
+            obj.pk = pk
+
+    def allocate(self, model, count):
+        """Reserve ``count`` consecutive ids of ``model`` and return the first."""
+        name = model._meta.label_lower
+        sequences = self.db_manager(DEFAULT_DB_ALIAS)
+        with transaction.atomic(using=DEFAULT_DB_ALIAS):
+            if not sequences.filter(name=name).update(value=F('value') + count):
+                # Start after the ids already used on any shard, including
+                # those of archived activities, which keep their ids
+                tables = [model, ArchivedActivity] if model is Activity else [model]
+                start = max(
+                    table._base_manager.using(alias).aggregate(last=Max('pk'))['last'] or 0
+                    for table in tables
+                    for alias in settings.DATABASE_SHARDS
+                )
+                try:
+                    with transaction.atomic(using=DEFAULT_DB_ALIAS):
+                        sequences.create(name=name, value=start + count)
+                except IntegrityError:
+                    # Another writer created the sequence first
+                    sequences.filter(name=name).update(value=F('value') + count)
+            return sequences.get(name=name).value - count + 1
+
+
+class IdSequence(models.Model):
+    """
+    Last id handed out for a sharded model. Kept on the default database.
+    """
+    name = models.CharField(max_length=100, primary_key=True, help_text="Model label, e.g. activities.activity")
+    value = models.BigIntegerField(default=0)
+
+    objects = IdSequenceManager()
+
+    def __str__(self):
+        return f"{self.name}: {self.value}"
@@ -0,0 +1,164 @@
+import base64
+import binascii
+import json
+from collections import OrderedDict
+
+from django.core.exceptions import FieldDoesNotExist, ValidationError
+from django.db import connections
+from django.db.models import F, Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+from .archive import filter_tiers
+
+
+class KeysetPagination(BasePagination):
+    """
+    Keyset (seek) pagination for activity querysets.
+
+    The page order is the queryset's first ordering term (the ``sort_by``
+    field) followed by ``date``, ``created_at`` and ``id`` in the same
+    direction, which makes it total. Each page is fetched with a WHERE
+    clause on the last row of the previous one, so no COUNT(*) or OFFSET
+    is ever run and a deep page costs the same as the first one.
+
+    Cursors are opaque to clients and only valid for the ordering they
+    were issued for.
+    """
+    tiebreakers = ('date', 'created_at', 'id')
+    cursor_query_param = 'cursor'
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+    invalid_cursor_message = 'Invalid cursor'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.base_url = request.build_absolute_uri()
+        self.page_size = self.get_page_size(request)
+        self.keys = self.get_keys(queryset)
+        self.nulls_largest = connections[queryset.db].features.nulls_order_largest
+
+        cursor = self.decode_cursor(request, queryset.model)
+        reverse = cursor['r'] if cursor else False
+        if cursor:
+            queryset = filter_tiers(queryset, self.build_filter(cursor['v'], reverse))
+
+        ordering = [
+            F(field).desc() if descending != reverse else F(field).asc()
+            for field, descending in self.keys
+        ]
+        results = list(queryset.order_by(*ordering)[:self.page_size + 1])
+        has_more = len(results) > self.page_size
+        results = results[:self.page_size]
+        if reverse:
+            results.reverse()
+
+        # Coming back from a later page means there is a next page, and
+        # moving forward from a cursor means there is a previous one
+        self.has_next = has_more if not reverse else True
+        self.has_previous = has_more if reverse else cursor is not None
+        self.page = results
+        return results
+
+    def get_paginated_response(self, data):
+        return Response(OrderedDict([
+            ('next', self.get_next_link()),
+            ('previous', self.get_previous_link()),
+            ('results', data),
+        ]))
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'properties': {
+                'next': {'type': 'string', 'nullable': True},
+                'previous': {'type': 'string', 'nullable': True},
+                'results': schema,
+            },
+        }
+
+    def get_page_size(self, request):
+        try:
+            page_size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return api_settings.PAGE_SIZE
+        return min(max(page_size, 1), self.max_page_size)
+
+    def get_keys(self, queryset):
+        """Return the ``(field, descending)`` pairs that order a page."""
+        ordering = queryset.query.order_by or queryset.model._meta.ordering
+        primary = str(ordering[0]) if ordering else '-date'
+        descending = primary.startswith('-')
+        keys = [(primary.lstrip('-'), descending)]
+        for field in self.tiebreakers:
+            if field != keys[0][0]:
+                keys.append((field, descending))
+        self.ordering = primary
+        return keys
+
+    def build_filter(self, values, reverse):
+        """Return a Q matching the rows that come after ``values``."""
+        condition = Q(pk__in=[])
+        prefix = Q()
+        for (field, descending), value in zip(self.keys, values):
+            condition |= prefix & self.after(field, value, descending != reverse)
+            prefix &= Q(**{f'{field}__isnull': True}) if value is None else Q(**{field: value})
+        return condition
+
+    def after(self, field, value, descending):
+        """
+        Return a Q matching values of ``field`` that sort after ``value``,
+        placing NULLs where the database does.
+        """
+        nulls_after = descending != self.nulls_largest
+        if value is None:
+            return Q(pk__in=[]) if nulls_after else Q(**{f'{field}__isnull': False})
+        condition = Q(**{f"{field}__{'lt' if descending else 'gt'}": value})
+        if nulls_after:
+            condition |= Q(**{f'{field}__isnull': True})
+        return condition
+
+    def get_next_link(self):
+        if not self.has_next or not self.page:
+            return None
+        return self.encode_cursor(self.page[-1], reverse=False)
+
+    def get_previous_link(self):
+        if not self.has_previous:
+            return None
+        if not self.page:
+            return remove_query_param(self.base_url, self.cursor_query_param)
+        return self.encode_cursor(self.page[0], reverse=True)
+
+    def encode_cursor(self, instance, reverse):
+        values = []
+        for field, _ in self.keys:
+            if isinstance(instance, dict):
+                value = instance[field]
+            else:
+                value = getattr(instance, 'pk' if field == 'id' else field)
+            values.append(value.isoformat() if hasattr(value, 'isoformat') else value)
+        payload = json.dumps({'o': self.ordering, 'v': values, 'r': reverse}, separators=(',', ':'))
+        token = base64.urlsafe_b64encode(payload.encode()).decode().rstrip('=')
+        return replace_query_param(self.base_url, self.cursor_query_param, token)
+
+    def decode_cursor(self, request, model):
+        token = request.query_params.get(self.cursor_query_param)
+        if not token:
+            return None
+        try:
+            payload = base64.urlsafe_b64decode(token + '=' * (-len(token) % 4))
+            cursor = json.loads(payload)
+            if cursor['o'] != self.ordering or len(cursor['v']) != len(self.keys):
+                raise ValueError
+            cursor['v'] = [
+                None if value is None else model._meta.get_field(field).to_python(value)
+                for (field, _), value in zip(self.keys, cursor['v'])
+            ]
+            cursor['r'] = bool(cursor['r'])
+        except (binascii.Error, ValueError, KeyError, TypeError, FieldDoesNotExist, ValidationError):
+            raise NotFound(self.invalid_cursor_message)
+        return cursor
@@ -10,8 +10,9 @@ class IsOwnerOrReadOnly(permissions.BasePermission):
         if request.method in permissions.SAFE_METHODS:
             return True
         
-        # Write permissions are only allowed to the owner of the activity
-        return obj.user == request.user
+        # Write permissions are only allowed to the owner of the activity.
+        # Compare ids so that the owner does not have to be fetched.
+        return obj.user_id == request.user.pk
 
 
 class IsOwner(permissions.BasePermission):
@@ -20,7 +21,7 @@ class IsOwner(permissions.BasePermission):
     """
     def has_object_permission(self, request, view, obj):
         # Only the owner can access their own object
-        return obj.user == request.user
+        return obj.user_id == request.user.pk
 
 
 class IsUserOwner(permissions.BasePermission):
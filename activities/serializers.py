@@ -1,6 +1,7 @@
 from rest_framework import serializers
 from django.contrib.auth.models import User
 from django.contrib.auth.password_validation import validate_password
+from .archive import tiered
 from .models import Activity
 
 
@@ -15,9 +16,15 @@ class UserSerializer(serializers.ModelSerializer):
         model = User
         fields = ['id', 'username', 'email', 'first_name', 'last_name', 'date_joined', 'activities_count', 'password']
         read_only_fields = ['id', 'date_joined']
+        # Readable model columns, the only ones UserViewSet loads
+        model_fields = ['id', 'username', 'email', 'first_name', 'last_name', 'date_joined']
 
     def get_activities_count(self, obj):
-        return obj.activities.count()
+        # Annotated by UserViewSet; count only as a fallback, e.g. for a
+        # user retrieved from a shard, archived activities included
+        if hasattr(obj, 'activities_count'):
+            return obj.activities_count
+        return tiered(obj, lambda activities: activities.values('id')).count()
 
     def create(self, validated_data):
         password = validated_data.pop('password', None)
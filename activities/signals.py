@@ -0,0 +1,111 @@
+from django.contrib.auth.models import User
+from django.db import transaction
+from django.db.models.deletion import Collector
+from django.db.models.signals import post_delete, post_save, pre_delete
+from django.dispatch import receiver
+from rest_framework_simplejwt.token_blacklist.models import BlacklistedToken
+
+from .authentication import forget_user, remember_revoked
+from .cache import bump_data_version
+from .db import assign_shards, forget_shard, shard_for_user
+from .models import (
+    Activity, ActivityDailyRollup, ActivityStats, ActivityStreak, ArchivedActivity, LeaderboardEntry, rollup_snapshot,
+)
+
+
+@receiver(post_delete, sender=Activity)
+def remove_activity_from_rollup(sender, instance, **kwargs):
+    """
+    Subtract a deleted activity from its daily rollup, then from the
+    owner's streaks and records, which read the updated rollups.
+
+    Handled with a signal rather than in Activity.delete() so that queryset
+    and cascade deletes are covered too; the deletion collector sends it
+    inside the same transaction as the DELETE. When the owner is being
+    deleted their rollups and stats go with them, so there is nothing to
+    update.
+    """
+    if isinstance(kwargs.get('origin'), User):
+        return
+    snapshot = rollup_snapshot(instance)
+    ActivityDailyRollup.objects.db_manager(kwargs['using']).apply_change(snapshot, None)
+    ActivityStats.objects.db_manager(kwargs['using']).apply_change(instance.pk, snapshot, None)
+
+
+@receiver(post_delete, sender=Activity)
+def remove_activity_from_leaderboards(sender, instance, **kwargs):
+    """
+    Subtract a deleted activity from the leaderboards once the deletion
+    commits on its shard. As with the rollups, a deleted owner's entries
+    go with them.
+    """
+    if isinstance(kwargs.get('origin'), User):
+        return
+    snapshot = rollup_snapshot(instance)
+    transaction.on_commit(lambda: LeaderboardEntry.objects.apply_change(snapshot, None), using=kwargs['using'])
+
+
+@receiver(post_save, sender=Activity)
+@receiver(post_delete, sender=Activity)
+def invalidate_cached_statistics(sender, instance, **kwargs):
+    """Bump the owner's data version so cached statistics are recomputed."""
+    if isinstance(kwargs.get('origin'), User):
+        return
+    bump_data_version(instance.user_id, using=kwargs['using'])
+
+
+@receiver(post_save, sender=User)
+def assign_user_shard(sender, instance, created, **kwargs):
+    """Put a new user's activities on one of the shards."""
+    if created:
+        assign_shards([instance.pk])
+
+
+@receiver(pre_delete, sender=User)
+def delete_sharded_activities(sender, instance, using, **kwargs):
+    """
+    Delete the activities, archived ones included, rollups and stats of a
+    user on another shard, which the cascade on the user's database does
+    not reach, once the user's deletion commits. The shard is looked up before the
+    directory entry is deleted.
+    """
+    alias = shard_for_user(instance.pk)
+    if alias == using:
+        return
+
+    def delete():
+        # As in a cascade, the origin tells the handlers above to skip the
+        # per-activity rollup and cache updates
+        collector = Collector(using=alias, origin=instance)
+        collector.collect(Activity.objects.using(alias).filter(user_id=instance.pk))
+        collector.delete()
+        ArchivedActivity.objects.using(alias).filter(user_id=instance.pk).delete()
+        ActivityDailyRollup.objects.using(alias).filter(user_id=instance.pk).delete()
+        ActivityStreak.objects.using(alias).filter(user_id=instance.pk).delete()
+        ActivityStats.objects.using(alias).filter(user_id=instance.pk).delete()
+        forget_shard(instance.pk)
+    transaction.on_commit(delete, using=using)
+
+
+@receiver(pre_delete, sender=User)
+def remove_user_from_leaderboards(sender, instance, using, **kwargs):
+    """
+    Take a user's totals out of the leaderboard scores; their entries are
+    deleted by the cascade.
+    """
+    LeaderboardEntry.objects.remove_user(instance.pk)
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def invalidate_cached_user(sender, instance, **kwargs):
+    """Drop a saved, deactivated or deleted user from the authentication cache."""
+    forget_user(instance)
+
+
+@receiver(post_save, sender=BlacklistedToken)
+def cache_revoked_token(sender, instance, created, **kwargs):
+    """Let the revocation cache answer for tokens blacklisted elsewhere, such as the admin."""
+    if created:
+        token = instance.token
+        transaction.on_commit(lambda: remember_revoked(token.jti, token.expires_at.timestamp()))
@@ -0,0 +1,181 @@
+from datetime import date, timedelta
+
+from django.db.models import Count, ExpressionWrapper, FloatField, Sum
+from django.db.models.functions import TruncDay, TruncWeek, TruncMonth, TruncYear
+
+from .models import ActivityDailyRollup
+
+
+# period -> (query parameter holding the bucket count, default count,
+# maximum count, truncation)
+TREND_PERIODS = {
+    'daily': ('days', 7, 366, TruncDay),
+    'weekly': ('weeks', 4, 104, TruncWeek),
+    'monthly': ('months', 6, 120, TruncMonth),
+    'yearly': ('years', 3, 50, TruncYear),
+}
+
+
+def _aggregates(queryset):
+    """
+    Return the per-group aggregate expressions for ``queryset``, which may
+    hold raw activities or their daily rollups.
+    """
+    if queryset.model is ActivityDailyRollup:
+        return {
+            'count': Sum('activity_count'),
+            'total_duration': Sum('total_duration'),
+            # Rollups keep distances in meters
+            'total_distance': ExpressionWrapper(Sum('total_distance') / 1000.0, output_field=FloatField()),
+            'total_calories': Sum('total_calories'),
+            'distance_count': Sum('distance_count'),
+            'calories_count': Sum('calories_count'),
+        }
+    return {
+        'count': Count('id'),
+        'total_duration': Sum('duration'),
+        'total_distance': Sum('distance'),
+        'total_calories': Sum('calories_burned'),
+        'distance_count': Count('distance'),
+        'calories_count': Count('calories_burned'),
+    }
+
+
+def compute_statistics(queryset):
+    """
+    Compute totals, averages and the per-type breakdown for a queryset
+    of activities or of their daily rollups.
+
+    Everything is derived from a single GROUP BY activity_type query:
+    the overall totals are the sums of the per-type rows, and the
+    averages divide by the number of non-null values just like AVG().
+    """
+    return _build_statistics(list(_statistics_rows(queryset)))
+
+
+async def acompute_statistics(queryset):
+    """Async version of compute_statistics() using the async ORM."""
+    return _build_statistics([row async for row in _statistics_rows(queryset)])
+
+
+def _statistics_rows(queryset):
+    return queryset.order_by().values('activity_type').annotate(**_aggregates(queryset))
+
+
+def _build_statistics(rows):
+    """Fold per-type aggregate rows into the overall statistics."""
+    total_activities = sum(row['count'] for row in rows)
+    total_duration = sum(row['total_duration'] or 0 for row in rows)
+    total_distance = sum(row['total_distance'] or 0 for row in rows if row['distance_count'])
+    total_calories = sum(row['total_calories'] or 0 for row in rows if row['calories_count'])
+    distance_count = sum(row['distance_count'] for row in rows)
+    calories_count = sum(row['calories_count'] for row in rows)
+
+    activities_by_type = sorted(
+        (
+            {
+                'activity_type': row['activity_type'],
+                'count': row['count'],
+                'total_duration': row['total_duration'],
+                # Like SUM(), report None when no activity had a value
+                'total_distance': row['total_distance'] if row['distance_count'] else None,
+                'total_calories': row['total_calories'] if row['calories_count'] else None,
+            }
+            for row in rows
+        ),
+        key=lambda item: -item['count'],
+    )
+
+    return {
+        'total_activities': total_activities,
+        'total_duration': total_duration,
+        'total_distance': total_distance,
+        'total_calories': total_calories,
+        'average_duration': total_duration / total_activities if total_activities else 0,
+        'average_distance': total_distance / distance_count if distance_count else 0,
+        'average_calories': total_calories / calories_count if calories_count else 0,
+        'activities_by_type': activities_by_type,
+    }
+
+
+def _shift_months(value, months):
+    """Return the first day of the month ``months`` away from ``value``."""
+    index = value.year * 12 + value.month - 1 + months
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def _bucket_start(period, today, offset):
+    """Return the start of the bucket ``offset`` buckets away from today's."""
+    if period == 'daily':
+        return today + timedelta(days=offset)
+    if period == 'weekly':
+        # Weeks start on Monday, matching TruncWeek
+        return today - timedelta(days=today.weekday()) + timedelta(weeks=offset)
+    if period == 'monthly':
+        return _shift_months(today, offset)
+    return date(today.year + offset, 1, 1)
+
+
+def _bucket_label(period, index, start):
+    if period == 'daily':
+        return 'day', start.isoformat()
+    if period == 'weekly':
+        return 'week', f"Week {index + 1}"
+    if period == 'monthly':
+        return 'month', start.strftime('%B %Y')
+    return 'year', str(start.year)
+
+
+def compute_trends(queryset, period, count, today):
+    """
+    Bucket a queryset of activities or daily rollups into the last
+    ``count`` calendar days, weeks, months or years (the current one
+    included).
+
+    The totals for every bucket come from one GROUP BY query over the
+    truncated date; buckets without activities are zero-filled here.
+    """
+    starts = _bucket_starts(period, count, today)
+    return _build_trends(period, starts, list(_trend_rows(queryset, period, starts)))
+
+
+async def acompute_trends(queryset, period, count, today):
+    """Async version of compute_trends() using the async ORM."""
+    starts = _bucket_starts(period, count, today)
+    return _build_trends(period, starts, [row async for row in _trend_rows(queryset, period, starts)])
+
+
+def _bucket_starts(period, count, today):
+    """Return the start of every bucket followed by the end of the last one."""
+    return [_bucket_start(period, today, offset) for offset in range(-count + 1, 2)]
+
+
+def _trend_rows(queryset, period, starts):
+    truncate = TREND_PERIODS[period][3]
+    return (
+        queryset.filter(date__gte=starts[0], date__lt=starts[-1])
+        .order_by()
+        .annotate(bucket=truncate('date'))
+        .values('bucket')
+        .annotate(**_aggregates(queryset))
+    )
+
+
+def _build_trends(period, starts, rows):
+    """Zero-fill the per-bucket aggregate rows into the list of trends."""
+    totals = {row['bucket']: row for row in rows}
+
+    trends = []
+    for index, (start, next_start) in enumerate(zip(starts, starts[1:])):
+        end = next_start - timedelta(days=1)
+        row = totals.get(start, {})
+        label_key, label = _bucket_label(period, index, start)
+        trends.append({
+            label_key: label,
+            'period': f"{start} to {end}",
+            'total_activities': row.get('count', 0),
+            'total_duration': row.get('total_duration') or 0,
+            'total_distance': round(row.get('total_distance') or 0, 2),
+            'total_calories': row.get('total_calories') or 0,
+        })
+    return trends
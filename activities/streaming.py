@@ -0,0 +1,91 @@
+import json
+from itertools import islice
+
+from django.http import StreamingHttpResponse
+from rest_framework.utils.encoders import JSONEncoder
+
+
+STREAM_CHUNK_SIZE = 500
+
+
+def wants_stream(request):
+    """Return True if the client asked for a streamed response."""
+    return request.query_params.get('stream', '').lower() in ('1', 'true', 'yes')
+
+
+def _dumps(value):
+    return json.dumps(value, cls=JSONEncoder, ensure_ascii=False, separators=(',', ':'))
+
+
+def _serialized_chunks(queryset, serializer_class, chunk_size):
+    """Serialize ``queryset`` a chunk of rows at a time."""
+    rows = queryset.iterator(chunk_size=chunk_size)
+    while True:
+        chunk = list(islice(rows, chunk_size))
+        if not chunk:
+            return
+        yield [_dumps(item) for item in serializer_class(chunk, many=True).data]
+
+
+async def _aserialized_chunks(queryset, serializer_class, chunk_size):
+    """Async version of _serialized_chunks() using the async ORM."""
+    chunk = []
+    async for row in queryset.aiterator(chunk_size=chunk_size):
+        chunk.append(row)
+        if len(chunk) >= chunk_size:
+            yield [_dumps(item) for item in serializer_class(chunk, many=True).data]
+            chunk = []
+    if chunk:
+        yield [_dumps(item) for item in serializer_class(chunk, many=True).data]
+
+
+def _opening(payload, list_key):
+    if list_key is None:
+        return '['
+    members = ''.join(f'{_dumps(key)}:{_dumps(value)},' for key, value in payload.items())
+    return f'{{{members}{_dumps(list_key)}:['
+
+
+def _closing(list_key):
+    return ']' if list_key is None else ']}'
+
+
+def _stream(payload, list_key, queryset, serializer_class, chunk_size):
+    yield _opening(payload, list_key)
+    separator = ''
+    for items in _serialized_chunks(queryset, serializer_class, chunk_size):
+        yield separator + ','.join(items)
+        separator = ','
+    yield _closing(list_key)
+
+
+async def _astream(payload, list_key, queryset, serializer_class, chunk_size):
+    yield _opening(payload, list_key)
+    separator = ''
+    async for items in _aserialized_chunks(queryset, serializer_class, chunk_size):
+        yield separator + ','.join(items)
+        separator = ','
+    yield _closing(list_key)
+
+
+def stream_json_response(queryset, serializer_class, payload=None, list_key=None,
+                         chunk_size=STREAM_CHUNK_SIZE, asynchronous=False):
+    """
+    Return a StreamingHttpResponse that writes ``queryset`` as a JSON array,
+    serializing and sending it one chunk of rows at a time so memory use
+    does not grow with the number of rows.
+
+    With ``list_key`` the array is embedded in a JSON object made of
+    ``payload`` plus ``list_key``, otherwise the array is the whole body.
+
+    Async views must pass ``asynchronous=True``: Django reads the whole of
+    a synchronous iterator into memory before serving it over ASGI.
+    """
+    stream = _astream if asynchronous else _stream
+    # The rows are read after the view has returned, so pin the database
+    # the view's reads were routed to
+    queryset = queryset.using(queryset.db)
+    return StreamingHttpResponse(
+        stream(payload or {}, list_key, queryset, serializer_class, chunk_size),
+        content_type='application/json',
+    )
@@ -0,0 +1,18 @@
+from types import ModuleType
+
+from django.test import override_settings
+from django.urls import include, path
+
+from activities.urls import api_urlpatterns
+
+
+# Puts every user on the default database, as most tests expect, also when
+# DATABASE_SHARD_URLS is set. The shards are covered by test_sharding.
+single_database = override_settings(DATABASE_SHARDS=['default'])
+
+
+def api_urlconf(async_reads):
+    """Return a URLconf module serving the API with sync or async reads."""
+    module = ModuleType(f"{__name__}.{'async' if async_reads else 'sync'}_urls")
+    module.urlpatterns = [path('api/', include(api_urlpatterns(async_reads)))]
+    return module
@@ -0,0 +1,95 @@
+from datetime import timedelta
+from io import StringIO
+
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import AccessToken
+
+from activities.models import Activity, ArchivedActivity
+from activities.tests import single_database
+
+
+# Without the statistics cache, which is only invalidated once a write
+# commits and so never within a TestCase
+@override_settings(ACTIVITY_ARCHIVE_DAYS=365, ACTIVITY_CACHE_ENABLED=False)
+@single_database
+class ArchiveReadTests(TestCase):
+    """Reads combine the Activity table and the archive when their range reaches it."""
+
+    def setUp(self):
+        self.user = User.objects.create_user('archivist', password='Archive-pw-2024')
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {AccessToken.for_user(self.user)}')
+        today = timezone.now().date()
+        for days_ago, duration in ((3, 30), (100, 40), (400, 50), (800, 60), (1200, 70)):
+            Activity.objects.create(
+                user=self.user, activity_type='running', duration=duration, distance=duration / 10,
+                date=today - timedelta(days=days_ago),
+            )
+        self.before = {
+            path: self.client.get(path).data
+            for path in ('/api/activities/?page_size=100', '/api/activities/summary/',
+                         '/api/activities/history/?days=3650', '/api/activities/records/')
+        }
+        call_command('archive_activities', stdout=StringIO())
+
+    def ids(self, response):
+        return [activity['id'] for activity in response.data['results']]
+
+    def test_archiving_moves_the_old_activities(self):
+        self.assertEqual(self.user.activities.count(), 2)
+        self.assertEqual(self.user.archived_activities.count(), 3)
+
+    def test_reads_are_unchanged_by_archiving(self):
+        for path, before in self.before.items():
+            with self.subTest(path=path):
+                self.assertEqual(self.client.get(path).data, before)
+
+    def test_recent_ranges_only_read_the_activity_table(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get('/api/activities/history/?days=30')
+        self.assertEqual(response.data['statistics']['total_activities'], 1)
+        self.assertFalse(any(ArchivedActivity._meta.db_table in query['sql'] for query in queries))
+
+    def test_cursor_pages_cross_into_the_archive(self):
+        pages = []
+        url = '/api/activities/?pagination=cursor&page_size=2&sort_by=duration'
+        while url:
+            response = self.client.get(url)
+            pages.append(self.ids(response))
+            url = response.data['next']
+        ordered = sorted(
+            list(self.user.activities.values_list('duration', 'id')) +
+            list(self.user.archived_activities.values_list('duration', 'id'))
+        )
+        self.assertEqual([pk for page in pages for pk in page], [pk for _, pk in ordered])
+
+    def test_user_activity_count_includes_the_archive(self):
+        self.assertEqual(self.client.get(f'/api/users/{self.user.pk}/').data['activities_count'], 5)
+
+    def test_archived_activities_can_be_read_updated_and_deleted(self):
+        archived = self.user.archived_activities.order_by('date').first()
+        self.assertEqual(self.client.get(f'/api/activities/{archived.pk}/').data['duration'], archived.duration)
+
+        response = self.client.put(f'/api/activities/{archived.pk}/', {
+            'activity_type': 'cycling', 'duration': 90, 'date': archived.date.isoformat(),
+        }, format='json')
+        self.assertEqual(response.status_code, 200, response.content)
+        # Written back to the Activity table, the archive command may move it again
+        self.assertFalse(ArchivedActivity.objects.filter(pk=archived.pk).exists())
+        self.assertEqual(Activity.objects.get(pk=archived.pk).duration, 90)
+
+        other = self.user.archived_activities.first()
+        self.assertEqual(self.client.delete(f'/api/activities/{other.pk}/').status_code, 204)
+        self.assertFalse(ArchivedActivity.objects.filter(pk=other.pk).exists())
+        self.assertEqual(self.client.get('/api/activities/summary/').data['total_activities'], 4)
+
+    def test_restore_moves_everything_back(self):
+        call_command('archive_activities', restore=True, stdout=StringIO())
+        self.assertEqual(self.user.activities.count(), 5)
+        self.assertFalse(ArchivedActivity.objects.exists())
@@ -0,0 +1,219 @@
+import asyncio
+import random
+from datetime import timedelta
+
+from asgiref.sync import async_to_sync
+from django.contrib.auth.models import User
+from django.core.asgi import get_asgi_application
+from django.core.cache import caches
+from django.db import DEFAULT_DB_ALIAS
+from django.test import AsyncClient, Client, TestCase, override_settings
+from django.urls import resolve
+from django.utils import timezone
+from rest_framework_simplejwt.tokens import AccessToken
+
+from activities.cache import get_data_version, get_last_modified
+from activities.models import Activity, ActivityDailyRollup, ActivityStats, LeaderboardEntry
+from activities.tests import api_urlconf, single_database
+
+
+# Requests sent to both the sync and the async views, formatted with the
+# ids of the seeded data. Every response must be identical.
+CASES = [
+    '/api/activities/',
+    '/api/activities/?activity_type=running&sort_by=-duration&page=2',
+    '/api/activities/?page=999',
+    '/api/activities/?pagination=cursor&sort_by=calories_burned&page_size=5',
+    '/api/activities/{activity}/',
+    '/api/activities/{other_activity}/',
+    '/api/activities/not-an-id/',
+    '/api/activities/history/',
+    '/api/activities/history/?days=3650&sort_by=-duration&page=2',
+    '/api/activities/history/?days=3650&pagination=cursor&page_size=5',
+    '/api/activities/history/?days=3650&stream=true',
+    '/api/activities/history/?start_date=2020-01-01',
+    '/api/activities/history/?days=abc',
+    '/api/activities/summary/',
+    '/api/activities/summary/?start_date=2024-01-01&end_date=2024-12-31',
+    '/api/activities/summary/?start_date=2024-01-01&end_date=bad',
+    '/api/activities/trends/',
+    '/api/activities/trends/?period=monthly&months=24',
+    '/api/activities/trends/?period=hourly',
+    '/api/activities/trends/?period=yearly&years=999999',
+]
+# Headers that must match as well as the status and the body
+COMPARED_HEADERS = ['Content-Type', 'ETag', 'Last-Modified', 'Allow', 'Vary', 'WWW-Authenticate']
+# Endpoints hit at once by the concurrency test
+CONCURRENT_PATHS = [
+    ('/api/activities/summary/', ''),
+    ('/api/activities/trends/', 'period=daily&days=30'),
+    ('/api/activities/history/', 'days=365'),
+    ('/api/activities/', 'sort_by=-duration'),
+]
+
+
+SYNC_URLS = api_urlconf(async_reads=False)
+ASYNC_URLS = api_urlconf(async_reads=True)
+
+
+@override_settings(ACTIVITY_CACHE_ENABLED=True)
+@single_database
+class AsyncViewTests(TestCase):
+    """
+    The async read views return the same responses as the sync ones, and
+    one ASGI application serves many of them at once.
+    """
+
+    CONCURRENCY = 100
+
+    @classmethod
+    def setUpTestData(cls):
+        rng = random.Random(0)
+        today = timezone.now().date()
+        types = [choice[0] for choice in Activity.ACTIVITY_TYPES]
+        cls.users = [User.objects.create(username=f'async-{index}') for index in range(2)]
+        Activity.objects.bulk_create([
+            Activity(
+                user=user,
+                activity_type=rng.choice(types),
+                duration=rng.randint(1, 180),
+                distance=rng.choice([None, round(rng.uniform(0.5, 40), 2)]),
+                calories_burned=rng.choice([None, rng.randint(50, 1500)]),
+                notes=rng.choice(['', 'Intervals', 'Café ✓']),
+                date=today - timedelta(days=rng.randint(0, 3 * 365)),
+            )
+            for user in cls.users
+            for _ in range(120)
+        ])
+        ActivityDailyRollup.objects.db_manager(DEFAULT_DB_ALIAS).rebuild()
+        ActivityStats.objects.db_manager(DEFAULT_DB_ALIAS).rebuild()
+        LeaderboardEntry.objects.rebuild()
+        user, other = cls.users
+        cls.ids = {
+            'activity': user.activities.values_list('id', flat=True).first(),
+            'other_activity': other.activities.values_list('id', flat=True).first(),
+        }
+        cls.headers = {'Authorization': f'Bearer {AccessToken.for_user(user)}'}
+
+    def setUp(self):
+        cache = caches['default']
+        cache.clear()
+        self.addCleanup(cache.clear)
+        for user in self.users:
+            get_data_version(user.pk)
+            get_last_modified(user.pk)
+        self.versions = cache.get_many([
+            key for user in self.users
+            for key in (f'activities:version:{user.pk}', f'activities:modified:{user.pk}')
+        ])
+
+    def reset_cache(self):
+        """
+        Empty the cache so statistics are computed by the view under test,
+        keeping the data versions so both views build the same ETags.
+        """
+        cache = caches['default']
+        cache.clear()
+        cache.set_many(self.versions, timeout=None)
+
+    def sync_get(self, url, headers):
+        with override_settings(ROOT_URLCONF=SYNC_URLS):
+            response = Client().get(url, headers=headers)
+            body = b''.join(response.streaming_content) if response.streaming else response.content
+        return response, body
+
+    def async_get(self, url, headers):
+        async def get():
+            response = await AsyncClient().get(url, headers=headers)
+            if response.streaming:
+                return response, b''.join([chunk async for chunk in response.streaming_content])
+            return response, response.content
+
+        with override_settings(ROOT_URLCONF=ASYNC_URLS):
+            return async_to_sync(get)()
+
+    def test_reads_resolve_to_async_views(self):
+        for case in ('/api/activities/', '/api/activities/summary/', '/api/activities/history/'):
+            with self.subTest(path=case):
+                self.assertTrue(asyncio.iscoroutinefunction(resolve(case, ASYNC_URLS).func))
+                self.assertFalse(asyncio.iscoroutinefunction(resolve(case, SYNC_URLS).func))
+
+    def test_responses_are_identical(self):
+        requests = [(case.format(**self.ids), self.headers) for case in CASES]
+        requests.append(('/api/activities/summary/', {}))
+        for url, headers in requests:
+            with self.subTest(url=url, authenticated=bool(headers)):
+                self.reset_cache()
+                expected, expected_body = self.sync_get(url, headers)
+                self.reset_cache()
+                actual, actual_body = self.async_get(url, headers)
+                self.assertEqual(actual.status_code, expected.status_code)
+                self.assertEqual(actual_body, expected_body)
+                for header in COMPARED_HEADERS:
+                    self.assertEqual(actual.get(header), expected.get(header), header)
+
+    def test_validators_are_honoured(self):
+        for case in CASES:
+            url = case.format(**self.ids)
+            expected, _ = self.sync_get(url, self.headers)
+            if expected.status_code != 200 or not expected.has_header('ETag'):
+                continue
+            with self.subTest(url=url):
+                actual, _ = self.async_get(url, dict(self.headers, **{'If-None-Match': expected['ETag']}))
+                self.assertEqual(actual.status_code, 304)
+
+    def test_writes_are_served_by_the_sync_views(self):
+        async def write():
+            client = AsyncClient()
+            created = await client.post('/api/activities/', {
+                'activity_type': 'running', 'duration': 30, 'date': timezone.now().date().isoformat(),
+            }, content_type='application/json', headers=self.headers)
+            deleted = await client.delete(f"/api/activities/{created.json()['id']}/", headers=self.headers)
+            not_allowed = await client.post('/api/activities/summary/', headers=self.headers)
+            return created, deleted, not_allowed
+
+        with override_settings(ROOT_URLCONF=ASYNC_URLS), self.captureOnCommitCallbacks(execute=True):
+            created, deleted, not_allowed = async_to_sync(write)()
+        self.assertEqual(created.status_code, 201, created.content[:300])
+        self.assertEqual(deleted.status_code, 204)
+        self.assertEqual(not_allowed.status_code, 405)
+        self.assertEqual(not_allowed['Allow'], 'GET, HEAD, OPTIONS')
+
+    def test_concurrent_requests_succeed(self):
+        application = get_asgi_application()
+        tokens = [str(AccessToken.for_user(user)) for user in self.users]
+
+        async def call(index):
+            path, query = CONCURRENT_PATHS[index % len(CONCURRENT_PATHS)]
+            scope = {
+                'type': 'http', 'asgi': {'version': '3.0'}, 'http_version': '1.1',
+                'method': 'GET', 'scheme': 'http', 'root_path': '',
+                'path': path, 'raw_path': path.encode(), 'query_string': query.encode(),
+                'headers': [
+                    (b'host', b'testserver'),
+                    (b'authorization', f'Bearer {tokens[index % len(tokens)]}'.encode()),
+                ],
+                'client': ('127.0.0.1', 50000 + index), 'server': ('testserver', 80),
+            }
+            messages = []
+            request_sent = asyncio.Event()
+
+            async def receive():
+                if request_sent.is_set():
+                    # Never disconnect while the response is being sent
+                    await asyncio.Event().wait()
+                request_sent.set()
+                return {'type': 'http.request', 'body': b'', 'more_body': False}
+
+            async def send(message):
+                messages.append(message)
+
+            await application(scope, receive, send)
+            return messages[0]['status'] if messages else None
+
+        async def call_all():
+            return await asyncio.gather(*(call(index) for index in range(self.CONCURRENCY)))
+
+        with override_settings(ROOT_URLCONF=ASYNC_URLS):
+            statuses = async_to_sync(call_all)()
+        self.assertEqual(statuses, [200] * self.CONCURRENCY)
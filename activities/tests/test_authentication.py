@@ -0,0 +1,53 @@
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import caches
+from django.test import TestCase, override_settings
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import AccessToken
+
+from activities.tests import single_database
+
+
+@single_database
+class CachedUserTests(TestCase):
+    """The user of an access token is cached only with a shared cache, and never outlives a change."""
+
+    def setUp(self):
+        self.user = User.objects.create_user('cached', password='Cached-pw-2024')
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {AccessToken.for_user(self.user)}')
+        self.cache = caches[settings.USER_CACHE_ALIAS]
+        self.cache.clear()
+        self.addCleanup(self.cache.clear)
+
+    def get(self):
+        return self.client.get('/api/activities/summary/').status_code
+
+    def save(self, user):
+        # The entry is dropped once the save commits
+        with self.captureOnCommitCallbacks(execute=True):
+            user.save()
+
+    @override_settings(USER_CACHE_ENABLED=True)
+    def test_deactivation_invalidates_the_cached_user(self):
+        self.assertEqual(self.get(), 200)
+        self.assertIsNotNone(self.cache.get(f'auth:user:{self.user.pk}'))
+        self.user.is_active = False
+        self.save(self.user)
+        self.assertIsNone(self.cache.get(f'auth:user:{self.user.pk}'))
+        self.assertEqual(self.get(), 401)
+
+    @override_settings(USER_CACHE_ENABLED=True)
+    def test_deletion_invalidates_the_cached_user(self):
+        self.assertEqual(self.get(), 200)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user.delete()
+        self.assertEqual(self.get(), 401)
+
+    @override_settings(USER_CACHE_ENABLED=False)
+    def test_users_are_read_from_the_database_without_a_shared_cache(self):
+        self.assertEqual(self.get(), 200)
+        self.assertIsNone(self.cache.get(f'auth:user:{self.user.pk}'))
+        # As done by another worker, or without signals
+        User.objects.filter(pk=self.user.pk).update(is_active=False)
+        self.assertEqual(self.get(), 401)
@@ -0,0 +1,122 @@
+from datetime import date, timedelta
+
+from django.contrib.auth.models import User
+from django.db import DEFAULT_DB_ALIAS
+from django.test import TestCase
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import AccessToken
+
+from activities.models import (
+    Activity, ActivityDailyRollup, ActivityStats, ActivityStreak, LeaderboardEntry, LeaderboardScore,
+)
+from activities.tests import single_database
+
+
+@single_database
+class BulkCreateTests(TestCase):
+    """POST /api/activities/bulk/ validates every item and inserts the valid ones together."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('syncer', password='Bulk-pw-2024')
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {AccessToken.for_user(self.user)}')
+
+    def post(self, items, mode=None):
+        path = '/api/activities/bulk/' if mode is None else f'/api/activities/bulk/?mode={mode}'
+        # The leaderboards are updated once the insert has committed
+        with self.captureOnCommitCallbacks(execute=True):
+            return self.client.post(path, items, format='json')
+
+    def item(self, day=1, **fields):
+        return {'activity_type': 'running', 'duration': 30, 'date': f'2024-03-{day:02}', **fields}
+
+    def test_atomic_mode_creates_nothing_if_an_item_is_invalid(self):
+        response = self.post([self.item(), self.item(duration=-5), self.item(distance=-1)])
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data['created'], 0)
+        self.assertEqual([error['index'] for error in response.data['errors']], [1, 2])
+        self.assertIn('duration', response.data['errors'][0]['errors'])
+        self.assertFalse(Activity.objects.exists())
+        self.assertFalse(ActivityDailyRollup.objects.exists())
+
+    def test_partial_mode_keeps_the_valid_items(self):
+        response = self.post([self.item(1), self.item(2, activity_type='rowing'), self.item(3)], mode='partial')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.data['created'], 2)
+        self.assertEqual([error['index'] for error in response.data['errors']], [1])
+        self.assertIn('activity_type', response.data['errors'][0]['errors'])
+        self.assertEqual(
+            [activity['date'] for activity in response.data['activities']], ['2024-03-01', '2024-03-03'],
+        )
+        self.assertEqual(
+            sorted(self.user.activities.values_list('date', flat=True)), [date(2024, 3, 1), date(2024, 3, 3)],
+        )
+
+    def test_partial_mode_without_valid_items_fails(self):
+        response = self.post([self.item(duration=0)], mode='partial')
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(Activity.objects.exists())
+
+    def test_the_number_of_items_is_capped(self):
+        response = self.post([self.item()] * 1001)
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data['error'], 'Cannot create more than 1000 activities per request')
+        self.assertFalse(Activity.objects.exists())
+
+        response = self.post([self.item(day % 28 + 1) for day in range(1000)])
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(self.user.activities.count(), 1000)
+
+    def test_invalid_requests(self):
+        for path, body in (
+            ('/api/activities/bulk/?mode=some', [self.item()]),
+            ('/api/activities/bulk/', []),
+            ('/api/activities/bulk/', self.item()),
+        ):
+            with self.subTest(path=path, body=body):
+                self.assertEqual(self.client.post(path, body, format='json').status_code, 400)
+
+    def test_derived_tables_match_a_rebuild(self):
+        # Existing activities on some of the imported days and next to them
+        for day, activity_type in ((2, 'running'), (3, 'cycling'), (10, 'running')):
+            with self.captureOnCommitCallbacks(execute=True):
+                Activity.objects.create(user=self.user, activity_type=activity_type, duration=20, distance=3.3,
+                                        date=date(2024, 3, day))
+        start = date(2024, 3, 1)
+        response = self.post([
+            {'activity_type': ('running', 'cycling', 'yoga')[index % 3], 'duration': 10 + index,
+             'distance': None if index % 4 == 0 else index / 10, 'calories_burned': 100 + index,
+             'date': (start + timedelta(days=index % 12)).isoformat()}
+            for index in range(40)
+        ])
+        self.assertEqual(response.status_code, 201)
+
+        def snapshot():
+            return (
+                sorted(ActivityDailyRollup.objects.values_list(
+                    'user_id', 'date', 'activity_type', 'activity_count', 'total_duration', 'total_distance',
+                    'distance_count', 'total_calories', 'calories_count',
+                )),
+                sorted(
+                    (stats.user_id, stats.current_streak_start, stats.current_streak_end, stats.longest_streak,
+                     stats.longest_streak_start, stats.longest_streak_end, sorted(stats.records.items()))
+                    for stats in ActivityStats.objects.all()
+                ),
+                sorted(ActivityStreak.objects.values_list('user_id', 'start_date', 'end_date', 'days')),
+                sorted(LeaderboardEntry.objects.values_list(
+                    'user_id', 'period', 'period_start', 'activity_type',
+                    'activity_count', 'total_duration', 'total_distance', 'total_calories',
+                )),
+                sorted(LeaderboardScore.objects.values_list(
+                    'period', 'period_start', 'activity_type', 'metric', 'total', 'users',
+                )),
+            )
+        incremental = snapshot()
+        ActivityDailyRollup.objects.db_manager(DEFAULT_DB_ALIAS).rebuild()
+        ActivityStats.objects.db_manager(DEFAULT_DB_ALIAS).rebuild()
+        LeaderboardEntry.objects.rebuild()
+        self.assertEqual(snapshot(), incremental)
+        self.assertEqual(self.user.activity_stats.longest_streak, 12)
@@ -0,0 +1,77 @@
+from datetime import date
+
+from django.contrib.auth.models import User
+from django.core.cache import caches
+from django.test import TestCase, override_settings
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import AccessToken
+
+from activities.cache import cache_stats, get_data_version
+from activities.models import Activity
+from activities.tests import single_database
+
+
+@override_settings(ACTIVITY_CACHE_ENABLED=True)
+@single_database
+class StatisticsCacheTests(TestCase):
+    """Cached statistics are served until a write bumps the user's data version."""
+
+    ENDPOINTS = {
+        'summary': '/api/activities/summary/',
+        'history': '/api/activities/history/?days=3650',
+        'trends': '/api/activities/trends/?period=yearly',
+    }
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('cacher', password='Cache-pw-2024')
+        cls.activity = Activity.objects.create(user=cls.user, activity_type='running', duration=30,
+                                               date=date(2024, 3, 1))
+
+    def setUp(self):
+        caches['default'].clear()
+        self.addCleanup(caches['default'].clear)
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {AccessToken.for_user(self.user)}')
+
+    def misses(self):
+        return {endpoint: cache_stats().get(endpoint, {}).get('misses', 0) for endpoint in self.ENDPOINTS}
+
+    def total_activities(self):
+        """Read every cached endpoint and return the summary's activity count."""
+        data = {endpoint: self.client.get(path).data for endpoint, path in self.ENDPOINTS.items()}
+        self.assertEqual(data['history']['statistics']['total_activities'], data['summary']['total_activities'])
+        return data['summary']['total_activities']
+
+    def write(self, method, path, data=None):
+        # The version is bumped once the write commits
+        with self.captureOnCommitCallbacks(execute=True):
+            response = getattr(self.client, method)(path, data, format='json')
+        self.assertLess(response.status_code, 300, response.content[:500])
+        return response
+
+    def test_reads_are_served_from_the_cache(self):
+        self.total_activities()
+        misses = self.misses()
+        self.assertEqual(self.total_activities(), 1)
+        self.assertEqual(self.misses(), misses)
+
+    def test_writes_bump_the_version_and_the_next_read_recomputes(self):
+        created = {'activity_type': 'cycling', 'duration': 45, 'date': '2024-03-02'}
+        writes = [
+            ('create', lambda: self.write('post', '/api/activities/', created), 2),
+            ('update', lambda: self.write('put', f'/api/activities/{self.activity.pk}/', {
+                'activity_type': 'yoga', 'duration': 60, 'date': '2024-03-03',
+            }), 2),
+            ('delete', lambda: self.write('delete', f'/api/activities/{self.activity.pk}/'), 1),
+            ('bulk', lambda: self.write('post', '/api/activities/bulk/', [created, created]), 3),
+        ]
+        self.total_activities()
+        for name, write, expected in writes:
+            with self.subTest(write=name):
+                version = get_data_version(self.user.pk)
+                misses = self.misses()
+                write()
+                self.assertNotEqual(get_data_version(self.user.pk), version)
+                self.assertEqual(self.total_activities(), expected)
+                self.assertEqual(self.misses(), {endpoint: count + 1 for endpoint, count in misses.items()})
@@ -0,0 +1,75 @@
+from datetime import date
+
+from django.contrib.auth.models import User
+from django.core.cache import caches
+from django.test import TestCase, override_settings
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import AccessToken
+
+from activities.models import Activity
+from activities.tests import single_database
+
+
+@override_settings(ACTIVITY_CACHE_ENABLED=True, USER_CACHE_ENABLED=False)
+@single_database
+class ConditionalReadTests(TestCase):
+    """Activity reads carry validators and answer 304 Not Modified until the activities change."""
+
+    PATHS = ('/api/activities/', '/api/activities/summary/', '/api/activities/history/?days=3650',
+             '/api/activities/trends/', '/api/activities/records/')
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('conditional', password='Conditional-pw-2024')
+        cls.activity = Activity.objects.create(user=cls.user, activity_type='running', duration=30,
+                                               date=date(2024, 3, 1))
+
+    def setUp(self):
+        # The data versions live in the cache
+        caches['default'].clear()
+        self.addCleanup(caches['default'].clear)
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {AccessToken.for_user(self.user)}')
+
+    def test_matching_etag_is_not_modified(self):
+        for path in self.PATHS + (f'/api/activities/{self.activity.pk}/',):
+            with self.subTest(path=path):
+                response = self.client.get(path)
+                self.assertEqual(response.status_code, 200)
+                self.assertIn('Last-Modified', response)
+                # Only the user is loaded: the view is not called
+                with self.assertNumQueries(1):
+                    response = self.client.get(path, HTTP_IF_NONE_MATCH=response['ETag'])
+                self.assertEqual(response.status_code, 304)
+                self.assertEqual(response.content, b'')
+
+    def test_matching_last_modified_is_not_modified(self):
+        response = self.client.get('/api/activities/summary/')
+        response = self.client.get('/api/activities/summary/', HTTP_IF_MODIFIED_SINCE=response['Last-Modified'])
+        self.assertEqual(response.status_code, 304)
+
+    def test_etags_differ_by_query(self):
+        first = self.client.get('/api/activities/?activity_type=running')['ETag']
+        self.assertNotEqual(self.client.get('/api/activities/?activity_type=cycling')['ETag'], first)
+
+    def test_etag_changes_after_a_write(self):
+        etags = {path: self.client.get(path)['ETag'] for path in self.PATHS}
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post('/api/activities/', {
+                'activity_type': 'yoga', 'duration': 20, 'date': '2024-03-02',
+            }, format='json')
+        self.assertEqual(response.status_code, 201)
+        for path, etag in etags.items():
+            with self.subTest(path=path):
+                response = self.client.get(path, HTTP_IF_NONE_MATCH=etag)
+                self.assertEqual(response.status_code, 200)
+                self.assertNotEqual(response['ETag'], etag)
+
+    @override_settings(ACTIVITY_CACHE_ENABLED=False)
+    def test_no_validators_without_the_cache(self):
+        for path in self.PATHS:
+            with self.subTest(path=path):
+                response = self.client.get(path, HTTP_IF_NONE_MATCH='*')
+                self.assertEqual(response.status_code, 200)
+                self.assertNotIn('ETag', response)
+                self.assertNotIn('Last-Modified', response)
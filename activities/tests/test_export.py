@@ -0,0 +1,94 @@
+import csv
+import io
+import json
+from datetime import date, timedelta
+
+from django.contrib.auth.models import User
+from django.db import DEFAULT_DB_ALIAS
+from django.test import TestCase, override_settings
+from django.utils import timezone
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import AccessToken
+
+from activities.archive import archive
+from activities.export import EXPORT_FIELDS
+from activities.models import Activity
+from activities.serializers import ActivitySerializer
+from activities.tests import single_database
+
+
+@override_settings(ACTIVITY_ARCHIVE_DAYS=365, ACTIVITY_CACHE_ENABLED=False)
+@single_database
+class ExportTests(TestCase):
+    """GET /api/activities/export/ streams the user's whole history as CSV or NDJSON."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('exporter')
+        today = timezone.now().date()
+        cls.activities = [
+            Activity.objects.create(user=cls.user, activity_type='running', duration=30, distance=5.25,
+                                    calories_burned=300, notes='Intervals, "hard"\nsecond line',
+                                    date=today - timedelta(days=1)),
+            Activity.objects.create(user=cls.user, activity_type='yoga', duration=45, notes='Café ✓',
+                                    date=today - timedelta(days=10)),
+            Activity.objects.create(user=cls.user, activity_type='cycling', duration=90, distance=40.0,
+                                    date=date(2020, 5, 17)),
+        ]
+        # The oldest one is only in the archive
+        archive([cls.activities[2]], DEFAULT_DB_ALIAS)
+        other = User.objects.create_user('other')
+        Activity.objects.create(user=other, activity_type='running', duration=10, date=today)
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {AccessToken.for_user(self.user)}')
+
+    def export(self, query):
+        response = self.client.get(f'/api/activities/export/?{query}')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        return response, b''.join(response.streaming_content).decode()
+
+    def expected(self, activities):
+        """The exported records, as the activity serializer renders the same fields."""
+        data = ActivitySerializer(activities, many=True).data
+        return [{field: item[field] for field in EXPORT_FIELDS} for item in json.loads(json.dumps(data))]
+
+    def test_csv(self):
+        response, body = self.export('output=csv')
+        self.assertEqual(response['Content-Type'], 'text/csv')
+        self.assertEqual(response['Content-Disposition'], 'attachment; filename="activities.csv"')
+        rows = list(csv.DictReader(io.StringIO(body, newline='')))
+        self.assertEqual(list(rows[0]), EXPORT_FIELDS)
+        expected = [
+            {field: '' if value is None else str(value) for field, value in record.items()}
+            for record in self.expected(self.activities)
+        ]
+        self.assertEqual(rows, expected)
+        # Notes with commas, quotes and newlines survive the round trip
+        self.assertEqual(rows[0]['notes'], 'Intervals, "hard"\nsecond line')
+
+    def test_ndjson(self):
+        response, body = self.export('output=ndjson')
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+        self.assertEqual(response['Content-Disposition'], 'attachment; filename="activities.ndjson"')
+        self.assertTrue(body.endswith('\n'))
+        records = [json.loads(line) for line in body.splitlines()]
+        self.assertEqual(records, self.expected(self.activities))
+
+    def test_csv_is_the_default(self):
+        response, body = self.export('')
+        self.assertEqual(response['Content-Type'], 'text/csv')
+        self.assertEqual(len(list(csv.DictReader(io.StringIO(body, newline='')))), len(self.activities))
+
+    def test_filters(self):
+        _, body = self.export('output=ndjson&days=30&activity_type=yoga')
+        self.assertEqual([json.loads(line)['id'] for line in body.splitlines()], [self.activities[1].pk])
+        _, body = self.export('output=csv&start_date=2020-01-01&end_date=2020-12-31')
+        self.assertEqual([row['id'] for row in csv.DictReader(io.StringIO(body))], [str(self.activities[2].pk)])
+
+    def test_invalid_parameters(self):
+        for query in ('output=xml', 'days=0', 'start_date=yesterday'):
+            with self.subTest(query=query):
+                self.assertEqual(self.client.get(f'/api/activities/export/?{query}').status_code, 400)
@@ -0,0 +1,113 @@
+from datetime import date
+
+from django.contrib.auth.models import User
+from django.test import TestCase
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import AccessToken
+
+from activities.models import Activity, LeaderboardEntry, LeaderboardScore
+from activities.tests import single_database
+
+
+@single_database
+class LeaderboardTests(TestCase):
+    """The leaderboards follow activity writes and rank users by their totals."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.users = [User.objects.create_user(f'runner-{index}', password='Leaderboard-pw-2024') for index in range(4)]
+
+    def setUp(self):
+        self.client = self.client_for(self.users[0])
+
+    def client_for(self, user):
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION=f'Bearer {AccessToken.for_user(user)}')
+        return client
+
+    def create(self, user, duration, day=date(2024, 5, 8), activity_type='running', distance=None):
+        # Entries are updated once the activity's transaction commits
+        with self.captureOnCommitCallbacks(execute=True):
+            return Activity.objects.create(
+                user=user, activity_type=activity_type, duration=duration, distance=distance, date=day,
+            )
+
+    def snapshot(self):
+        return (
+            sorted(LeaderboardEntry.objects.values_list(
+                'user_id', 'period', 'period_start', 'activity_type',
+                'activity_count', 'total_duration', 'total_distance', 'total_calories',
+            )),
+            sorted(LeaderboardScore.objects.values_list(
+                'period', 'period_start', 'activity_type', 'metric', 'total', 'users',
+            )),
+        )
+
+    def board(self, path='/api/leaderboards/', **params):
+        params = {'activity_type': 'running', 'date': '2024-05-08', **params}
+        response = self.client.get(path, params)
+        self.assertEqual(response.status_code, 200, response.content)
+        return response.data
+
+    def test_top_users_share_ranks_on_ties(self):
+        for user, duration in zip(self.users, (30, 50, 30, 10)):
+            self.create(user, duration)
+        results = self.board()['results']
+        self.assertEqual(
+            [(result['rank'], result['user_id'], result['value']) for result in results],
+            [(1, self.users[1].pk, 50), (2, self.users[0].pk, 30), (2, self.users[2].pk, 30),
+             (4, self.users[3].pk, 10)],
+        )
+        self.assertEqual(len(self.board(limit=2)['results']), 2)
+
+    def test_rank_of_a_user(self):
+        for user, duration in zip(self.users[:3], (30, 50, 30)):
+            self.create(user, duration)
+        self.assertEqual(self.board('/api/leaderboards/rank/')['rank'], 2)
+        self.assertEqual(self.board('/api/leaderboards/rank/', user_id=self.users[1].pk)['rank'], 1)
+        absent = self.board('/api/leaderboards/rank/', user_id=self.users[3].pk)
+        self.assertEqual((absent['rank'], absent['value']), (None, 0))
+
+    def test_periods_and_metrics(self):
+        self.create(self.users[0], 30, day=date(2024, 5, 6), distance=5.25)
+        self.create(self.users[0], 20, day=date(2024, 5, 20), distance=2.5)
+        weekly = self.board(metric='distance')
+        self.assertEqual(weekly['period_start'], '2024-05-06')
+        self.assertEqual(weekly['results'][0]['value'], 5.25)
+        monthly = self.board(period='monthly')
+        self.assertEqual(monthly['period_start'], '2024-05-01')
+        self.assertEqual(monthly['results'][0]['value'], 50)
+
+    def test_invalid_parameters(self):
+        for params in ({'activity_type': 'curling'}, {'period': 'daily'}, {'metric': 'steps'},
+                       {'date': '08/05/2024'}, {'limit': 0}):
+            with self.subTest(params=params):
+                self.assertEqual(self.client.get('/api/leaderboards/', {'activity_type': 'running', **params})
+                                 .status_code, 400)
+
+    def test_updates_and_deletes_match_a_rebuild(self):
+        activities = [self.create(user, 10 * (index + 1)) for index, user in enumerate(self.users)]
+        self.create(self.users[0], 15, day=date(2024, 4, 30))
+        moved = activities[1]
+        moved.date = date(2024, 6, 3)
+        moved.activity_type = 'cycling'
+        with self.captureOnCommitCallbacks(execute=True):
+            moved.save()
+        with self.captureOnCommitCallbacks(execute=True):
+            activities[2].delete()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client_for(self.users[3]).post('/api/activities/bulk/', [
+                {'activity_type': 'running', 'duration': 10 + day, 'date': f'2024-05-{day:02}'} for day in range(1, 15)
+            ], format='json')
+        incremental = self.snapshot()
+        LeaderboardEntry.objects.rebuild()
+        self.assertEqual(self.snapshot(), incremental)
+
+    def test_deleted_users_leave_the_scores(self):
+        for user, duration in zip(self.users[:2], (30, 50)):
+            self.create(user, duration)
+        self.users[1].delete()
+        self.assertEqual(self.board('/api/leaderboards/rank/')['rank'], 1)
+        incremental = self.snapshot()
+        LeaderboardEntry.objects.rebuild()
+        self.assertEqual(self.snapshot(), incremental)
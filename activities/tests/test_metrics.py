@@ -0,0 +1,77 @@
+import os
+import tempfile
+
+from django.test import TestCase, override_settings
+from rest_framework.test import APIClient
+
+from activities import metrics
+from activities.tests import single_database
+
+
+@single_database
+class MetricsTests(TestCase):
+    """Metrics are summed over the flushes of every process and rendered for Prometheus."""
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        settings = override_settings(
+            METRICS_ENABLED=True, METRICS_STORE=os.path.join(directory.name, 'metrics.sqlite3'), METRICS_TOKEN='',
+        )
+        settings.enable()
+        self.addCleanup(settings.disable)
+        metrics._pending.clear()
+        # Nothing recorded here may be flushed to the default store later
+        self.addCleanup(metrics._pending.clear)
+
+    def samples(self):
+        return {
+            line.rsplit(' ', 1)[0]: float(line.rsplit(' ', 1)[1])
+            for line in metrics.render().splitlines()
+            if not line.startswith('#')
+        }
+
+    def test_counters_add_up_across_flushes(self):
+        metrics.record_request('activity-list', 'GET', 200, 0.02, 3, 0.001)
+        # Another process flushing its own increments to the same store
+        metrics.flush()
+        metrics.record_request('activity-list', 'GET', 200, 0.3, 5, 0.002)
+        metrics.record_request('activity-list', 'BREW', 500, 0.03, 1, 0.0)
+        samples = self.samples()
+        self.assertEqual(samples['http_requests_total{view="activity-list",method="GET",status="200"}'], 2)
+        self.assertEqual(samples['http_requests_total{view="activity-list",method="other",status="500"}'], 1)
+        self.assertEqual(samples['http_request_errors_total{view="activity-list",method="other"}'], 1)
+        self.assertEqual(samples['db_queries_total{view="activity-list"}'], 9)
+
+    def test_histogram_buckets_are_cumulative(self):
+        for duration in (0.003, 0.02, 0.3, 20):
+            metrics.observe('http_request_duration_seconds', duration, 'activity-list', 'GET')
+        samples = self.samples()
+        series = 'http_request_duration_seconds_bucket{view="activity-list",method="GET",le="%s"}'
+        self.assertEqual(samples[series % '0.005'], 1)
+        self.assertEqual(samples[series % '0.025'], 2)
+        self.assertEqual(samples[series % '0.5'], 3)
+        self.assertEqual(samples[series % '10.0'], 3)
+        self.assertEqual(samples[series % '+Inf'], 4)
+        self.assertEqual(samples['http_request_duration_seconds_count{view="activity-list",method="GET"}'], 4)
+
+    def test_label_values_are_escaped(self):
+        metrics.increment('cache_requests_total', 'say "hi"\\\n', 'hit')
+        self.assertIn('cache_requests_total{endpoint="say \\"hi\\"\\\\\\n",result="hit"} 1', metrics.render())
+
+    def test_requests_are_recorded_by_view_name(self):
+        # Unauthenticated, so answered with 401
+        APIClient().get('/api/')
+        response = self.client.get('/metrics')
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('http_requests_total{view="api-root",method="GET",status="401"} 1', response.content.decode())
+
+    def test_endpoint_token(self):
+        with override_settings(METRICS_TOKEN='scrape-token'):
+            self.assertEqual(self.client.get('/metrics').status_code, 401)
+            response = self.client.get('/metrics', HTTP_AUTHORIZATION='Bearer scrape-token')
+            self.assertEqual(response.status_code, 200)
+
+    @override_settings(METRICS_ENABLED=False)
+    def test_endpoint_is_hidden_when_disabled(self):
+        self.assertEqual(self.client.get('/metrics').status_code, 404)
@@ -0,0 +1,82 @@
+from datetime import date
+from urllib.parse import parse_qs, urlparse
+
+from django.contrib.auth.models import User
+from django.db.models import F
+from django.test import TestCase
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import AccessToken
+
+from activities.models import Activity
+from activities.tests import single_database
+
+
+@single_database
+class KeysetPaginationTests(TestCase):
+    """Cursor pages cover every activity once, in order, NULLs and ties included."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('pager', password='Pagination-pw-2024')
+        # Few distinct values, so that most rows tie on the sort field and
+        # several on the date as well
+        for index in range(23):
+            Activity.objects.create(
+                user=cls.user,
+                activity_type='running',
+                duration=(10, 20, 20)[index % 3],
+                calories_burned=(None, 100, 100, None, 250)[index % 5],
+                date=date(2024, 5, 1 + index % 4),
+            )
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {AccessToken.for_user(self.user)}')
+
+    def expected(self, sort_by):
+        field = sort_by.lstrip('-')
+        descending = sort_by.startswith('-')
+        keys = [field] + [key for key in ('date', 'created_at', 'id') if key != field]
+        ordering = [F(key).desc() if descending else F(key).asc() for key in keys]
+        return list(Activity.objects.filter(user=self.user).order_by(*ordering).values_list('id', flat=True))
+
+    def walk(self, url, link):
+        pages = []
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            pages.append([activity['id'] for activity in response.data['results']])
+            url = response.data[link]
+        return pages
+
+    def test_pages_forward_and_back(self):
+        for sort_by in ('-date', 'date', 'calories_burned', '-calories_burned', 'duration', '-duration'):
+            with self.subTest(sort_by=sort_by):
+                pages = self.walk(f'/api/activities/?pagination=cursor&page_size=4&sort_by={sort_by}', 'next')
+                self.assertEqual([pk for page in pages for pk in page], self.expected(sort_by))
+                self.assertEqual([len(page) for page in pages], [4, 4, 4, 4, 4, 3])
+
+                # Going back from the last page gives the same pages
+                last = self.client.get(
+                    f'/api/activities/?pagination=cursor&page_size=4&sort_by={sort_by}'
+                )
+                for _ in range(len(pages) - 1):
+                    last = self.client.get(last.data['next'])
+                back = self.walk(last.data['previous'], 'previous')
+                self.assertEqual(back, pages[-2::-1])
+
+    def test_filtered_pages(self):
+        Activity.objects.create(user=self.user, activity_type='yoga', duration=5, date=date(2024, 5, 2))
+        pages = self.walk('/api/activities/?pagination=cursor&page_size=1&activity_type=yoga', 'next')
+        self.assertEqual(len(pages), 1)
+
+    def test_invalid_cursors(self):
+        first = self.client.get('/api/activities/?pagination=cursor&page_size=4&sort_by=duration')
+        cursor = parse_qs(urlparse(first.data['next']).query)['cursor'][0]
+        for url in (
+            '/api/activities/?pagination=cursor&cursor=not-a-cursor',
+            # A cursor is only valid for the ordering it was issued for
+            f'/api/activities/?pagination=cursor&sort_by=-duration&cursor={cursor}',
+        ):
+            with self.subTest(url=url):
+                self.assertEqual(self.client.get(url).status_code, 404)
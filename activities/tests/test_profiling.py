@@ -0,0 +1,81 @@
+import json
+import re
+from datetime import date
+
+from asgiref.sync import async_to_sync
+from django.contrib.auth.models import User
+from django.db import connection
+from django.test import AsyncClient, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import AccessToken
+
+from activities.models import Activity
+from activities.tests import single_database
+
+
+SERVER_TIMING = re.compile(
+    r'db;dur=(?P<db>[\d.]+);desc="(?P<queries>\d+) queries", view;dur=(?P<view>[\d.]+), '
+    r'render;dur=(?P<render>[\d.]+), total;dur=(?P<total>[\d.]+)$'
+)
+
+
+@override_settings(ACTIVITY_CACHE_ENABLED=False, USER_CACHE_ENABLED=False)
+@single_database
+class RequestProfilingTests(TestCase):
+    """RequestProfilingMiddleware adds a Server-Timing header and a log line to profiled requests."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('profiled')
+        Activity.objects.create(user=cls.user, activity_type='running', duration=30, date=date(2024, 3, 1))
+        cls.headers = {'HTTP_AUTHORIZATION': f'Bearer {AccessToken.for_user(cls.user)}'}
+
+    def get(self, path='/api/activities/summary/'):
+        # A new client loads the middleware with the current settings
+        with CaptureQueriesContext(connection) as queries:
+            response = APIClient().get(path, **self.headers)
+        self.assertEqual(response.status_code, 200)
+        return response, len(queries)
+
+    @override_settings(REQUEST_PROFILING=True)
+    def test_profiled_requests_are_timed(self):
+        with self.assertLogs('activities.profiling', 'INFO') as logs:
+            response, queries = self.get()
+        timing = SERVER_TIMING.match(response['Server-Timing'])
+        self.assertIsNotNone(timing, response['Server-Timing'])
+        self.assertEqual(int(timing['queries']), queries)
+        self.assertGreater(float(timing['total']), 0)
+        self.assertLessEqual(float(timing['view']) + float(timing['render']), float(timing['total']))
+
+        record = json.loads(logs.records[0].getMessage())
+        self.assertEqual(
+            {key: record[key] for key in ('method', 'path', 'status', 'user_id', 'queries', 'sampled')},
+            {'method': 'GET', 'path': '/api/activities/summary/', 'status': 200, 'user_id': self.user.pk,
+             'queries': queries, 'sampled': False},
+        )
+
+    @override_settings(REQUEST_PROFILING=False, REQUEST_PROFILING_SAMPLE_RATE=1.0)
+    def test_sampled_requests_are_marked(self):
+        with self.assertLogs('activities.profiling', 'INFO') as logs:
+            response, _ = self.get()
+        self.assertIn('Server-Timing', response)
+        self.assertTrue(json.loads(logs.records[0].getMessage())['sampled'])
+
+    @override_settings(REQUEST_PROFILING=False, REQUEST_PROFILING_SAMPLE_RATE=0.0)
+    def test_requests_are_not_profiled_by_default(self):
+        with self.assertNoLogs('activities.profiling'):
+            response, _ = self.get()
+        self.assertNotIn('Server-Timing', response)
+
+    @override_settings(REQUEST_PROFILING=True)
+    def test_async_requests_are_timed(self):
+        async def get():
+            return await AsyncClient().get(
+                '/api/activities/summary/', headers={'Authorization': self.headers['HTTP_AUTHORIZATION']},
+            )
+
+        with self.assertLogs('activities.profiling', 'INFO'):
+            response = async_to_sync(get)()
+        self.assertEqual(response.status_code, 200)
+        self.assertRegex(response['Server-Timing'], SERVER_TIMING)
@@ -0,0 +1,252 @@
+import random
+from contextlib import ExitStack
+from datetime import date, timedelta
+
+from django.contrib.auth.models import User
+from django.core.cache import caches
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.db.models.sql.constants import GET_ITERATOR_CHUNK_SIZE
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import AccessToken, RefreshToken
+
+from activities.models import Activity, ActivityDailyRollup, ActivityStats, LeaderboardEntry
+from activities.tests import single_database
+
+
+PASSWORD = 'budget-Check-pw-2024'
+
+# The random activities are between WRITTEN_DAYS and WRITTEN_DAYS +
+# RANDOM_DAYS days old. The activities the write endpoints change are more
+# recent and of a type the random ones never have, so that the streaks and
+# records around them are the same in every data set.
+RANDOM_DAYS = 3 * 365
+WRITTEN_DAYS = 200
+WRITTEN_TYPE = 'other'
+
+# name -> (number of queries, method, path, request body)
+# Paths and bodies are formatted with the ids of the seeded data set, and
+# ``past[n]`` is the n-th of the last WRITTEN_DAYS days, today last.
+BUDGETS = {
+    'api-root': (1, 'get', '/api/', None),
+    'register': (3, 'post', '/api/register/', {'username': 'budget-register-{size}', 'password': PASSWORD}),
+    'token-obtain': (2, 'post', '/api/token/', {'username': '{username}', 'password': PASSWORD}),
+    'token-refresh': (4, 'post', '/api/token/refresh/', {'refresh': '{refresh}'}),
+    'user-list': (3, 'get', '/api/users/', None),
+    'user-create': (4, 'post', '/api/users/', {'username': 'budget-create-{size}', 'password': PASSWORD}),
+    'user-detail': (2, 'get', '/api/users/{user}/', None),
+    'user-update': (3, 'patch', '/api/users/{user}/', {'first_name': 'Budget'}),
+    'user-activities': (4, 'get', '/api/users/{user}/activities/', None),
+    'user-activities-stream': (3, 'get', '/api/users/{user}/activities/?stream=true', None),
+    'activity-list': (3, 'get', '/api/activities/', None),
+    'activity-list-cursor': (2, 'get', '/api/activities/?pagination=cursor&sort_by=-duration', None),
+    'activity-create': (17, 'post', '/api/activities/', {
+        'activity_type': WRITTEN_TYPE, 'duration': 30, 'distance': 5.0, 'date': '{past[40]}',
+    }),
+    'activity-detail': (2, 'get', '/api/activities/{activity}/', None),
+    # Moves the activity out of the middle of the current streak
+    'activity-update': (27, 'put', '/api/activities/{activity}/', {
+        'activity_type': WRITTEN_TYPE, 'duration': 45, 'date': '{past[45]}',
+    }),
+    'activity-partial-update': (25, 'patch', '/api/activities/{activity}/', {
+        'activity_type': WRITTEN_TYPE, 'duration': 20, 'date': '{past[46]}',
+    }),
+    # Shortens the current streak
+    'activity-delete': (17, 'delete', '/api/activities/{deleted}/', None),
+    # Every imported day joins the runs of active days on either side
+    'activity-bulk': (18, 'post', '/api/activities/bulk/', [
+        {'activity_type': WRITTEN_TYPE, 'duration': 10 + index, 'date': f'{{past[{61 + 2 * index}]}}'}
+        for index in range(50)
+    ]),
+    'activity-history': (4, 'get', '/api/activities/history/?days=3650', None),
+    'activity-history-stream': (3, 'get', '/api/activities/history/?days=3650&stream=true', None),
+    'activity-summary': (2, 'get', '/api/activities/summary/', None),
+    'activity-trends': (2, 'get', '/api/activities/trends/?period=monthly&months=24', None),
+    'activity-export': (2, 'get', '/api/activities/export/', None),
+    'activity-records': (2, 'get', '/api/activities/records/', None),
+    'user-delete': (18, 'delete', '/api/users/{victim}/', None),
+    'leaderboard-top': (2, 'get', '/api/leaderboards/?activity_type=running&period=monthly', None),
+    'leaderboard-rank': (2, 'get', '/api/leaderboards/rank/?activity_type=running&period=monthly', None),
+    'admin-index': (3, 'get', '/admin/', None),
+    'admin-activity-changelist': (7, 'get', '/admin/activities/activity/', None),
+}
+
+# Endpoints that act as another seeded user than the main one
+ACTING_USER = {'user-delete': 'victim'}
+# Endpoints that need a logged in staff session instead of a JWT
+ADMIN_ENDPOINTS = {'admin-index', 'admin-activity-changelist'}
+# Endpoints that are called without credentials
+ANONYMOUS_ENDPOINTS = {'register', 'token-obtain', 'token-refresh', 'user-create'}
+# Endpoints that cascade to the acting user's activities. Django deletes
+# cascaded rows in chunks of GET_ITERATOR_CHUNK_SIZE, so one DELETE per
+# chunk beyond the first is expected and not counted against the budget.
+CASCADING_ENDPOINTS = {'user-delete'}
+
+
+# Query counts must not depend on the environment: archiving adds the
+# archive to record lookups, and cached statistics skip their queries.
+# The admin pages must render without a collectstatic manifest.
+@override_settings(
+    ACTIVITY_ARCHIVE_DAYS=0,
+    ACTIVITY_CACHE_ENABLED=False,
+    STATICFILES_STORAGE='django.contrib.staticfiles.storage.StaticFilesStorage',
+)
+@single_database
+class QueryBudgetTests(TestCase):
+    """
+    Every API and admin route runs exactly its budgeted number of queries,
+    on data sets of several sizes, so that an N+1 query or any other
+    growth with the data fails. Lower a budget when an endpoint gets
+    cheaper, and only raise one on purpose.
+    """
+
+    # (users, activities per user) of every data set. The larger one
+    # exceeds a page so that list endpoints render full pages.
+    SIZES = [(3, 5), (4, 150)]
+
+    def test_budgets(self):
+        for size in self.SIZES:
+            context = self.seed(*size)
+            for name, (budget, *_) in BUDGETS.items():
+                with self.subTest(endpoint=name, size=size):
+                    self.assertEqual(self.measure(name, context), budget)
+
+    def seed(self, users, activities_per_user):
+        """Create a data set and return the values used to build requests."""
+        rng = random.Random(users * activities_per_user)
+        today = timezone.now().date()
+        types = [choice[0] for choice in Activity.ACTIVITY_TYPES if choice[0] != WRITTEN_TYPE]
+        prefix = f'budget-{users}-{activities_per_user}'
+
+        user = User.objects.create_user(f'{prefix}-main', password=PASSWORD, is_staff=True, is_superuser=True)
+        victim = User.objects.create_user(f'{prefix}-victim', password=PASSWORD)
+        seeded = [user, victim] + [
+            User.objects.create_user(f'{prefix}-other-{index}', password=PASSWORD) for index in range(users - 2)
+        ]
+        Activity.objects.bulk_create([
+            Activity(
+                user=owner,
+                activity_type=rng.choice(types),
+                duration=rng.randint(1, 180),
+                distance=rng.choice([None, round(rng.uniform(0.5, 40), 2)]),
+                calories_burned=rng.choice([None, rng.randint(50, 1500)]),
+                date=today - timedelta(days=WRITTEN_DAYS + rng.randint(0, RANDOM_DAYS)),
+            )
+            for owner in seeded
+            for _ in range(activities_per_user)
+        ])
+
+        past = [today - timedelta(days=WRITTEN_DAYS - 1 - offset) for offset in range(WRITTEN_DAYS)]
+
+        def write(offset):
+            return Activity.objects.create(user=user, activity_type=WRITTEN_TYPE, duration=15, date=past[offset])
+
+        # A streak longer than any random one, so that the longest is the same too
+        for offset in range(20):
+            write(offset)
+        # Every other day, for the bulk import to fill in
+        for offset in range(60, 161, 2):
+            write(offset)
+        # The current streak, with the activity to update in its middle
+        # and the one to delete at its end
+        current = {offset: write(offset) for offset in range(185, 196)}
+        activity, deleted = current[190], current[195]
+
+        # bulk_create() leaves the derived tables to be rebuilt, as in seed_activities
+        user_ids = [owner.pk for owner in seeded]
+        ActivityDailyRollup.objects.db_manager(DEFAULT_DB_ALIAS).rebuild(user_ids=user_ids)
+        ActivityStats.objects.db_manager(DEFAULT_DB_ALIAS).rebuild(user_ids=user_ids)
+        LeaderboardEntry.objects.rebuild()
+        return {
+            'size': f'{users}-{activities_per_user}',
+            'activities_per_user': activities_per_user,
+            'users': {'user': user, 'victim': victim},
+            'user': user.pk,
+            'username': user.username,
+            'victim': victim.pk,
+            'activity': activity.pk,
+            'deleted': deleted.pk,
+            'refresh': str(RefreshToken.for_user(user)),
+            'past': [day.isoformat() for day in past],
+        }
+
+    def measure(self, name, context):
+        """Call one endpoint and return the number of queries it ran."""
+        _, method, path, body = BUDGETS[name]
+        client = APIClient()
+        acting = context['users'][ACTING_USER.get(name, 'user')]
+        if name in ADMIN_ENDPOINTS:
+            client.force_login(acting)
+        elif name not in ANONYMOUS_ENDPOINTS:
+            client.credentials(HTTP_AUTHORIZATION=f'Bearer {AccessToken.for_user(acting)}')
+
+        # Measure the real work rather than the user cache
+        caches['default'].clear()
+        caches['users'].clear()
+        with ExitStack() as stack:
+            captures = [stack.enter_context(CaptureQueriesContext(connections[alias])) for alias in connections]
+            # The leaderboards are updated once the activity's transaction
+            # has committed, so those queries are counted as well
+            stack.enter_context(self.captureOnCommitCallbacks(execute=True))
+            response = getattr(client, method)(self.fill(path, context), self.fill(body, context), format='json')
+            if response.streaming:
+                # As a WSGI server would, which also reads an async view's stream
+                b''.join(response)
+        self.assertLess(response.status_code, 400, None if response.streaming else response.content[:500])
+        queries = sum(len(capture) for capture in captures)
+        if name in CASCADING_ENDPOINTS:
+            return queries - (context['activities_per_user'] - 1) // GET_ITERATOR_CHUNK_SIZE
+        return queries
+
+    def fill(self, value, context):
+        """Format the placeholders in a path or request body."""
+        if value is None:
+            return None
+        if isinstance(value, str):
+            return value.format(**context)
+        if isinstance(value, list):
+            return [self.fill(item, context) for item in value]
+        if isinstance(value, dict):
+            return {key: self.fill(item, context) for key, item in value.items()}
+        return value
+
+
+@override_settings(ACTIVITY_ARCHIVE_DAYS=0, ACTIVITY_CACHE_ENABLED=False)
+@single_database
+class BulkImportQueryCountTests(TestCase):
+    """
+    A bulk import updates the rollups, streaks, records and leaderboards
+    in the same number of queries whatever the number of days its
+    activities are on.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('writer', password='Query-count-pw-2024')
+        # Creates the user's stats row, which the first write would otherwise add
+        Activity.objects.create(user=cls.user, activity_type='yoga', duration=15, date=date(2010, 1, 1))
+
+    def test_bulk_import_over_many_days(self):
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION=f'Bearer {AccessToken.for_user(self.user)}')
+        counts = []
+        # 100 activities, so that each table's rows are inserted with one
+        # statement: bulk_create() splits larger inserts by the database's
+        # parameter limit
+        for index, days in enumerate((1, 30, 100)):
+            start = date(2020, 1, 1) + timedelta(days=200 * index)
+            activities = [
+                {'activity_type': 'running', 'duration': 10 + number, 'distance': 1.5,
+                 'date': (start + timedelta(days=number % days)).isoformat()}
+                for number in range(100)
+            ]
+            caches['users'].clear()
+            with CaptureQueriesContext(connections[DEFAULT_DB_ALIAS]) as queries:
+                with self.captureOnCommitCallbacks(execute=True):
+                    response = client.post('/api/activities/bulk/', activities, format='json')
+            self.assertEqual(response.status_code, 201, response.content[:500])
+            counts.append(len(queries))
+        self.assertEqual(counts, [counts[0]] * 3)
+        self.assertLessEqual(counts[0], BUDGETS['activity-bulk'][0])
@@ -0,0 +1,187 @@
+import json
+import random
+from datetime import timedelta
+from unittest import skipUnless
+
+from django.contrib.auth.models import User
+from django.db import DEFAULT_DB_ALIAS, connection
+from django.test import TestCase, override_settings
+from django.urls import resolve
+from django.utils import timezone
+from rest_framework.test import APIRequestFactory, force_authenticate
+
+from activities.archive import archive, archive_cutoff
+from activities.models import Activity, ActivityDailyRollup, ActivityStats, ArchivedActivity, LeaderboardEntry
+from activities.tests import api_urlconf, single_database
+
+
+# Endpoints whose queries are checked, one entry per distinct access path.
+# The second item allows a temporary sort: history, and the list when given
+# one, is bounded by a date range, and when it is sorted by another column
+# the planner may rightly prefer to sort that range over walking a whole
+# per-user sort index.
+ENDPOINTS = [
+    ('/api/activities/', False),
+    ('/api/activities/?activity_type=running', False),
+    ('/api/activities/?sort_by=date', False),
+    ('/api/activities/?sort_by=duration', False),
+    ('/api/activities/?sort_by=-duration', False),
+    ('/api/activities/?sort_by=calories_burned', False),
+    ('/api/activities/?sort_by=-calories_burned', False),
+    ('/api/activities/?sort_by=created_at', False),
+    ('/api/activities/?sort_by=-created_at', False),
+    ('/api/activities/?activity_type=running&sort_by=-duration', False),
+    ('/api/activities/?activity_type=running&sort_by=calories_burned', False),
+    ('/api/activities/?days=90&sort_by=-duration', True),
+    ('/api/activities/history/', False),
+    ('/api/activities/history/?days=365&activity_type=running', False),
+    ('/api/activities/history/?start_date=2020-01-01&end_date=2020-12-31', False),
+    ('/api/activities/history/?days=365&sort_by=-duration', True),
+    ('/api/activities/history/?days=365&sort_by=calories_burned', True),
+    ('/api/activities/history/?days=365&activity_type=running&sort_by=duration', True),
+    ('/api/activities/summary/', False),
+    ('/api/activities/summary/?start_date=2020-01-01&end_date=2020-12-31', False),
+    ('/api/activities/trends/?period=daily', False),
+    ('/api/activities/trends/?period=weekly', False),
+    ('/api/activities/trends/?period=monthly', False),
+    ('/api/activities/trends/?period=yearly', False),
+    ('/api/activities/records/', False),
+    ('/api/leaderboards/?activity_type=running&period=monthly&metric=distance', False),
+    ('/api/leaderboards/rank/?activity_type=running&period=monthly&metric=calories', False),
+]
+
+# The views are called directly, so they must be the sync ones whatever
+# ASYNC_READ_VIEWS says. The async views run the same queries.
+SYNC_URLS = api_urlconf(async_reads=False)
+
+# Tables that must always be reached through an index
+CHECKED_TABLES = [
+    'activities_activity', 'activities_archivedactivity', 'activities_activitydailyrollup',
+    'activities_activitystats', 'activities_leaderboardentry', 'activities_leaderboardscore',
+]
+
+
+@skipUnless(connection.vendor in ('sqlite', 'postgresql'), 'Query plans are only checked on SQLite and PostgreSQL')
+@override_settings(ACTIVITY_ARCHIVE_DAYS=0, ACTIVITY_CACHE_ENABLED=False, ALLOWED_HOSTS=['testserver'])
+@single_database
+class QueryPlanTests(TestCase):
+    """
+    No query of the activity endpoints scans a whole table or sorts its
+    result in a temporary structure.
+    """
+
+    # Enough users for a per-user filter to be selective, or the planner
+    # would rightly prefer a full scan
+    USERS = 20
+    ACTIVITIES_PER_USER = 200
+
+    @classmethod
+    def setUpTestData(cls):
+        rng = random.Random(0)
+        today = timezone.now().date()
+        types = [choice[0] for choice in Activity.ACTIVITY_TYPES]
+        users = [User.objects.create(username=f'query-plan-{index}') for index in range(cls.USERS)]
+        Activity.objects.bulk_create([
+            Activity(
+                user=user,
+                activity_type=rng.choice(types),
+                duration=rng.randint(1, 180),
+                distance=rng.choice([None, round(rng.uniform(0.5, 40), 2)]),
+                calories_burned=rng.choice([None, rng.randint(50, 1500)]),
+                date=today - timedelta(days=rng.randint(0, 3 * 365)),
+            )
+            for user in users
+            for _ in range(cls.ACTIVITIES_PER_USER)
+        ])
+        ActivityDailyRollup.objects.db_manager(DEFAULT_DB_ALIAS).rebuild()
+        ActivityStats.objects.db_manager(DEFAULT_DB_ALIAS).rebuild()
+        LeaderboardEntry.objects.rebuild()
+        cutoff = archive_cutoff()
+        if cutoff is not None:
+            archive(list(Activity.objects.filter(date__lt=cutoff)), DEFAULT_DB_ALIAS)
+        # Give the planner the same statistics it would have in production
+        with connection.cursor() as cursor:
+            for table in CHECKED_TABLES:
+                cursor.execute(f'ANALYZE {table}')
+        cls.user = users[0]
+
+    def test_archive_is_seeded(self):
+        self.assertEqual(ArchivedActivity.objects.exists(), archive_cutoff() is not None)
+
+    def test_queries_use_indexes(self):
+        for path, allow_sort in ENDPOINTS:
+            with self.subTest(path=path):
+                queries = self.capture_queries(path)
+                self.assertTrue(queries)
+                problems = [
+                    f'{problem}\n    {sql}'
+                    for sql, params in queries
+                    for kind, problem in self.check_plan(sql, params)
+                    if not (kind == 'sort' and allow_sort)
+                ]
+                self.assertEqual(problems, [])
+
+    def capture_queries(self, path):
+        """Run the view behind ``path`` and return its SELECTs."""
+        queries = []
+
+        def capture(execute, sql, params, many, context):
+            if sql.lstrip().upper().startswith('SELECT'):
+                queries.append((sql, params))
+            return execute(sql, params, many, context)
+
+        request = APIRequestFactory().get(path)
+        force_authenticate(request, user=self.user)
+        match = resolve(path.split('?')[0], SYNC_URLS)
+        with connection.execute_wrapper(capture):
+            response = match.func(request, *match.args, **match.kwargs)
+            response.render()
+            if response.streaming:
+                b''.join(response.streaming_content)
+        self.assertEqual(response.status_code, 200)
+        return queries
+
+    def check_plan(self, sql, params):
+        """
+        Return a ``(kind, description)`` pair for every problem in the plan
+        of one query, where kind is 'scan' or 'sort'.
+        """
+        with connection.cursor() as cursor:
+            if connection.vendor == 'sqlite':
+                cursor.execute(f'EXPLAIN QUERY PLAN {sql}', params)
+                return self.check_sqlite_plan([row[-1] for row in cursor.fetchall()])
+            # Disabling sequential scans makes the planner use any index it
+            # can, so a remaining Seq Scan means no usable index exists.
+            cursor.execute('SET LOCAL enable_seqscan = off')
+            cursor.execute(f'EXPLAIN (FORMAT JSON) {sql}', params)
+            plan = cursor.fetchone()[0]
+            cursor.execute('SET LOCAL enable_seqscan = on')
+        if isinstance(plan, str):
+            plan = json.loads(plan)
+        return self.check_postgresql_plan(plan[0]['Plan'])
+
+    def check_sqlite_plan(self, details):
+        problems = []
+        for detail in details:
+            words = detail.split()
+            if words[0] == 'SCAN' and words[1] in CHECKED_TABLES:
+                problems.append(('scan', f"full table scan: {detail}"))
+            if 'TEMP B-TREE' in detail and 'ORDER BY' in detail:
+                problems.append(('sort', f"temporary sort: {detail}"))
+        return problems
+
+    def check_postgresql_plan(self, node, parent=None):
+        problems = []
+        if node['Node Type'] == 'Seq Scan' and node.get('Relation Name') in CHECKED_TABLES:
+            problems.append(('scan', f"full table scan on {node['Relation Name']}"))
+        # Sorting the input of a GROUP BY is fine, sorting the result is not
+        if node['Node Type'] == 'Sort' and (parent is None or parent['Node Type'] != 'Aggregate'):
+            problems.append(('sort', f"temporary sort on {', '.join(node.get('Sort Key', []))}"))
+        for child in node.get('Plans', []):
+            problems.extend(self.check_postgresql_plan(child, node))
+        return problems
+
+
+@override_settings(ACTIVITY_ARCHIVE_DAYS=365)
+class ArchivedQueryPlanTests(QueryPlanTests):
+    """The same, with the activities older than a year in the archive."""
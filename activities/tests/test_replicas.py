@@ -0,0 +1,94 @@
+from datetime import date
+from unittest import mock
+
+from django.contrib.auth.models import User
+from django.core.cache import caches
+from django.test import TestCase, override_settings
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import AccessToken
+
+from activities import db
+from activities.db import ReplicaRouter, is_pinned, pin_to_primary, read_from_primary, read_from_replica
+from activities.models import Activity
+from activities.tests import single_database
+
+
+@override_settings(DATABASE_REPLICAS=['replica_1'], ACTIVITY_CACHE_ENABLED=False)
+@single_database
+class ReplicaRoutingTests(TestCase):
+    """Analytics reads go to a replica, except for a while after the user wrote."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('replicated')
+        cls.activity = Activity.objects.create(user=cls.user, activity_type='running', duration=30,
+                                               date=date(2024, 3, 1))
+
+    def setUp(self):
+        caches['default'].clear()
+        self.addCleanup(caches['default'].clear)
+        self.addCleanup(read_from_primary)
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {AccessToken.for_user(self.user)}')
+
+    def read_target(self, path):
+        """
+        Return the database the reads of ``path`` are routed to, None for
+        the primary. The queries themselves still run on the primary, as
+        the test databases have no replica.
+        """
+        targets = []
+
+        def record(user_id):
+            read_from_replica(user_id)
+            targets.append(db._read_replica.get())
+            read_from_primary()
+
+        with mock.patch('activities.views.read_from_replica', record):
+            response = self.client.get(path)
+        self.assertEqual(response.status_code, 200)
+        return targets[0] if targets else None
+
+    def test_router_follows_the_request(self):
+        router = ReplicaRouter()
+        read_from_replica(self.user.pk)
+        self.assertEqual(router.db_for_read(Activity), 'replica_1')
+        # Writes always go to the primary
+        self.assertIsNone(router.db_for_write(Activity))
+        pin_to_primary(self.user.pk)
+        read_from_replica(self.user.pk)
+        self.assertIsNone(router.db_for_read(Activity))
+
+    def test_analytics_reads_use_a_replica(self):
+        for path in ('/api/activities/', '/api/activities/summary/', '/api/activities/history/',
+                     '/api/activities/trends/', '/api/users/'):
+            with self.subTest(path=path):
+                self.assertEqual(self.read_target(path), 'replica_1')
+        # Not listed in replica_actions
+        self.assertIsNone(self.read_target(f'/api/activities/{self.activity.pk}/'))
+
+    def test_a_write_pins_the_next_reads_to_the_primary(self):
+        response = self.client.post('/api/activities/', {
+            'activity_type': 'yoga', 'duration': 20, 'date': '2024-03-02',
+        }, format='json')
+        self.assertEqual(response.status_code, 201)
+        self.assertTrue(is_pinned(self.user.pk))
+        for path in ('/api/activities/', '/api/activities/summary/', '/api/activities/history/'):
+            with self.subTest(path=path):
+                self.assertIsNone(self.read_target(path))
+        # Other users still read from the replicas
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {AccessToken.for_user(User.objects.create_user("x"))}')
+        self.assertEqual(self.read_target('/api/activities/summary/'), 'replica_1')
+
+    def test_failed_writes_do_not_pin(self):
+        response = self.client.post('/api/activities/', {'activity_type': 'yoga', 'duration': -1}, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(is_pinned(self.user.pk))
+        self.assertEqual(self.read_target('/api/activities/summary/'), 'replica_1')
+
+    @override_settings(DATABASE_REPLICAS=[])
+    def test_nothing_is_pinned_without_replicas(self):
+        pin_to_primary(self.user.pk)
+        self.assertFalse(is_pinned(self.user.pk))
+        read_from_replica(self.user.pk)
+        self.assertIsNone(ReplicaRouter().db_for_read(Activity))
@@ -0,0 +1,96 @@
+from datetime import date
+
+from django.contrib.auth.models import User
+from django.db import DEFAULT_DB_ALIAS
+from django.test import TestCase
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import AccessToken
+
+from activities.models import Activity, ActivityDailyRollup
+from activities.tests import single_database
+
+
+@single_database
+class DailyRollupTests(TestCase):
+    """The daily rollups follow every activity save and delete."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('roller', password='Rollup-pw-2024')
+
+    def rollups(self):
+        return {
+            (row.date, row.activity_type): (
+                row.activity_count, row.total_duration, row.total_distance, row.distance_count,
+                row.total_calories, row.calories_count,
+            )
+            for row in ActivityDailyRollup.objects.filter(user=self.user)
+        }
+
+    def create(self, **fields):
+        fields = {'activity_type': 'running', 'duration': 30, 'date': date(2024, 3, 1), **fields}
+        return Activity.objects.create(user=self.user, **fields)
+
+    def test_create_adds_to_the_day(self):
+        self.create(distance=5.0, calories_burned=300)
+        self.create(duration=20)
+        self.assertEqual(self.rollups(), {(date(2024, 3, 1), 'running'): (2, 50, 5000, 1, 300, 1)})
+
+    def test_update_moves_the_activity_to_its_new_day_and_type(self):
+        self.create(duration=10)
+        activity = self.create(distance=5.0)
+        activity.date = date(2024, 3, 2)
+        activity.activity_type = 'cycling'
+        activity.distance = 12.0
+        activity.save()
+        self.assertEqual(self.rollups(), {
+            (date(2024, 3, 1), 'running'): (1, 10, 0, 0, 0, 0),
+            (date(2024, 3, 2), 'cycling'): (1, 30, 12000, 1, 0, 0),
+        })
+
+    def test_update_in_place_changes_the_totals(self):
+        activity = self.create(calories_burned=200)
+        activity.duration = 45
+        activity.calories_burned = None
+        activity.save()
+        self.assertEqual(self.rollups(), {(date(2024, 3, 1), 'running'): (1, 45, 0, 0, 0, 0)})
+
+    def test_moving_the_last_activity_away_drops_the_row(self):
+        activity = self.create()
+        activity.date = date(2024, 2, 1)
+        activity.save()
+        self.assertEqual(set(self.rollups()), {(date(2024, 2, 1), 'running')})
+
+    def test_delete_subtracts_from_the_day(self):
+        kept = self.create(duration=10)
+        self.create().delete()
+        self.assertEqual(self.rollups(), {(date(2024, 3, 1), 'running'): (1, 10, 0, 0, 0, 0)})
+        kept.delete()
+        self.assertEqual(self.rollups(), {})
+
+    def test_distances_add_up_exactly(self):
+        self.create(distance=5.1)
+        self.create(distance=3.3).delete()
+        self.assertEqual(self.rollups(), {(date(2024, 3, 1), 'running'): (1, 30, 5100, 1, 0, 0)})
+
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION=f'Bearer {AccessToken.for_user(self.user)}')
+        statistics = client.get('/api/activities/history/?days=3650').data['statistics']
+        self.assertEqual(statistics['total_distance'], 5.1)
+        self.assertEqual(statistics['activities_by_type'][0]['total_distance'], 5.1)
+
+    def test_queryset_delete_is_covered(self):
+        self.create()
+        self.create(date=date(2024, 3, 5))
+        Activity.objects.filter(user=self.user).delete()
+        self.assertEqual(self.rollups(), {})
+
+    def test_rebuild_matches_incremental_updates(self):
+        for day, activity_type, distance in ((1, 'running', 5.1), (1, 'running', 3.3), (1, 'yoga', None), (2, 'running', 0.0005)):
+            self.create(date=date(2024, 3, day), activity_type=activity_type, distance=distance)
+        moved = self.create(date=date(2024, 3, 3), distance=2.25)
+        moved.date = date(2024, 3, 2)
+        moved.save()
+        incremental = self.rollups()
+        ActivityDailyRollup.objects.db_manager(DEFAULT_DB_ALIAS).rebuild()
+        self.assertEqual(self.rollups(), incremental)
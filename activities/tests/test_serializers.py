@@ -0,0 +1,59 @@
+import random
+from datetime import date, timedelta
+
+from django.contrib.auth.models import User
+from django.test import TestCase
+from rest_framework.renderers import JSONRenderer
+
+from activities.models import Activity
+from activities.serializers import ActivityHistorySerializer, ActivitySerializer
+from activities.tests import single_database
+from activities.values_serializers import ActivityHistoryValuesSerializer, ActivityValuesSerializer
+
+
+# (model serializer, values() serializer) pairs that must render the same bytes
+PAIRS = [
+    (ActivitySerializer, ActivityValuesSerializer),
+    (ActivityHistorySerializer, ActivityHistoryValuesSerializer),
+]
+
+
+@single_database
+class ValuesSerializerTests(TestCase):
+    """The values() serializers render exactly the JSON of the model serializers they mirror."""
+
+    @classmethod
+    def setUpTestData(cls):
+        rng = random.Random(13)
+        types = [choice[0] for choice in Activity.ACTIVITY_TYPES]
+        cls.user = User.objects.create_user('sérialiseur "quoted"')
+        # Saved one by one, so that created_at and updated_at have microseconds
+        for _ in range(60):
+            Activity.objects.create(
+                user=cls.user,
+                activity_type=rng.choice(types),
+                duration=rng.randint(1, 180),
+                distance=rng.choice([None, 5.0, 0.1, round(rng.uniform(0.5, 40), 2)]),
+                calories_burned=rng.choice([None, 0, rng.randint(50, 1500)]),
+                notes=rng.choice(['', 'Morning run', 'Café & "quotes" ✓\nsecond line', '<b>\\</b>']),
+                date=date(2024, 1, 1) + timedelta(days=rng.randint(0, 365)),
+            )
+
+    def render(self, serializer, rows):
+        return JSONRenderer().render(serializer(rows, many=True).data)
+
+    def test_outputs_are_byte_identical(self):
+        queryset = self.user.activities.order_by('-date', '-created_at')
+        for model_serializer, values_serializer in PAIRS:
+            expected = self.render(model_serializer, list(queryset))
+            for related in ({'user': self.user}, {}):
+                with self.subTest(serializer=values_serializer.__name__, related=bool(related)):
+                    rows = list(values_serializer.rows(queryset, **related))
+                    self.assertEqual(self.render(values_serializer, rows), expected)
+
+    def test_a_single_row_matches(self):
+        activity = self.user.activities.first()
+        for model_serializer, values_serializer in PAIRS:
+            with self.subTest(serializer=values_serializer.__name__):
+                row = values_serializer.rows(self.user.activities.filter(pk=activity.pk)).get()
+                self.assertEqual(values_serializer(row).data, model_serializer(activity).data)
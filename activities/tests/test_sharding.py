@@ -0,0 +1,172 @@
+import random
+from datetime import date, timedelta
+from io import StringIO
+from unittest import skipUnless
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import caches
+from django.core.management import call_command
+from django.db import DEFAULT_DB_ALIAS
+from django.test import TestCase, override_settings
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import AccessToken
+
+from activities.db import ShardRouter, bind_user_shard, gather, scatter, shard_for_user
+from activities.models import Activity, ActivityDailyRollup, ActivityStats, ActivityStreak, UserShard
+
+
+@override_settings(DATABASE_SHARDS=['default', 'shard_a', 'shard_b'])
+class ShardRouterTests(TestCase):
+    """Routing decisions, which need no shard databases to exist."""
+
+    def setUp(self):
+        caches['default'].clear()
+        self.addCleanup(bind_user_shard, None)
+        self.router = ShardRouter()
+
+    def test_new_users_are_spread_over_the_shards(self):
+        users = [User.objects.create_user(f'spread-{index}') for index in range(3)]
+        shards = settings.DATABASE_SHARDS
+        for user in users:
+            self.assertEqual(shard_for_user(user.pk), shards[user.pk % len(shards)])
+            self.assertTrue(UserShard.objects.filter(user=user, database=shard_for_user(user.pk)).exists())
+
+    def test_users_missing_from_the_directory_are_on_the_default_database(self):
+        user = User.objects.create_user('unlisted')
+        UserShard.objects.filter(user=user).delete()
+        caches['default'].clear()
+        self.assertEqual(shard_for_user(user.pk), DEFAULT_DB_ALIAS)
+
+    def test_rows_follow_their_user(self):
+        user = User.objects.create_user('router')
+        UserShard.objects.filter(user=user).update(database='shard_b')
+        caches['default'].clear()
+        activity = Activity(user_id=user.pk, activity_type='running', duration=10, date=date(2024, 1, 1))
+        self.assertEqual(self.router.db_for_write(Activity, instance=activity), 'shard_b')
+        self.assertEqual(self.router.db_for_read(ActivityDailyRollup, instance=user), 'shard_b')
+        # The user of a sharded row is on the default database
+        self.assertEqual(self.router.db_for_write(User, instance=activity), DEFAULT_DB_ALIAS)
+        # Models that are not sharded are left to the next router
+        self.assertIsNone(self.router.db_for_write(UserShard))
+
+    def test_request_user_routes_queries_without_an_instance(self):
+        user = User.objects.create_user('bound')
+        UserShard.objects.filter(user=user).update(database='shard_a')
+        caches['default'].clear()
+        self.assertIsNone(self.router.db_for_read(Activity))
+        bind_user_shard(user.pk)
+        self.assertEqual(self.router.db_for_read(Activity), 'shard_a')
+        self.assertEqual(self.router.db_for_write(ActivityStats), 'shard_a')
+
+
+@skipUnless(len(settings.DATABASE_SHARDS) > 1, 'Needs shards, set DATABASE_SHARD_URLS')
+class ShardedActivityTests(TestCase):
+    """Activities written and read through the API on real shards."""
+    databases = '__all__'
+
+    def setUp(self):
+        caches['default'].clear()
+        self.users = [User.objects.create_user(f'sharded-{index}') for index in range(len(settings.DATABASE_SHARDS))]
+
+    def client_for(self, user):
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION=f'Bearer {AccessToken.for_user(user)}')
+        return client
+
+    def test_activities_are_written_to_their_users_shard(self):
+        for index, user in enumerate(self.users):
+            response = self.client_for(user).post('/api/activities/', {
+                'activity_type': 'running', 'duration': 10 + index, 'date': '2024-01-01',
+            }, format='json')
+            self.assertEqual(response.status_code, 201)
+        located = scatter(lambda alias: set(Activity.objects.using(alias).values_list('user_id', flat=True)))
+        self.assertEqual(located, {
+            alias: {user.pk for user in self.users if shard_for_user(user.pk) == alias}
+            for alias in settings.DATABASE_SHARDS
+        })
+        for user in self.users:
+            alias = shard_for_user(user.pk)
+            self.assertTrue(ActivityDailyRollup.objects.using(alias).filter(user=user).exists())
+            self.assertTrue(ActivityStats.objects.using(alias).filter(user=user).exists())
+
+    def test_reads_and_counts_come_from_the_shard(self):
+        user = self.users[1]
+        client = self.client_for(user)
+        for day in (1, 2):
+            client.post('/api/activities/', {'activity_type': 'yoga', 'duration': 30, 'date': f'2024-01-0{day}'},
+                        format='json')
+        self.assertEqual(len(client.get('/api/activities/').data['results']), 2)
+        self.assertEqual(client.get('/api/activities/summary/').data['total_activities'], 2)
+        self.assertEqual(client.get(f'/api/users/{user.pk}/').data['activities_count'], 2)
+        counts = {row['id']: row['activities_count'] for row in client.get('/api/users/').data['results']}
+        self.assertEqual(counts[user.pk], 2)
+
+    def test_rebalance_moves_a_user_with_their_rows(self):
+        user = self.users[0]
+        self.client_for(user).post('/api/activities/', {
+            'activity_type': 'running', 'duration': 20, 'date': '2024-01-01',
+        }, format='json')
+        source = shard_for_user(user.pk)
+        target = next(alias for alias in settings.DATABASE_SHARDS if alias != source)
+        call_command('rebalance_shards', user=user.pk, to=target, stdout=StringIO())
+        self.assertEqual(shard_for_user(user.pk), target)
+        self.assertFalse(Activity.objects.using(source).filter(user=user).exists())
+        self.assertEqual(Activity.objects.using(target).filter(user=user).count(), 1)
+        self.assertTrue(ActivityDailyRollup.objects.using(target).filter(user=user).exists())
+
+    def test_gather_merges_the_shards_in_order(self):
+        for index, user in enumerate(self.users):
+            for duration in (index + 1, index + 10):
+                Activity.objects.create(user=user, activity_type='running', duration=duration, date=date(2024, 1, 1))
+        durations = [activity.duration for activity in gather(Activity.objects.order_by('-duration'), limit=4)]
+        everything = sorted(
+            (duration for values in scatter(
+                lambda alias: list(Activity.objects.using(alias).values_list('duration', flat=True))
+            ).values() for duration in values),
+            reverse=True,
+        )
+        self.assertEqual(durations, everything[:4])
+
+    def test_random_writes_match_a_rebuild_on_every_shard(self):
+        rng = random.Random(22)
+        activities = []
+        for _ in range(120):
+            if activities and rng.random() < 0.4:
+                activity = activities.pop(rng.randrange(len(activities)))
+                if rng.random() < 0.5:
+                    activity.delete()
+                    continue
+            else:
+                activity = Activity(user=rng.choice(self.users))
+            activity.activity_type = rng.choice(['running', 'cycling'])
+            activity.duration = rng.randint(10, 60)
+            activity.distance = rng.choice([None, rng.randint(1, 20) / 10])
+            activity.date = date(2024, 3, 1) + timedelta(days=rng.randint(0, 30))
+            activity.save()
+            activities.append(activity)
+
+        def snapshot(alias):
+            return (
+                sorted(ActivityDailyRollup.objects.using(alias).values_list(
+                    'user_id', 'date', 'activity_type', 'activity_count', 'total_duration', 'total_distance',
+                    'distance_count',
+                )),
+                sorted(
+                    (stats.user_id, stats.current_streak_start, stats.current_streak_end, stats.longest_streak,
+                     sorted(stats.records.items()))
+                    for stats in ActivityStats.objects.using(alias).all()
+                ),
+                sorted(ActivityStreak.objects.using(alias).values_list('user_id', 'start_date', 'end_date', 'days')),
+            )
+        incremental = scatter(snapshot)
+        # Every shard holds the rows of its own users only
+        for alias, (rollups, stats, streaks) in incremental.items():
+            users = {user.pk for user in self.users if shard_for_user(user.pk) == alias}
+            self.assertTrue(rollups)
+            self.assertEqual({row[0] for row in rollups}, users)
+            self.assertEqual({row[0] for row in stats}, users)
+        for alias in settings.DATABASE_SHARDS:
+            ActivityDailyRollup.objects.db_manager(alias).rebuild()
+            ActivityStats.objects.db_manager(alias).rebuild()
+        self.assertEqual(scatter(snapshot), incremental)
@@ -0,0 +1,99 @@
+import random
+from datetime import date, timedelta
+
+from django.contrib.auth.models import User
+from django.test import TestCase, override_settings
+from django.utils import timezone
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import AccessToken
+
+from activities.models import Activity
+from activities.statistics import compute_statistics
+from activities.tests import single_database
+
+
+@override_settings(ACTIVITY_ARCHIVE_DAYS=0, ACTIVITY_CACHE_ENABLED=False)
+@single_database
+class StatisticsTests(TestCase):
+    """History and summary statistics, computed in one grouped query over the daily rollups."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('statistician')
+        today = timezone.now().date()
+        for activity_type, duration, distance, calories, days_ago in (
+            ('running', 30, 5.0, 300, 1),
+            ('running', 40, None, 400, 2),
+            ('running', 50, 10.5, None, 40),
+            ('cycling', 60, 20.0, 500, 3),
+            ('yoga', 45, None, None, 4),
+        ):
+            Activity.objects.create(user=cls.user, activity_type=activity_type, duration=duration,
+                                    distance=distance, calories_burned=calories,
+                                    date=today - timedelta(days=days_ago))
+        # Someone else's activities are never counted
+        other = User.objects.create_user('other')
+        Activity.objects.create(user=other, activity_type='running', duration=99, distance=9.0, date=today)
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {AccessToken.for_user(self.user)}')
+
+    def test_summary(self):
+        data = self.client.get('/api/activities/summary/').data
+        self.assertEqual(data['total_activities'], 5)
+        self.assertEqual(data['total_duration_minutes'], 225)
+        self.assertEqual(data['total_distance_km'], 35.5)
+        self.assertEqual(data['total_calories_burned'], 1200)
+        self.assertEqual(data['average_duration_minutes'], 45)
+        # Averages only count the activities with a value, like AVG()
+        self.assertEqual(data['average_distance_km'], round(35.5 / 3, 2))
+        self.assertEqual(data['average_calories_burned'], 400)
+        self.assertEqual(data['activities_by_type'], [
+            {'activity_type': 'running', 'count': 3, 'total_duration': 120, 'total_distance': 15.5,
+             'total_calories': 700},
+            {'activity_type': 'cycling', 'count': 1, 'total_duration': 60, 'total_distance': 20.0,
+             'total_calories': 500},
+            {'activity_type': 'yoga', 'count': 1, 'total_duration': 45, 'total_distance': None,
+             'total_calories': None},
+        ])
+
+    def test_history_statistics_follow_the_filters(self):
+        data = self.client.get('/api/activities/history/?days=30&activity_type=running').data
+        self.assertEqual(data['period'], 'Last 30 days')
+        self.assertEqual(len(data['activities']), 2)
+        statistics = data['statistics']
+        self.assertEqual(
+            (statistics['total_activities'], statistics['total_duration'], statistics['total_distance'],
+             statistics['total_calories']),
+            (2, 70, 5.0, 700),
+        )
+        self.assertEqual(statistics['average_distance'], 5.0)
+
+    def test_without_activities(self):
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {AccessToken.for_user(User.objects.create_user("idle"))}')
+        data = self.client.get('/api/activities/summary/').data
+        self.assertEqual((data['total_activities'], data['total_distance_km'], data['average_duration_minutes']),
+                         (0, 0, 0))
+        self.assertEqual(data['activities_by_type'], [])
+
+    def test_rollups_and_activities_give_the_same_statistics(self):
+        rng = random.Random(1)
+        user = User.objects.create_user('random')
+        for _ in range(80):
+            Activity.objects.create(
+                user=user, activity_type=rng.choice(['running', 'cycling', 'swimming']),
+                duration=rng.randint(1, 120), distance=rng.choice([None, rng.randint(1, 300) / 10]),
+                calories_burned=rng.choice([None, rng.randint(50, 900)]),
+                date=date(2024, 1, 1) + timedelta(days=rng.randint(0, 60)),
+            )
+        from_activities = compute_statistics(user.activities.all())
+        from_rollups = compute_statistics(user.daily_rollups.all())
+        # Rollups sum distances in meters, activities in floating point kilometers
+        for key in ('total_distance', 'average_distance'):
+            self.assertAlmostEqual(from_rollups.pop(key), from_activities.pop(key), places=6)
+        by_type = [from_statistics.pop('activities_by_type') for from_statistics in (from_rollups, from_activities)]
+        for rollup_row, activity_row in zip(*by_type, strict=True):
+            self.assertAlmostEqual(rollup_row.pop('total_distance'), activity_row.pop('total_distance'), places=6)
+            self.assertEqual(rollup_row, activity_row)
+        self.assertEqual(from_rollups, from_activities)
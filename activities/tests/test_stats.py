@@ -0,0 +1,193 @@
+import random
+from datetime import date, timedelta
+
+from django.contrib.auth.models import User
+from django.db import DEFAULT_DB_ALIAS
+from django.test import TestCase
+from django.utils import timezone
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import AccessToken
+
+from activities.models import Activity, ActivityStats, ActivityStreak
+from activities.tests import single_database
+
+
+@single_database
+class StreakTests(TestCase):
+    """Streaks are runs of active days, joined and split as activities come and go."""
+
+    def setUp(self):
+        self.user = User.objects.create_user('streaker', password='Streak-pw-2024')
+
+    def create(self, day, **fields):
+        fields = {'activity_type': 'running', 'duration': 30, **fields}
+        return Activity.objects.create(user=self.user, date=date(2024, 3, day), **fields)
+
+    def runs(self):
+        return [
+            (run.start_date.day, run.end_date.day, run.days)
+            for run in ActivityStreak.objects.filter(user=self.user).order_by('start_date')
+        ]
+
+    def stats(self):
+        return ActivityStats.objects.get(user=self.user)
+
+    def test_a_day_between_two_runs_joins_them(self):
+        for day in (1, 2, 4, 5, 6):
+            self.create(day)
+        self.assertEqual(self.runs(), [(1, 2, 2), (4, 6, 3)])
+        self.create(3)
+        self.assertEqual(self.runs(), [(1, 6, 6)])
+        stats = self.stats()
+        self.assertEqual((stats.longest_streak, stats.longest_streak_start), (6, date(2024, 3, 1)))
+
+    def test_deleting_a_day_splits_its_run(self):
+        activities = [self.create(day) for day in range(1, 8)]
+        activities[2].delete()
+        self.assertEqual(self.runs(), [(1, 2, 2), (4, 7, 4)])
+        stats = self.stats()
+        self.assertEqual((stats.longest_streak, stats.longest_streak_start), (4, date(2024, 3, 4)))
+        self.assertEqual((stats.current_streak_start, stats.current_streak_end), (date(2024, 3, 4), date(2024, 3, 7)))
+
+        activities[0].delete()
+        activities[6].delete()
+        self.assertEqual(self.runs(), [(2, 2, 1), (4, 6, 3)])
+        self.assertEqual(self.stats().current_streak_end, date(2024, 3, 6))
+
+    def test_a_day_stays_active_while_it_has_activities(self):
+        for day in (1, 2, 3):
+            self.create(day)
+        self.create(2, activity_type='yoga').delete()
+        self.assertEqual(self.runs(), [(1, 3, 3)])
+
+    def test_backdated_activities_extend_earlier_runs(self):
+        for day in (10, 11, 20):
+            self.create(day)
+        for day in (7, 8, 9):
+            self.create(day)
+        self.assertEqual(self.runs(), [(7, 11, 5), (20, 20, 1)])
+        stats = self.stats()
+        self.assertEqual(stats.longest_streak, 5)
+        # The latest run is still the current one
+        self.assertEqual(stats.current_streak_start, date(2024, 3, 20))
+
+    def test_moving_an_activity_moves_its_day(self):
+        for day in (1, 2):
+            self.create(day)
+        moved = self.create(3)
+        moved.date = date(2024, 3, 10)
+        moved.save()
+        self.assertEqual(self.runs(), [(1, 2, 2), (10, 10, 1)])
+
+    def test_bulk_inserts_merge_into_the_runs(self):
+        for day in (1, 5):
+            self.create(day)
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION=f'Bearer {AccessToken.for_user(self.user)}')
+        response = client.post('/api/activities/bulk/', [
+            {'activity_type': 'running', 'duration': 10, 'date': f'2024-03-{day:02}'} for day in (2, 3, 4, 8, 8, 12)
+        ], format='json')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(self.runs(), [(1, 5, 5), (8, 8, 1), (12, 12, 1)])
+
+    def test_current_streak_may_have_ended_yesterday(self):
+        stats = ActivityStats(current_streak_start=date(2024, 3, 1), current_streak_end=date(2024, 3, 4))
+        self.assertEqual(stats.current_streak(date(2024, 3, 4)), 4)
+        self.assertEqual(stats.current_streak(date(2024, 3, 5)), 4)
+        self.assertEqual(stats.current_streak(date(2024, 3, 6)), 0)
+
+
+@single_database
+class PersonalRecordTests(TestCase):
+    """Each activity type's longest distance and duration, kept as activities change."""
+
+    def setUp(self):
+        self.user = User.objects.create_user('recorder', password='Record-pw-2024')
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {AccessToken.for_user(self.user)}')
+
+    def create(self, day, duration, distance=None, activity_type='running'):
+        return Activity.objects.create(
+            user=self.user, activity_type=activity_type, duration=duration, distance=distance,
+            date=date(2024, 3, day),
+        )
+
+    def record(self, field, activity_type='running'):
+        return ActivityStats.objects.get(user=self.user).records.get(activity_type, {}).get(field)
+
+    def test_the_best_value_wins_and_ties_go_to_the_earliest(self):
+        self.create(5, 40, distance=8.0)
+        first = self.create(3, 60, distance=5.0)
+        self.create(9, 60)
+        self.assertEqual(self.record('duration'), {'value': 60, 'activity_id': first.pk, 'date': '2024-03-03'})
+        self.assertEqual(self.record('distance')['value'], 8.0)
+        self.assertIsNone(self.record('duration', 'yoga'))
+
+    def test_records_are_found_again_when_their_holder_changes(self):
+        self.create(1, 30)
+        second = self.create(2, 50)
+        holder = self.create(3, 90)
+        holder.duration = 20
+        holder.save()
+        self.assertEqual(self.record('duration')['activity_id'], second.pk)
+        second.delete()
+        self.assertEqual(self.record('duration')['value'], 30)
+
+    def test_changing_type_moves_the_record(self):
+        activity = self.create(1, 45)
+        activity.activity_type = 'cycling'
+        activity.save()
+        self.assertIsNone(self.record('duration'))
+        self.assertEqual(self.record('duration', 'cycling')['value'], 45)
+
+    def test_records_endpoint(self):
+        today = timezone.now().date()
+        for days_ago in (0, 1, 2, 5):
+            Activity.objects.create(user=self.user, activity_type='running', duration=30 + days_ago,
+                                    distance=5.0, date=today - timedelta(days=days_ago))
+        data = self.client.get('/api/activities/records/').data
+        self.assertEqual(data['current_streak'], 3)
+        self.assertEqual(data['longest_streak'], 3)
+        self.assertEqual(data['last_activity_date'], today)
+        self.assertEqual(data['personal_records']['running']['longest_duration']['value'], 35)
+
+    def test_records_endpoint_without_activities(self):
+        data = self.client.get('/api/activities/records/').data
+        self.assertEqual((data['current_streak'], data['longest_streak'], data['personal_records']), (0, 0, {}))
+
+
+@single_database
+class StatsRebuildTests(TestCase):
+    """Incremental updates leave the same streaks and records as a rebuild."""
+
+    def test_random_writes_match_a_rebuild(self):
+        rng = random.Random(25)
+        users = [User.objects.create_user(f'random-{index}') for index in range(3)]
+        activities = []
+        for _ in range(150):
+            if activities and rng.random() < 0.4:
+                activity = activities.pop(rng.randrange(len(activities)))
+                if rng.random() < 0.5:
+                    activity.delete()
+                    continue
+            else:
+                activity = Activity(user=rng.choice(users))
+            activity.activity_type = rng.choice(['running', 'cycling'])
+            activity.duration = rng.randint(10, 60)
+            activity.distance = rng.choice([None, rng.randint(1, 20)])
+            activity.date = date(2024, 3, 1) + timedelta(days=rng.randint(0, 30))
+            activity.save()
+            activities.append(activity)
+
+        def snapshot():
+            return (
+                sorted(
+                    (stats.user_id, stats.current_streak_start, stats.current_streak_end, stats.longest_streak,
+                     stats.longest_streak_start, stats.longest_streak_end, sorted(stats.records.items()))
+                    for stats in ActivityStats.objects.all()
+                ),
+                sorted(ActivityStreak.objects.values_list('user_id', 'start_date', 'end_date', 'days')),
+            )
+        incremental = snapshot()
+        ActivityStats.objects.db_manager(DEFAULT_DB_ALIAS).rebuild()
+        self.assertEqual(snapshot(), incremental)
@@ -0,0 +1,94 @@
+import json
+from datetime import date, timedelta
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import caches
+from django.db import DEFAULT_DB_ALIAS
+from django.test import TestCase, override_settings
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import AccessToken
+
+from activities.models import Activity, ActivityDailyRollup
+from activities.serializers import ActivitySerializer
+from activities.streaming import stream_json_response
+from activities.tests import single_database
+from activities.values_serializers import ActivityValuesSerializer
+
+
+@override_settings(ACTIVITY_ARCHIVE_DAYS=0, ACTIVITY_CACHE_ENABLED=False)
+@single_database
+class StreamedActivitiesTests(TestCase):
+    """Activity lists are paginated, or streamed whole a chunk of rows at a time."""
+
+    # More than two chunks of STREAM_CHUNK_SIZE rows
+    ACTIVITIES = 1100
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('streamer')
+        start = date(2024, 1, 1)
+        Activity.objects.bulk_create([
+            Activity(user=cls.user, activity_type=('running', 'cycling')[index % 2], duration=index % 90 + 1,
+                     distance=None if index % 3 else 5.5, notes='Café "✓"\n' if index % 7 == 0 else '',
+                     date=start + timedelta(days=index % 365))
+            for index in range(cls.ACTIVITIES)
+        ])
+        ActivityDailyRollup.objects.db_manager(DEFAULT_DB_ALIAS).rebuild()
+
+    def setUp(self):
+        # Streamed rows carry the username of the authenticated user, which
+        # may be cached for a user of an earlier test with the same id
+        caches[settings.USER_CACHE_ALIAS].clear()
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {AccessToken.for_user(self.user)}')
+
+    def get_streamed(self, path):
+        response = self.client.get(path)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        self.assertEqual(response['Content-Type'], 'application/json')
+        # Iterated like a WSGI server would, which also reads the stream of an async view
+        return json.loads(b''.join(response))
+
+    def expected(self, activities):
+        return json.loads(json.dumps(ActivitySerializer(activities, many=True).data))
+
+    def test_user_activities_are_paginated(self):
+        response = self.client.get(f'/api/users/{self.user.pk}/activities/')
+        self.assertFalse(response.streaming)
+        self.assertEqual(response.data['count'], self.ACTIVITIES)
+        self.assertEqual(len(response.data['results']), 20)
+        self.assertIsNotNone(response.data['next'])
+
+    def test_user_activities_are_streamed_whole(self):
+        data = self.get_streamed(f'/api/users/{self.user.pk}/activities/?stream=true')
+        self.assertEqual(data, self.expected(self.user.activities.order_by('-date', '-created_at')))
+
+    def test_history_is_streamed_with_its_statistics(self):
+        data = self.get_streamed('/api/activities/history/?start_date=2024-01-01&activity_type=running&stream=true')
+        activities = self.user.activities.filter(activity_type='running').order_by('-date', '-created_at')
+        self.assertEqual(list(data), ['statistics', 'period', 'activities'])
+        self.assertEqual(data['period'], 'From 2024-01-01')
+        self.assertEqual(data['statistics']['total_activities'], len(activities))
+        self.assertEqual(
+            [activity['id'] for activity in data['activities']], [activity.pk for activity in activities],
+        )
+        self.assertEqual(data['activities'][0]['user'], self.user.username)
+
+    def test_other_users_activities_cannot_be_streamed(self):
+        other = User.objects.create_user('other')
+        response = self.client.get(f'/api/users/{other.pk}/activities/?stream=true')
+        self.assertEqual(response.status_code, 403)
+
+    def test_chunks_join_into_one_array(self):
+        queryset = ActivityValuesSerializer.rows(self.user.activities.order_by('id')[:5], user=self.user)
+        for chunk_size in (1, 2, 5, 10):
+            with self.subTest(chunk_size=chunk_size):
+                response = stream_json_response(queryset, ActivityValuesSerializer, chunk_size=chunk_size)
+                self.assertEqual(
+                    json.loads(b''.join(response.streaming_content)),
+                    self.expected(self.user.activities.order_by('id')[:5]),
+                )
+        empty = stream_json_response(queryset.none(), ActivityValuesSerializer, payload={'a': 1}, list_key='items')
+        self.assertEqual(json.loads(b''.join(empty.streaming_content)), {'a': 1, 'items': []})
@@ -0,0 +1,104 @@
+from datetime import timedelta
+from io import StringIO
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import caches
+from django.core.management import call_command
+from django.test import TestCase
+from django.utils import timezone
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.exceptions import TokenError
+from rest_framework_simplejwt.token_blacklist.models import BlacklistedToken, OutstandingToken
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from activities.authentication import RevocableRefreshToken
+from activities.tests import single_database
+
+
+@single_database
+class RefreshRotationTests(TestCase):
+    """A refresh token is blacklisted when rotated, and then rejected wherever it is checked."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('rotator', password='Rotate-pw-2024')
+
+    def setUp(self):
+        self.client = APIClient()
+        self.cache = caches[settings.TOKEN_BLACKLIST_CACHE_ALIAS]
+        self.cache.clear()
+        self.addCleanup(self.cache.clear)
+
+    def obtain(self):
+        response = self.client.post('/api/token/', {'username': 'rotator', 'password': 'Rotate-pw-2024'})
+        self.assertEqual(response.status_code, 200)
+        return response.data['refresh']
+
+    def refresh(self, token):
+        # The revocation is cached once the blacklist row is committed
+        with self.captureOnCommitCallbacks(execute=True):
+            return self.client.post('/api/token/refresh/', {'refresh': token})
+
+    def test_rotation_returns_a_new_refresh_token(self):
+        token = self.obtain()
+        response = self.refresh(token)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response.data['refresh'], token)
+        self.assertEqual(self.refresh(response.data['refresh']).status_code, 200)
+        self.assertTrue(BlacklistedToken.objects.filter(token__jti=RefreshToken(token, verify=False)['jti']).exists())
+
+    def test_reuse_is_rejected_from_the_cache(self):
+        token = self.obtain()
+        self.assertEqual(self.refresh(token).status_code, 200)
+        with self.assertNumQueries(0):
+            response = self.refresh(token)
+        self.assertEqual(response.status_code, 401)
+
+    def test_reuse_is_rejected_from_the_database(self):
+        token = self.obtain()
+        self.assertEqual(self.refresh(token).status_code, 200)
+        # As on a worker whose cache never saw the revocation
+        self.cache.clear()
+        self.assertEqual(self.refresh(token).status_code, 401)
+        self.assertEqual(BlacklistedToken.objects.filter(token__jti=RefreshToken(token, verify=False)['jti']).count(), 1)
+
+    def test_blacklisted_tokens_stay_rejected_once_the_cache_forgets_them(self):
+        token = RefreshToken.for_user(self.user)
+        with self.captureOnCommitCallbacks(execute=True):
+            # e.g. from the admin
+            BlacklistedToken.objects.create(token=OutstandingToken.objects.get(jti=token['jti']))
+        with self.assertRaises(TokenError):
+            RevocableRefreshToken(str(token))
+
+        self.cache.delete(f"auth:revoked:{token['jti']}")
+        with self.assertRaises(TokenError):
+            RevocableRefreshToken(str(token))
+        self.assertEqual(self.refresh(str(token)).status_code, 401)
+
+
+@single_database
+class PurgeExpiredTokensTests(TestCase):
+    """purge_expired_tokens deletes expired tokens and their blacklist rows, and nothing else."""
+
+    def test_only_expired_tokens_are_deleted(self):
+        user = User.objects.create_user('purger')
+        now = timezone.now()
+        tokens = {}
+        for name, expires_at, blacklisted in (
+            ('expired', now - timedelta(days=1), False),
+            ('expired-blacklisted', now - timedelta(seconds=1), True),
+            ('valid', now + timedelta(days=1), False),
+            ('valid-blacklisted', now + timedelta(days=1), True),
+        ):
+            tokens[name] = OutstandingToken.objects.create(
+                user=user, jti=name, token=name, created_at=now - timedelta(days=7), expires_at=expires_at,
+            )
+            if blacklisted:
+                BlacklistedToken.objects.create(token=tokens[name])
+
+        out = StringIO()
+        call_command('purge_expired_tokens', batch_size=1, stdout=out)
+        self.assertIn('Deleted 2 expired tokens.', out.getvalue())
+        self.assertEqual(sorted(OutstandingToken.objects.values_list('jti', flat=True)), ['valid', 'valid-blacklisted'])
+        self.assertEqual(list(BlacklistedToken.objects.values_list('token__jti', flat=True)), ['valid-blacklisted'])
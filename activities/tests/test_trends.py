@@ -0,0 +1,94 @@
+from datetime import date
+
+from django.contrib.auth.models import User
+from django.test import TestCase
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import AccessToken
+
+from activities.models import Activity
+from activities.statistics import TREND_PERIODS, compute_trends
+from activities.tests import single_database
+
+
+@single_database
+class TrendBucketTests(TestCase):
+    """Trends are bucketed by calendar day, week, month and year."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('trender', password='Trends-pw-2024')
+        for day, duration, distance in (
+            (date(2023, 12, 31), 10, None),
+            (date(2024, 1, 1), 20, 2.5),
+            (date(2024, 2, 29), 30, None),
+            (date(2024, 3, 3), 40, 4.0),
+            (date(2024, 3, 4), 50, None),
+            (date(2024, 3, 13), 60, 1.25),
+        ):
+            Activity.objects.create(user=cls.user, activity_type='running', duration=duration,
+                                    distance=distance, date=day)
+
+    def trends(self, period, count, today):
+        return compute_trends(self.user.daily_rollups.all(), period, count, today)
+
+    def test_daily(self):
+        trends = self.trends('daily', 3, date(2024, 3, 4))
+        self.assertEqual([trend['day'] for trend in trends], ['2024-03-02', '2024-03-03', '2024-03-04'])
+        self.assertEqual(trends[0]['period'], '2024-03-02 to 2024-03-02')
+        self.assertEqual([trend['total_duration'] for trend in trends], [0, 40, 50])
+        self.assertEqual(trends[1]['total_distance'], 4.0)
+
+    def test_weeks_start_on_monday(self):
+        # 2024-03-13 is a Wednesday
+        trends = self.trends('weekly', 3, date(2024, 3, 13))
+        self.assertEqual([trend['period'] for trend in trends], [
+            '2024-02-26 to 2024-03-03', '2024-03-04 to 2024-03-10', '2024-03-11 to 2024-03-17',
+        ])
+        self.assertEqual([trend['week'] for trend in trends], ['Week 1', 'Week 2', 'Week 3'])
+        self.assertEqual([trend['total_duration'] for trend in trends], [70, 50, 60])
+
+    def test_months_follow_the_calendar(self):
+        trends = self.trends('monthly', 4, date(2024, 3, 31))
+        self.assertEqual([trend['month'] for trend in trends],
+                         ['December 2023', 'January 2024', 'February 2024', 'March 2024'])
+        self.assertEqual(trends[2]['period'], '2024-02-01 to 2024-02-29')
+        self.assertEqual([trend['total_activities'] for trend in trends], [1, 1, 1, 3])
+        self.assertEqual([trend['total_distance'] for trend in trends], [0, 2.5, 0, 5.25])
+
+    def test_yearly(self):
+        trends = self.trends('yearly', 2, date(2024, 6, 1))
+        self.assertEqual([trend['year'] for trend in trends], ['2023', '2024'])
+        self.assertEqual([trend['period'] for trend in trends],
+                         ['2023-01-01 to 2023-12-31', '2024-01-01 to 2024-12-31'])
+        self.assertEqual([trend['total_duration'] for trend in trends], [10, 200])
+
+
+@single_database
+class TrendParameterTests(TestCase):
+    """The trends endpoint validates its period and bounds the number of buckets."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('trend-params', password='Trends-pw-2024')
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {AccessToken.for_user(self.user)}')
+
+    def get(self, query):
+        return self.client.get(f'/api/activities/trends/?{query}')
+
+    def test_bucket_counts_are_capped(self):
+        for period, (param, _, maximum, _) in TREND_PERIODS.items():
+            with self.subTest(period=period):
+                response = self.get(f'period={period}&{param}={maximum}')
+                self.assertEqual(response.status_code, 200)
+                self.assertEqual(len(response.data['trends']), maximum)
+                response = self.get(f'period={period}&{param}={maximum + 1}')
+                self.assertEqual(response.status_code, 400)
+                self.assertEqual(response.data['error'], f'{param} must be at most {maximum}')
+
+    def test_invalid_parameters(self):
+        for query in ('period=hourly', 'period=daily&days=0', 'period=weekly&weeks=-1', 'period=monthly&months=x'):
+            with self.subTest(query=query):
+                self.assertEqual(self.get(query).status_code, 400)
@@ -0,0 +1,61 @@
+from datetime import date
+
+from django.contrib.auth.models import User
+from django.db import DEFAULT_DB_ALIAS, connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import AccessToken
+
+from activities.archive import archive
+from activities.models import Activity
+from activities.tests import single_database
+
+
+@override_settings(ACTIVITY_ARCHIVE_DAYS=365, ACTIVITY_CACHE_ENABLED=False, USER_CACHE_ENABLED=False)
+@single_database
+class UserListTests(TestCase):
+    """GET /api/users/ counts every user's activities, archived ones included, in one query."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('lister', email='lister@example.com')
+        for day in (1, 2, 3):
+            Activity.objects.create(user=cls.user, activity_type='running', duration=20, date=date(2024, 1, day))
+        old = Activity.objects.create(user=cls.user, activity_type='yoga', duration=30, date=date(2019, 6, 1))
+        archive([old], DEFAULT_DB_ALIAS)
+        cls.idle = User.objects.create_user('idle')
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {AccessToken.for_user(self.user)}')
+
+    def list_users(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get('/api/users/')
+        self.assertEqual(response.status_code, 200)
+        return response.data, len(queries)
+
+    def test_activities_are_counted(self):
+        data, _ = self.list_users()
+        self.assertEqual(data['count'], 2)
+        counts = {user['username']: user['activities_count'] for user in data['results']}
+        self.assertEqual(counts, {'lister': 4, 'idle': 0})
+        self.assertEqual(data['results'][0], {
+            'id': self.user.pk, 'username': 'lister', 'email': 'lister@example.com', 'first_name': '',
+            'last_name': '', 'date_joined': data['results'][0]['date_joined'], 'activities_count': 4,
+        })
+
+    def test_detail_counts_the_same(self):
+        response = self.client.get(f'/api/users/{self.user.pk}/')
+        self.assertEqual(response.data['activities_count'], 4)
+
+    def test_queries_do_not_grow_with_the_page(self):
+        _, few = self.list_users()
+        for index in range(30):
+            user = User.objects.create_user(f'many-{index}')
+            Activity.objects.create(user=user, activity_type='cycling', duration=10, date=date(2024, 2, 1))
+        data, many = self.list_users()
+        self.assertEqual(len(data['results']), 20)
+        self.assertTrue(all(user['activities_count'] == 1 for user in data['results'][2:]))
+        self.assertEqual(many, few)
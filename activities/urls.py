@@ -1,14 +1,23 @@
+from django.conf import settings
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
-from .views import UserViewSet, ActivityViewSet, RegisterView
+from .async_views import async_read_urls
+from .views import UserViewSet, ActivityViewSet, LeaderboardViewSet, RegisterView
 
 router = DefaultRouter()
 router.register(r'users', UserViewSet, basename='user')
 router.register(r'activities', ActivityViewSet, basename='activity')
+router.register(r'leaderboards', LeaderboardViewSet, basename='leaderboard')
 
-urlpatterns = [
-    path('register/', RegisterView.as_view(), name='register'),
-    path('', include(router.urls)),
-]
 
+def api_urlpatterns(async_reads=False):
+    """Return the API routes, with async read views when ``async_reads``."""
+    router_urls = async_read_urls(router.urls) if async_reads else router.urls
+    return [
+        path('register/', RegisterView.as_view(), name='register'),
+        path('', include(router_urls)),
+    ]
+
+
+urlpatterns = api_urlpatterns(settings.ASYNC_READ_VIEWS)
 
@@ -0,0 +1,136 @@
+from django.core.exceptions import ImproperlyConfigured
+from django.db.models import CharField, F, Value
+from rest_framework import serializers
+from rest_framework.settings import ISO_8601, api_settings
+
+from .serializers import ActivityHistorySerializer, ActivitySerializer
+
+
+class ValuesSerializer:
+    """
+    Read-only serializer for rows fetched with ``QuerySet.values()``.
+
+    It renders exactly what ``serializer_class`` renders for the same
+    objects, without building model instances or running DRF's per-field
+    machinery for every row. The readable fields of ``serializer_class``
+    are turned once into ``(name, column, converter)`` triples; a row then
+    only costs a dict lookup and, for dates, one conversion per field.
+
+    ``related_columns`` maps StringRelatedFields to the column holding
+    their string, so that it is joined in SQL instead of being read from
+    a related instance. Each is selected as ``<field>_string``.
+    """
+    serializer_class = None
+    related_columns = {}
+
+    def __init__(self, instance, many=False):
+        self.instance = instance
+        self.many = many
+        self.converters = self.get_converters()
+
+    @classmethod
+    def get_fields(cls):
+        """Return the ``(name, column, drf_field)`` triples to render."""
+        if '_fields' not in cls.__dict__:
+            fields = []
+            for name, field in cls.serializer_class().fields.items():
+                if field.write_only:
+                    continue
+                if isinstance(field, serializers.StringRelatedField):
+                    if name not in cls.related_columns:
+                        raise ImproperlyConfigured(
+                            f"{cls.__name__}.related_columns has no column for '{name}'."
+                        )
+                    fields.append((name, f'{name}_string', field))
+                elif isinstance(field, (serializers.RelatedField, serializers.SerializerMethodField)):
+                    raise ImproperlyConfigured(
+                        f"{cls.__name__} cannot render the '{name}' field from values() rows."
+                    )
+                else:
+                    fields.append((name, field.source, field))
+            cls._fields = fields
+        return cls._fields
+
+    @classmethod
+    def rows(cls, queryset, **related):
+        """
+        Return ``queryset`` as the values() rows this serializer reads.
+
+        ``related`` gives the object every row shares for some related
+        fields, e.g. ``user=request.user``. Its string is then selected as
+        a constant instead of being joined, so that the query does not
+        need the related table, which is not on the activities' shard.
+        """
+        columns = []
+        expressions = {}
+        for name, column, _ in cls.get_fields():
+            if name not in cls.related_columns:
+                columns.append(column)
+            elif name in related:
+                expressions[column] = Value(str(related[name]), output_field=CharField())
+            else:
+                expressions[column] = F(cls.related_columns[name])
+        return queryset.values(*columns, **expressions)
+
+    def get_converters(self):
+        return [(name, column, self.get_converter(field)) for name, column, field in self.get_fields()]
+
+    def get_converter(self, field):
+        """
+        Return a function rendering one non-null value of ``field`` the way
+        ``field.to_representation()`` does, or None when the database value
+        is already what DRF outputs.
+        """
+        if isinstance(field, serializers.DateTimeField):
+            output_format = getattr(field, 'format', api_settings.DATETIME_FORMAT)
+            field_timezone = getattr(field, 'timezone', field.default_timezone())
+            if output_format is None or output_format.lower() != ISO_8601 or field_timezone is None:
+                return field.to_representation
+
+            def convert_datetime(value):
+                value = value.astimezone(field_timezone).isoformat()
+                if value.endswith('+00:00'):
+                    value = value[:-6] + 'Z'
+                return value
+            return convert_datetime
+        if isinstance(field, serializers.DateField):
+            output_format = getattr(field, 'format', api_settings.DATE_FORMAT)
+            if output_format is None or output_format.lower() != ISO_8601:
+                return field.to_representation
+            return _isoformat
+        if isinstance(field, serializers.FloatField):
+            return float
+        if isinstance(field, (serializers.IntegerField, serializers.CharField,
+                              serializers.ChoiceField, serializers.StringRelatedField)):
+            return None
+        return field.to_representation
+
+    def to_representation(self, row):
+        result = {}
+        for name, column, convert in self.converters:
+            value = row[column]
+            result[name] = value if value is None or convert is None else convert(value)
+        return result
+
+    @property
+    def data(self):
+        if self.many:
+            return [self.to_representation(row) for row in self.instance]
+        return self.to_representation(self.instance)
+
+
+def _isoformat(value):
+    return value.isoformat()
+
+
+class ActivityValuesSerializer(ValuesSerializer):
+    """Fast read path rendering the same output as ActivitySerializer."""
+    serializer_class = ActivitySerializer
+    # User.__str__() is the username
+    related_columns = {'user': 'user__username'}
+
+
+class ActivityHistoryValuesSerializer(ValuesSerializer):
+    """Fast read path rendering the same output as ActivityHistorySerializer."""
+    serializer_class = ActivityHistorySerializer
+    related_columns = {'user': 'user__username'}
@@ -1,15 +1,35 @@
 from rest_framework import viewsets, status
 from rest_framework.decorators import action, permission_classes
 from rest_framework.response import Response
-from rest_framework.permissions import IsAuthenticated, AllowAny
+from rest_framework.permissions import IsAuthenticated, AllowAny, SAFE_METHODS
 from rest_framework.views import APIView
+from django.conf import settings
 from django.contrib.auth.models import User
-from django.db.models import Sum, Count, Avg, Q
+from django.db import router, transaction
+from django.db.models import Count, OuterRef, Subquery
+from django.core.exceptions import ValidationError
+from django.db.models.functions import Coalesce
+from django.http import Http404, HttpResponse
 from django.utils import timezone
+from django.utils.crypto import constant_time_compare
+from collections import Counter
 from datetime import timedelta, datetime
-from .models import Activity
-from .serializers import UserSerializer, ActivitySerializer, ActivityHistorySerializer
+from .models import (
+    LEADERBOARD_METRICS, LEADERBOARD_PERIODS, RECORD_FIELDS, Activity, ActivityDailyRollup, ActivityStats,
+    ArchivedActivity, LeaderboardEntry,
+)
+from .archive import as_activity, restore, tiered
+from .serializers import UserSerializer, ActivitySerializer
+from .cache import bump_data_version, get_or_compute
+from .conditional import conditional_read
+from .db import bind_user_shard, is_sharded, pin_to_primary, read_from_primary, read_from_replica, scatter
+from . import metrics
+from .export import EXPORT_FORMATS, export_response
+from .pagination import KeysetPagination
 from .permissions import IsOwnerOrReadOnly, IsOwner, IsUserOwner
+from .statistics import TREND_PERIODS, compute_statistics, compute_trends
+from .streaming import stream_json_response, wants_stream
+from .values_serializers import ActivityHistoryValuesSerializer, ActivityValuesSerializer
 
 
 class RegisterView(APIView):
@@ -34,13 +54,103 @@ class RegisterView(APIView):
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
 
-class UserViewSet(viewsets.ModelViewSet):
+class ReplicaReadMixin:
+    """
+    Serve the reads of ``replica_actions`` from a read replica. A user who
+    has just written is pinned to the primary for a while, so they always
+    read their own writes.
+    """
+    replica_actions = ()
+
+    def initial(self, request, *args, **kwargs):
+        super().initial(request, *args, **kwargs)
+        # Authentication and permissions have read from the primary
+        if self.action in self.replica_actions:
+            read_from_replica(request.user.pk)
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        response = super().finalize_response(request, response, *args, **kwargs)
+        if request.method not in SAFE_METHODS and response.status_code < 400 and request.user.is_authenticated:
+            pin_to_primary(request.user.pk)
+        read_from_primary()
+        return response
+
+
+class UserShardMixin:
+    """
+    Look up the shard holding the authenticated user's activities once, for
+    all of the request's queries.
+    """
+
+    def initial(self, request, *args, **kwargs):
+        super().initial(request, *args, **kwargs)
+        if request.user.is_authenticated:
+            bind_user_shard(request.user.pk)
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        response = super().finalize_response(request, response, *args, **kwargs)
+        bind_user_shard(None)
+        return response
+
+
+class UserViewSet(UserShardMixin, ReplicaReadMixin, viewsets.ModelViewSet):
     """
     ViewSet for managing users.
     Provides CRUD operations for User model.
     """
-    queryset = User.objects.all()
     serializer_class = UserSerializer
+    # Not activities(), which looks the user up first: a user who has just
+    # registered may not be on the replicas yet
+    replica_actions = ('list',)
+
+    def get_queryset(self):
+        """
+        Load only the serialized columns and compute activities_count,
+        archived activities included, in the same query, so a page of
+        users costs a constant number of queries whatever its size. With
+        shards, the activities are not in the users' database: a page is
+        counted by paginate_queryset() instead, and a single user by the
+        serializer.
+        """
+        queryset = User.objects.only(*UserSerializer.Meta.model_fields).order_by('id')
+        if is_sharded():
+            return queryset
+        counts = [
+            Coalesce(Subquery(
+                model.objects.filter(user=OuterRef('pk'))
+                .order_by()
+                .values('user')
+                .annotate(count=Count('id'))
+                .values('count')
+            ), 0)
+            for model in (Activity, ArchivedActivity)
+        ]
+        return queryset.annotate(activities_count=counts[0] + counts[1])
+
+    def paginate_queryset(self, queryset):
+        page = super().paginate_queryset(queryset)
+        if page is not None and self.action == 'list' and is_sharded():
+            self.count_activities(page)
+        return page
+
+    def count_activities(self, users):
+        """
+        Set activities_count on ``users`` with one query per shard and
+        table, archived activities included.
+        """
+        user_ids = [user.pk for user in users]
+        counts = Counter()
+        for model in (Activity, ArchivedActivity):
+            for shard_counts in scatter(lambda alias: list(
+                model.objects.using(alias)
+                .filter(user_id__in=user_ids)
+                .order_by()
+                .values_list('user_id')
+                .annotate(count=Count('id'))
+            )).values():
+                counts.update(dict(shard_counts))
+        for user in users:
+            user.activities_count = counts[user.pk]
 
     def get_permissions(self):
         """
@@ -57,8 +167,11 @@ class UserViewSet(viewsets.ModelViewSet):
     @action(detail=True, methods=['get'], permission_classes=[IsAuthenticated, IsUserOwner])
     def activities(self, request, pk=None):
         """
-        Get all activities for a specific user.
+        Get all activities for a specific user, paginated.
         Only the user themselves can access their activities.
+        
+        Query parameters:
+        - stream: Set to 'true' to stream every activity as one JSON array
         """
         user = self.get_object()
         if user != request.user:
@@ -66,12 +179,15 @@ class UserViewSet(viewsets.ModelViewSet):
                 {'error': 'You can only view your own activities'},
                 status=status.HTTP_403_FORBIDDEN
             )
-        activities = Activity.objects.filter(user=user)
-        serializer = ActivitySerializer(activities, many=True)
-        return Response(serializer.data)
+        activities = tiered(user, lambda queryset: ActivityValuesSerializer.rows(queryset, user=user))
+        if wants_stream(request):
+            return stream_json_response(activities, ActivityValuesSerializer)
+        page = self.paginate_queryset(activities)
+        serializer = ActivityValuesSerializer(page, many=True)
+        return self.get_paginated_response(serializer.data)
 
 
-class ActivityViewSet(viewsets.ModelViewSet):
+class ActivityViewSet(UserShardMixin, ReplicaReadMixin, viewsets.ModelViewSet):
     """
     ViewSet for managing activities.
     Provides CRUD operations for Activity model.
@@ -79,6 +195,22 @@ class ActivityViewSet(viewsets.ModelViewSet):
     """
     serializer_class = ActivitySerializer
     permission_classes = [IsAuthenticated, IsOwnerOrReadOnly]
+    replica_actions = ('list', 'history', 'summary', 'trends', 'records', 'export')
+    bulk_max_items = 1000
+    bulk_batch_size = 500
+
+    @property
+    def paginator(self):
+        """
+        Use keyset pagination when the client opts in with
+        ``?pagination=cursor``, and the default paginator otherwise.
+        """
+        if not hasattr(self, '_paginator'):
+            if self.request.query_params.get('pagination') == 'cursor':
+                self._paginator = KeysetPagination()
+            else:
+                self._paginator = super().paginator
+        return self._paginator
 
     def get_queryset(self):
         """
@@ -86,8 +218,13 @@ class ActivityViewSet(viewsets.ModelViewSet):
         Optionally filter by user_id query parameter (but only if it's the current user).
         """
         user = self.request.user
-        queryset = Activity.objects.filter(user=user)
-        
+        # The related manager routes the query to the user's shard and
+        # attaches the user to every activity, so that rendering it needs
+        # neither a join nor a query
+        return self.filter_activities(user.activities.all())
+
+    def filter_activities(self, queryset):
+        """Apply the activity_type and sort_by parameters to ``queryset``."""
         # Optional filtering by activity_type
         activity_type = self.request.query_params.get('activity_type', None)
         if activity_type:
@@ -103,26 +240,159 @@ class ActivityViewSet(viewsets.ModelViewSet):
         
         return queryset
 
+    def get_object(self):
+        """
+        Look the activity up in the archive too when it is not in the
+        Activity table. An archived activity is moved back to the Activity
+        table before it is changed or deleted.
+        """
+        try:
+            return super().get_object()
+        except Http404:
+            archived = self.get_archived_object()
+            if archived is None:
+                raise
+        if self.request.method not in SAFE_METHODS:
+            restore([archived], archived._state.db)
+            return super().get_object()
+        activity = as_activity(archived)
+        self.check_object_permissions(self.request, activity)
+        return activity
+
+    def get_archived_object(self):
+        """Return the requesting user's archived activity named by the URL, or None."""
+        lookup_url_kwarg = self.lookup_url_kwarg or self.lookup_field
+        try:
+            return self.request.user.archived_activities.get(**{self.lookup_field: self.kwargs[lookup_url_kwarg]})
+        except (ArchivedActivity.DoesNotExist, TypeError, ValueError, ValidationError):
+            return None
+
+    def get_list_queryset(self, request):
+        """
+        Return ``(queryset, error)``: the values() rows listed, optionally
+        limited by the same date range parameters as history, or a message
+        for a 400 response. Archived activities are only read when the
+        date range reaches past the archive cutoff.
+        """
+        filters, _, error = self.get_history_filters(request, default_days=None)
+        if error:
+            return None, error
+        # Applied by filter_activities()
+        filters.pop('activity_type', None)
+        queryset = tiered(
+            request.user,
+            lambda activities: ActivityValuesSerializer.rows(
+                self.filter_queryset(self.filter_activities(activities)), user=request.user
+            ),
+            filters,
+        )
+        return queryset, None
+
+    @conditional_read
+    def list(self, request, *args, **kwargs):
+        """
+        List activities from values() rows rather than model instances.
+        The output is the same as ActivitySerializer's.
+        
+        Query parameters:
+        - start_date, end_date, days, activity_type: Same filters as history,
+          but every activity is listed when no date range is given
+        - sort_by: Sort by field (date, -date, duration, -duration, calories_burned,
+          -calories_burned, created_at, -created_at)
+        """
+        queryset, error = self.get_list_queryset(request)
+        if error:
+            return Response({'error': error}, status=status.HTTP_400_BAD_REQUEST)
+        page = self.paginate_queryset(queryset)
+        if page is not None:
+            serializer = ActivityValuesSerializer(page, many=True)
+            return self.get_paginated_response(serializer.data)
+        serializer = ActivityValuesSerializer(queryset, many=True)
+        return Response(serializer.data)
+
+    @conditional_read
+    def retrieve(self, request, *args, **kwargs):
+        return super().retrieve(request, *args, **kwargs)
+
     def perform_create(self, serializer):
         """Ensure the user is set to the current authenticated user."""
         serializer.save(user=self.request.user)
 
-    @action(detail=False, methods=['get'])
-    def history(self, request):
+    @action(detail=False, methods=['post'])
+    def bulk(self, request):
         """
-        Get activity history with optional filtering and statistics.
+        Create many activities in one request, e.g. from a device sync.
+        
+        The body is a JSON list of activities in the same format as a single
+        create. Every item is validated with ActivitySerializer, then all valid
+        items are inserted with bulk_create in batches inside one transaction.
         
         Query parameters:
-        - user_id: Filter by user ID (ignored, only shows current user's activities)
-        - start_date: Start date (YYYY-MM-DD format)
-        - end_date: End date (YYYY-MM-DD format)
-        - days: Number of days to look back (default: 30, ignored if start_date/end_date provided)
-        - activity_type: Filter by activity type
-        - sort_by: Sort by field (date, -date, duration, -duration, calories_burned, -calories_burned)
+        - mode: 'atomic' (default) creates nothing if any item is invalid,
+          'partial' creates the valid items and reports the invalid ones
+        """
+        mode = request.query_params.get('mode', 'atomic')
+        if mode not in ('atomic', 'partial'):
+            return Response(
+                {'error': "mode must be 'atomic' or 'partial'"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        items = request.data
+        if not isinstance(items, list) or not items:
+            return Response(
+                {'error': 'Expected a non-empty list of activities'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        if len(items) > self.bulk_max_items:
+            return Response(
+                {'error': f'Cannot create more than {self.bulk_max_items} activities per request'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        activities = []
+        errors = []
+        for index, item in enumerate(items):
+            serializer = self.get_serializer(data=item)
+            if serializer.is_valid():
+                data = serializer.validated_data
+                data.pop('user_id', None)
+                activities.append(Activity(user=request.user, **data))
+            else:
+                errors.append({'index': index, 'errors': serializer.errors})
+        
+        if errors and (mode == 'atomic' or not activities):
+            return Response({'created': 0, 'errors': errors}, status=status.HTTP_400_BAD_REQUEST)
+        
+        # bulk_create skips Activity.save() and its signals, so the rollups,
+        # stats, leaderboards and the cache version are updated here, on
+        # the user's shard
+        shard = router.db_for_write(Activity, instance=request.user)
+        with transaction.atomic(using=shard):
+            created = Activity.objects.using(shard).bulk_create(activities, batch_size=self.bulk_batch_size)
+            ActivityDailyRollup.objects.db_manager(shard).add_activities(created)
+            ActivityStats.objects.db_manager(shard).add_activities(created)
+            bump_data_version(request.user.pk, using=shard)
+            transaction.on_commit(lambda: LeaderboardEntry.objects.add_activities(created), using=shard)
+        
+        serializer = self.get_serializer(created, many=True)
+        return Response({
+            'created': len(created),
+            'activities': serializer.data,
+            'errors': errors,
+        }, status=status.HTTP_201_CREATED)
+
+    def get_history_filters(self, request, default_days=30):
         """
-        queryset = Activity.objects.filter(user=request.user)
+        Parse the date range and activity_type query parameters shared by
+        history and export into queryset filters.
         
-        # Date range filtering
+        Returns ``(filters, period, error)`` where ``error`` is a message
+        for a 400 response, or None when the parameters are valid. Without
+        a date range the last ``default_days`` days are used, or the whole
+        history when it is None.
+        """
+        filters = {}
         start_date = request.query_params.get('start_date', None)
         end_date = request.query_params.get('end_date', None)
         days = request.query_params.get('days', None)
@@ -132,104 +402,174 @@ class ActivityViewSet(viewsets.ModelViewSet):
                 start_date_obj = datetime.strptime(start_date, '%Y-%m-%d').date()
                 end_date_obj = datetime.strptime(end_date, '%Y-%m-%d').date()
                 if start_date_obj > end_date_obj:
-                    return Response(
-                        {'error': 'start_date must be before or equal to end_date'},
-                        status=status.HTTP_400_BAD_REQUEST
-                    )
-                queryset = queryset.filter(date__gte=start_date_obj, date__lte=end_date_obj)
+                    return None, None, 'start_date must be before or equal to end_date'
+                filters.update(date__gte=start_date_obj, date__lte=end_date_obj)
                 period = f"{start_date} to {end_date}"
             except ValueError:
-                return Response(
-                    {'error': 'Invalid date format. Use YYYY-MM-DD'},
-                    status=status.HTTP_400_BAD_REQUEST
-                )
+                return None, None, 'Invalid date format. Use YYYY-MM-DD'
         elif start_date:
             try:
                 start_date_obj = datetime.strptime(start_date, '%Y-%m-%d').date()
-                queryset = queryset.filter(date__gte=start_date_obj)
+                filters.update(date__gte=start_date_obj)
                 period = f"From {start_date}"
             except ValueError:
-                return Response(
-                    {'error': 'Invalid date format. Use YYYY-MM-DD'},
-                    status=status.HTTP_400_BAD_REQUEST
-                )
+                return None, None, 'Invalid date format. Use YYYY-MM-DD'
         elif end_date:
             try:
                 end_date_obj = datetime.strptime(end_date, '%Y-%m-%d').date()
-                queryset = queryset.filter(date__lte=end_date_obj)
+                filters.update(date__lte=end_date_obj)
                 period = f"Until {end_date}"
             except ValueError:
-                return Response(
-                    {'error': 'Invalid date format. Use YYYY-MM-DD'},
-                    status=status.HTTP_400_BAD_REQUEST
-                )
+                return None, None, 'Invalid date format. Use YYYY-MM-DD'
         elif days:
             try:
                 days_int = int(days)
                 if days_int <= 0:
-                    return Response(
-                        {'error': 'days must be a positive integer'},
-                        status=status.HTTP_400_BAD_REQUEST
-                    )
+                    return None, None, 'days must be a positive integer'
                 start_date_obj = timezone.now().date() - timedelta(days=days_int)
-                queryset = queryset.filter(date__gte=start_date_obj)
+                filters.update(date__gte=start_date_obj)
                 period = f'Last {days_int} days'
             except ValueError:
-                return Response(
-                    {'error': 'days must be a valid integer'},
-                    status=status.HTTP_400_BAD_REQUEST
-                )
+                return None, None, 'days must be a valid integer'
+        elif default_days:
+            start_date_obj = timezone.now().date() - timedelta(days=default_days)
+            filters.update(date__gte=start_date_obj)
+            period = f'Last {default_days} days'
         else:
-            # Default to last 30 days
-            start_date_obj = timezone.now().date() - timedelta(days=30)
-            queryset = queryset.filter(date__gte=start_date_obj)
-            period = 'Last 30 days'
+            period = 'All time'
         
         # Filter by activity_type if provided
         activity_type = request.query_params.get('activity_type', None)
         if activity_type:
-            queryset = queryset.filter(activity_type=activity_type)
+            filters['activity_type'] = activity_type
+        
+        return filters, period, None
+
+    def get_history_queryset(self, request, filters):
+        """
+        Return the sorted values() rows of history's activities, read from
+        the archive too when the date range reaches past its cutoff.
+        """
+        queryset = tiered(
+            request.user,
+            lambda activities: ActivityHistoryValuesSerializer.rows(activities, user=request.user),
+            filters,
+        )
         
         # Sorting
         sort_by = request.query_params.get('sort_by', '-date')
         valid_sort_fields = ['date', '-date', 'duration', '-duration', 'calories_burned', '-calories_burned']
         if sort_by in valid_sort_fields:
-            queryset = queryset.order_by(sort_by)
-        else:
-            queryset = queryset.order_by('-date', '-created_at')
-        
-        # Get statistics
-        stats = {
-            'total_activities': queryset.count(),
-            'total_duration': queryset.aggregate(Sum('duration'))['duration__sum'] or 0,
-            'total_distance': queryset.aggregate(Sum('distance'))['distance__sum'] or 0,
-            'total_calories': queryset.aggregate(Sum('calories_burned'))['calories_burned__sum'] or 0,
-            'average_duration': round(queryset.aggregate(Avg('duration'))['duration__avg'] or 0, 2),
-            'average_distance': round(queryset.aggregate(Avg('distance'))['distance__avg'] or 0, 2),
-            'average_calories': round(queryset.aggregate(Avg('calories_burned'))['calories_burned__avg'] or 0, 2),
-            'activities_by_type': queryset.values('activity_type').annotate(
-                count=Count('id'),
-                total_duration=Sum('duration'),
-                total_distance=Sum('distance'),
-                total_calories=Sum('calories_burned')
-            ).order_by('-count'),
+            return queryset.order_by(sort_by)
+        return queryset.order_by('-date', '-created_at')
+
+    @staticmethod
+    def history_statistics(totals):
+        """Shape the result of compute_statistics() for history."""
+        return {
+            'total_activities': totals['total_activities'],
+            'total_duration': totals['total_duration'],
+            'total_distance': totals['total_distance'],
+            'total_calories': totals['total_calories'],
+            'average_duration': round(totals['average_duration'], 2),
+            'average_distance': round(totals['average_distance'], 2),
+            'average_calories': round(totals['average_calories'], 2),
+            'activities_by_type': totals['activities_by_type'],
         }
+
+    @action(detail=False, methods=['get'])
+    @conditional_read
+    def history(self, request):
+        """
+        Get activity history with optional filtering and statistics.
+        
+        Query parameters:
+        - user_id: Filter by user ID (ignored, only shows current user's activities)
+        - start_date: Start date (YYYY-MM-DD format)
+        - end_date: End date (YYYY-MM-DD format)
+        - days: Number of days to look back (default: 30, ignored if start_date/end_date provided)
+        - activity_type: Filter by activity type
+        - sort_by: Sort by field (date, -date, duration, -duration, calories_burned, -calories_burned)
+        - page / pagination / cursor: Select the page of activities returned (see list)
+        - stream: Set to 'true' to stream every matching activity instead of one page
+        """
+        # Date range filtering, shared by the activities and their rollups
+        filters, period, error = self.get_history_filters(request)
+        if error:
+            return Response({'error': error}, status=status.HTTP_400_BAD_REQUEST)
         
-        # Serialize activities
-        serializer = ActivityHistorySerializer(queryset, many=True)
+        queryset = self.get_history_queryset(request, filters)
+        
+        # Get statistics from the daily rollups
+        def compute():
+            totals = compute_statistics(request.user.daily_rollups.filter(**filters))
+            return self.history_statistics(totals)
+        stats = get_or_compute(request, 'history', compute)
+        
+        if wants_stream(request):
+            return stream_json_response(
+                queryset, ActivityHistoryValuesSerializer,
+                payload={'statistics': stats, 'period': period}, list_key='activities',
+            )
+        
+        # Serialize one page of activities
+        page = self.paginate_queryset(queryset)
+        serializer = ActivityHistoryValuesSerializer(page, many=True)
         
         return Response({
             'statistics': stats,
             'activities': serializer.data,
-            'period': period
+            'period': period,
+            'next': self.paginator.get_next_link(),
+            'previous': self.paginator.get_previous_link(),
         })
 
     @action(detail=False, methods=['get'])
+    def export(self, request):
+        """
+        Export the authenticated user's activities as a streamed file.
+        
+        Query parameters:
+        - output: 'csv' (default) or 'ndjson'
+        - start_date, end_date, days, activity_type: Same filters as history,
+          but the whole history is exported when no date range is given
+        """
+        output = request.query_params.get('output', 'csv').lower()
+        if output not in EXPORT_FORMATS:
+            return Response(
+                {'error': "output must be 'csv' or 'ndjson'"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        filters, period, error = self.get_history_filters(request, default_days=None)
+        if error:
+            return Response({'error': error}, status=status.HTTP_400_BAD_REQUEST)
+        
+        queryset = tiered(request.user, lambda activities: activities, filters).order_by('-date', '-created_at')
+        return export_response(queryset, output, filename='activities')
+
+    @action(detail=False, methods=['get'])
+    @conditional_read
     def summary(self, request):
         """
         Get summary statistics for the authenticated user's activities.
+        Computed from the daily rollups rather than individual activities.
         """
-        queryset = Activity.objects.filter(user=request.user)
+        queryset, error = self.get_summary_queryset(request)
+        if error:
+            return Response({'error': error}, status=status.HTTP_400_BAD_REQUEST)
+        
+        summary = get_or_compute(request, 'summary', lambda: self.summary_result(compute_statistics(queryset)))
+        
+        return Response(summary)
+
+    def get_summary_queryset(self, request):
+        """
+        Return ``(queryset, error)``: the daily rollups summarized, optionally
+        limited by the start_date and end_date parameters, or a message for a
+        400 response.
+        """
+        queryset = request.user.daily_rollups.all()
         
         # Optional filtering by date range
         start_date = request.query_params.get('start_date', None)
@@ -241,113 +581,53 @@ class ActivityViewSet(viewsets.ModelViewSet):
                 end_date_obj = datetime.strptime(end_date, '%Y-%m-%d').date()
                 queryset = queryset.filter(date__gte=start_date_obj, date__lte=end_date_obj)
             except ValueError:
-                return Response(
-                    {'error': 'Invalid date format. Use YYYY-MM-DD'},
-                    status=status.HTTP_400_BAD_REQUEST
-                )
-        
-        summary = {
-            'total_activities': queryset.count(),
-            'total_duration_minutes': queryset.aggregate(Sum('duration'))['duration__sum'] or 0,
-            'total_distance_km': round(queryset.aggregate(Sum('distance'))['distance__sum'] or 0, 2),
-            'total_calories_burned': queryset.aggregate(Sum('calories_burned'))['calories_burned__sum'] or 0,
-            'average_duration_minutes': round(queryset.aggregate(Avg('duration'))['duration__avg'] or 0, 2),
-            'average_distance_km': round(queryset.aggregate(Avg('distance'))['distance__avg'] or 0, 2),
-            'average_calories_burned': round(queryset.aggregate(Avg('calories_burned'))['calories_burned__avg'] or 0, 2),
-            'activities_by_type': queryset.values('activity_type').annotate(
-                count=Count('id'),
-                total_duration=Sum('duration'),
-                total_distance=Sum('distance'),
-                total_calories=Sum('calories_burned')
-            ).order_by('-count'),
+                return None, 'Invalid date format. Use YYYY-MM-DD'
+        return queryset, None
+
+    @staticmethod
+    def summary_result(totals):
+        """Shape the result of compute_statistics() for summary."""
+        return {
+            'total_activities': totals['total_activities'],
+            'total_duration_minutes': totals['total_duration'],
+            'total_distance_km': round(totals['total_distance'], 2),
+            'total_calories_burned': totals['total_calories'],
+            'average_duration_minutes': round(totals['average_duration'], 2),
+            'average_distance_km': round(totals['average_distance'], 2),
+            'average_calories_burned': round(totals['average_calories'], 2),
+            'activities_by_type': totals['activities_by_type'],
         }
-        
-        return Response(summary)
 
     @action(detail=False, methods=['get'])
+    @conditional_read
     def trends(self, request):
         """
-        Get activity trends over time (weekly or monthly).
+        Get activity trends over time (daily, weekly, monthly or yearly).
+        
+        Buckets follow the calendar: weeks start on Monday and months and
+        years on their first day. The current bucket is always included.
         
         Query parameters:
-        - period: 'weekly' or 'monthly' (default: 'weekly')
-        - weeks: Number of weeks to look back (default: 4, only for weekly)
-        - months: Number of months to look back (default: 6, only for monthly)
+        - period: 'daily', 'weekly', 'monthly' or 'yearly' (default: 'weekly')
+        - days: Number of days to look back (default: 7, at most 366, only for daily)
+        - weeks: Number of weeks to look back (default: 4, at most 104, only for weekly)
+        - months: Number of months to look back (default: 6, at most 120, only for monthly)
+        - years: Number of years to look back (default: 3, at most 50, only for yearly)
         """
-        queryset = Activity.objects.filter(user=request.user)
+        queryset = request.user.daily_rollups.all()
         
-        period = request.query_params.get('period', 'weekly').lower()
+        period, param, count, error = self.get_trends_params(request)
+        if error:
+            return Response({'error': error}, status=status.HTTP_400_BAD_REQUEST)
         
-        if period == 'weekly':
-            weeks = int(request.query_params.get('weeks', 4))
-            if weeks <= 0:
-                return Response(
-                    {'error': 'weeks must be a positive integer'},
-                    status=status.HTTP_400_BAD_REQUEST
-                )
-            
-            # Get start date
-            start_date = timezone.now().date() - timedelta(weeks=weeks)
-            queryset = queryset.filter(date__gte=start_date)
-            
-            # Group by week
-            trends = []
-            for i in range(weeks):
-                week_start = start_date + timedelta(weeks=i)
-                week_end = week_start + timedelta(days=6)
-                week_activities = queryset.filter(date__gte=week_start, date__lte=week_end)
-                
-                trends.append({
-                    'week': f"Week {i+1}",
-                    'period': f"{week_start} to {week_end}",
-                    'total_activities': week_activities.count(),
-                    'total_duration': week_activities.aggregate(Sum('duration'))['duration__sum'] or 0,
-                    'total_distance': round(week_activities.aggregate(Sum('distance'))['distance__sum'] or 0, 2),
-                    'total_calories': week_activities.aggregate(Sum('calories_burned'))['calories_burned__sum'] or 0,
-                })
-        
-        elif period == 'monthly':
-            months = int(request.query_params.get('months', 6))
-            if months <= 0:
-                return Response(
-                    {'error': 'months must be a positive integer'},
-                    status=status.HTTP_400_BAD_REQUEST
-                )
-            
-            # Get start date (approximate, using 30 days per month)
-            start_date = timezone.now().date() - timedelta(days=months * 30)
-            queryset = queryset.filter(date__gte=start_date)
-            
-            # Group by month
-            trends = []
-            current_date = start_date
-            for i in range(months):
-                # Calculate month start and end
-                if current_date.month == 12:
-                    month_end = current_date.replace(year=current_date.year + 1, month=1, day=1) - timedelta(days=1)
-                else:
-                    month_end = current_date.replace(month=current_date.month + 1, day=1) - timedelta(days=1)
-                
-                month_start = current_date.replace(day=1)
-                month_activities = queryset.filter(date__gte=month_start, date__lte=month_end)
-                
-                trends.append({
-                    'month': month_start.strftime('%B %Y'),
-                    'period': f"{month_start} to {month_end}",
-                    'total_activities': month_activities.count(),
-                    'total_duration': month_activities.aggregate(Sum('duration'))['duration__sum'] or 0,
-                    'total_distance': round(month_activities.aggregate(Sum('distance'))['distance__sum'] or 0, 2),
-                    'total_calories': month_activities.aggregate(Sum('calories_burned'))['calories_burned__sum'] or 0,
-                })
-                
-                # Move to next month
-                if month_end.month == 12:
-                    current_date = month_end.replace(year=month_end.year + 1, month=1, day=1)
-                else:
-                    current_date = month_end.replace(month=month_end.month + 1, day=1)
-        else:
+        try:
+            trends = get_or_compute(
+                request, 'trends',
+                lambda: compute_trends(queryset, period, count, timezone.now().date())
+            )
+        except (ValueError, OverflowError):
             return Response(
-                {'error': "period must be 'weekly' or 'monthly'"},
+                {'error': f'{param} is out of range'},
                 status=status.HTTP_400_BAD_REQUEST
             )
         
@@ -355,3 +635,172 @@ class ActivityViewSet(viewsets.ModelViewSet):
             'period_type': period,
             'trends': trends
         })
+
+    @action(detail=False, methods=['get'])
+    @conditional_read
+    def records(self, request):
+        """
+        Get the current and longest streaks of consecutive days with
+        activities, and the longest distance and duration per activity type.
+        
+        Read from the user's ActivityStats row, which is kept up to date on
+        every activity write, rather than from their history. A streak that
+        ended yesterday is still current, as it can be continued today.
+        """
+        try:
+            stats = request.user.activity_stats
+        except ActivityStats.DoesNotExist:
+            stats = ActivityStats(user=request.user)
+        
+        today = timezone.now().date()
+        current = stats.current_streak(today)
+        return Response({
+            'current_streak': current,
+            'current_streak_start': stats.current_streak_start if current else None,
+            'longest_streak': stats.longest_streak,
+            'longest_streak_start': stats.longest_streak_start,
+            'longest_streak_end': stats.longest_streak_end,
+            'last_activity_date': stats.current_streak_end,
+            'personal_records': {
+                activity_type: {
+                    f'longest_{field}': records[field]
+                    for field in RECORD_FIELDS if field in records
+                }
+                for activity_type, records in sorted(stats.records.items())
+            },
+        })
+
+    def get_trends_params(self, request):
+        """
+        Return ``(period, param, count, error)`` from the trends query
+        parameters, where ``param`` names the bucket count parameter and
+        ``error`` is a message for a 400 response, or None.
+        """
+        period = request.query_params.get('period', 'weekly').lower()
+        if period not in TREND_PERIODS:
+            return None, None, None, "period must be 'daily', 'weekly', 'monthly' or 'yearly'"
+        
+        param, default, maximum, _ = TREND_PERIODS[period]
+        try:
+            count = int(request.query_params.get(param, default))
+        except ValueError:
+            return period, param, None, f'{param} must be a valid integer'
+        if count <= 0:
+            return period, param, None, f'{param} must be a positive integer'
+        if count > maximum:
+            return period, param, None, f'{param} must be at most {maximum}'
+        return period, param, count, None
+
+
+class LeaderboardViewSet(ReplicaReadMixin, viewsets.ViewSet):
+    """
+    Weekly and monthly leaderboards of each activity type, by total
+    duration, distance or calories. Read from LeaderboardEntry, which is
+    kept up to date on every activity write, so neither the top of a
+    leaderboard nor a user's rank reads the other users' activities.
+    """
+    permission_classes = [IsAuthenticated]
+    replica_actions = ('list', 'rank')
+    max_limit = 100
+
+    def list(self, request):
+        """
+        Get the top users of a leaderboard.
+        
+        Query parameters:
+        - activity_type: Activity type ranked (required)
+        - period: 'weekly' or 'monthly' (default: 'weekly')
+        - metric: 'duration', 'distance' or 'calories' (default: 'duration')
+        - date: Day within the week or month, YYYY-MM-DD (default: today)
+        - limit: Number of users, at most 100 (default: 10)
+        """
+        board, error = self.get_board(request)
+        if error is None:
+            try:
+                limit = int(request.query_params.get('limit', 10))
+            except ValueError:
+                error = 'limit must be a valid integer'
+            else:
+                if not 0 < limit <= self.max_limit:
+                    error = f'limit must be between 1 and {self.max_limit}'
+        if error:
+            return Response({'error': error}, status=status.HTTP_400_BAD_REQUEST)
+        
+        results = LeaderboardEntry.objects.top(*board, limit)
+        for result in results:
+            result['value'] = self.get_value(board[3], result.pop('total'))
+        return Response(dict(self.describe(board), results=results))
+
+    @action(detail=False, methods=['get'])
+    def rank(self, request):
+        """
+        Get a user's rank on a leaderboard, or null when they have no
+        activity on it. Takes the query parameters of the list, except
+        limit, and user_id (default: the authenticated user).
+        """
+        board, error = self.get_board(request)
+        user_id = request.user.pk
+        if error is None and 'user_id' in request.query_params:
+            try:
+                user_id = int(request.query_params['user_id'])
+            except ValueError:
+                error = 'user_id must be a valid integer'
+        if error:
+            return Response({'error': error}, status=status.HTTP_400_BAD_REQUEST)
+        
+        rank, total = LeaderboardEntry.objects.rank(user_id, *board)
+        return Response(dict(
+            self.describe(board), user_id=user_id, rank=rank, value=self.get_value(board[3], total),
+        ))
+
+    def get_board(self, request):
+        """
+        Return ``(board, error)`` from the query parameters, where ``board``
+        is (period, period start, activity type, metric) and ``error`` is a
+        message for a 400 response, or None.
+        """
+        period = request.query_params.get('period', 'weekly').lower()
+        if period not in LEADERBOARD_PERIODS:
+            return None, "period must be 'weekly' or 'monthly'"
+        metric = request.query_params.get('metric', 'duration').lower()
+        if metric not in LEADERBOARD_METRICS:
+            return None, "metric must be 'duration', 'distance' or 'calories'"
+        activity_type = request.query_params.get('activity_type')
+        if activity_type not in dict(Activity.ACTIVITY_TYPES):
+            return None, 'activity_type must be one of: ' + ', '.join(dict(Activity.ACTIVITY_TYPES))
+        try:
+            day = datetime.strptime(request.query_params['date'], '%Y-%m-%d').date()
+        except KeyError:
+            day = timezone.now().date()
+        except ValueError:
+            return None, 'Invalid date format. Use YYYY-MM-DD'
+        return (period, LEADERBOARD_PERIODS[period](day), activity_type, metric), None
+
+    def get_value(self, metric, total):
+        """Return a total as shown: distances, kept in meters, in kilometers."""
+        return total / 1000 if metric == 'distance' else total
+
+    def describe(self, board):
+        period, period_start, activity_type, metric = board
+        return {
+            'period': period,
+            'period_start': period_start.isoformat(),
+            'activity_type': activity_type,
+            'metric': metric,
+        }
+
+
+def metrics_view(request):
+    """
+    Metrics of all worker processes in the Prometheus text format.
+    Requires ``Authorization: Bearer <METRICS_TOKEN>`` when METRICS_TOKEN is set.
+    """
+    if not metrics.enabled():
+        raise Http404
+    if settings.METRICS_TOKEN:
+        expected = f'Bearer {settings.METRICS_TOKEN}'
+        if not constant_time_compare(request.headers.get('Authorization', ''), expected):
+            response = HttpResponse('Unauthorized\n', status=401, content_type='text/plain')
+            response['WWW-Authenticate'] = 'Bearer realm="metrics"'
+            return response
+    return HttpResponse(metrics.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
@@ -3,7 +3,7 @@ Django settings for fitness_tracker project.
 """
 
 from pathlib import Path
-from decouple import config
+from decouple import Csv, config
 import os
 from datetime import timedelta
 
@@ -35,6 +35,7 @@ INSTALLED_APPS = [
 
     # Third-party
     "rest_framework",
+    "rest_framework_simplejwt.token_blacklist",
     "corsheaders",
 
     # Local apps
@@ -42,6 +43,9 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    # First, so that its total time covers the other middleware
+    "activities.middleware.RequestProfilingMiddleware",
+    "activities.middleware.MetricsMiddleware",
     "django.middleware.security.SecurityMiddleware",
     "whitenoise.middleware.WhiteNoiseMiddleware",
 
@@ -76,10 +80,18 @@ TEMPLATES = [
 WSGI_APPLICATION = "fitness_tracker.wsgi.application"
 
 # Database
+# Connections are kept open for DATABASE_CONN_MAX_AGE seconds and checked
+# before being reused by a new request, instead of being opened for every
+# request. Set it to 0 under ASGI, where connections are not reused, and
+# put a pooler such as PgBouncer in front of PostgreSQL instead.
+DATABASE_CONN_MAX_AGE = config("DATABASE_CONN_MAX_AGE", default=600, cast=int)
+
 DATABASES = {
     "default": {
         "ENGINE": "django.db.backends.sqlite3",
         "NAME": BASE_DIR / "db.sqlite3",
+        "CONN_MAX_AGE": DATABASE_CONN_MAX_AGE,
+        "CONN_HEALTH_CHECKS": True,
     }
 }
 
@@ -87,10 +99,157 @@ DATABASE_URL = config("DATABASE_URL", default=None)
 if DATABASE_URL:
     try:
         import dj_database_url
-        DATABASES["default"] = dj_database_url.config(default=DATABASE_URL)
+        DATABASES["default"] = dj_database_url.config(
+            default=DATABASE_URL,
+            conn_max_age=DATABASE_CONN_MAX_AGE,
+            conn_health_checks=True,
+        )
     except ImportError:
         pass
 
+# Read replicas: comma-separated database URLs, added as the aliases
+# replica_1, replica_2, ... The list, history, summary, trends and export
+# reads go to a random replica, except for users who wrote in the last
+# DATABASE_REPLICA_PIN_SECONDS, which must exceed the replication lag.
+DATABASE_REPLICA_URLS = config("DATABASE_REPLICA_URLS", default="", cast=Csv())
+DATABASE_REPLICA_PIN_SECONDS = config("DATABASE_REPLICA_PIN_SECONDS", default=10, cast=int)
+if DATABASE_REPLICA_URLS:
+    import dj_database_url
+    for index, url in enumerate(DATABASE_REPLICA_URLS, 1):
+        DATABASES[f"replica_{index}"] = dj_database_url.parse(
+            url,
+            conn_max_age=DATABASE_CONN_MAX_AGE,
+            conn_health_checks=True,
+            # Tests read the test primary through the replica aliases
+            test_options={"MIRROR": "default"},
+        )
+DATABASE_REPLICAS = [alias for alias in DATABASES if alias.startswith("replica_")]
+
+# Shards: comma-separated database URLs, added as the aliases shard_1,
+# shard_2, ... Each user's activities and rollups live on one shard, the
+# default database included; users themselves stay on the default
+# database. New users are spread over the shards and moved between them
+# with `manage.py rebalance_shards`. A user's shard is cached for
+# DATABASE_SHARD_CACHE_SECONDS.
+DATABASE_SHARD_URLS = config("DATABASE_SHARD_URLS", default="", cast=Csv())
+DATABASE_SHARD_CACHE_SECONDS = config("DATABASE_SHARD_CACHE_SECONDS", default=60, cast=int)
+if DATABASE_SHARD_URLS:
+    import dj_database_url
+    for index, url in enumerate(DATABASE_SHARD_URLS, 1):
+        DATABASES[f"shard_{index}"] = dj_database_url.parse(
+            url,
+            conn_max_age=DATABASE_CONN_MAX_AGE,
+            conn_health_checks=True,
+        )
+DATABASE_SHARDS = ["default"] + [alias for alias in DATABASES if alias.startswith("shard_")]
+DATABASE_ROUTERS = ["activities.db.ShardRouter", "activities.db.ReplicaRouter"]
+
+# Applied to every new SQLite connection (see activities/db.py)
+SQLITE_PRAGMAS = {
+    # Readers and the writer no longer block each other
+    "journal_mode": "WAL",
+    # Sync at checkpoints rather than at every commit; safe from
+    # corruption with WAL, though the last commits may be lost on power loss
+    "synchronous": "NORMAL",
+    # Read the database through a memory map of up to 256 MB
+    "mmap_size": 256 * 1024 * 1024,
+    # Milliseconds a writer waits for the lock held by another one
+    "busy_timeout": 20000,
+}
+
+# Cache
+# Local memory by default; point CACHE_BACKEND/CACHE_LOCATION at a shared
+# cache (e.g. django.core.cache.backends.redis.RedisCache) in production so
+# that every worker sees the same entries and data versions.
+CACHES = {
+    "default": {
+        "BACKEND": config(
+            "CACHE_BACKEND",
+            default="django.core.cache.backends.locmem.LocMemCache"
+        ),
+        "LOCATION": config("CACHE_LOCATION", default="fitness-tracker"),
+    },
+    # Users of JWT-authenticated requests, per user id. Entries are dropped
+    # when the user is saved or deleted, and otherwise expire quickly.
+    "users": {
+        "BACKEND": config(
+            "USER_CACHE_BACKEND",
+            default="django.core.cache.backends.locmem.LocMemCache"
+        ),
+        "LOCATION": config("USER_CACHE_LOCATION", default="fitness-tracker-users"),
+        "TIMEOUT": config("USER_CACHE_TIMEOUT", default=60, cast=int),
+    },
+}
+if CACHES["users"]["BACKEND"].endswith(".LocMemCache"):
+    # Shared caches bound their own size (e.g. Redis with maxmemory)
+    CACHES["users"]["OPTIONS"] = {
+        "MAX_ENTRIES": config("USER_CACHE_MAX_ENTRIES", default=10000, cast=int),
+    }
+
+# Archive: `manage.py archive_activities` moves activities dated more than
+# ACTIVITY_ARCHIVE_DAYS days ago to a separate table, which reads only
+# touch when their date range reaches past that cutoff. 0 turns it off.
+ACTIVITY_ARCHIVE_DAYS = config("ACTIVITY_ARCHIVE_DAYS", default=0, cast=int)
+
+# Cache used for summary, trends and history statistics, and for the data
+# versions they and the ETags of activity reads are derived from. A
+# local-memory cache is per process, where a write in one worker would
+# leave the others serving stale results, so neither is used with it
+# unless ACTIVITY_CACHE_ENABLED is set, e.g. for a single process.
+ACTIVITY_CACHE_ALIAS = "default"
+ACTIVITY_CACHE_ENABLED = config(
+    "ACTIVITY_CACHE_ENABLED",
+    default=not CACHES[ACTIVITY_CACHE_ALIAS]["BACKEND"].endswith(".LocMemCache"),
+    cast=bool,
+)
+ACTIVITY_CACHE_TIMEOUT = config("ACTIVITY_CACHE_TIMEOUT", default=300, cast=int)
+
+# Cache used for the users of JWT-authenticated requests. With a
+# per-process local-memory cache, a user deactivated or deleted through one
+# worker would stay authenticated on the others until their entry expires,
+# so users are not cached in one unless USER_CACHE_ENABLED is set, e.g. for
+# a single process.
+USER_CACHE_ALIAS = "users"
+USER_CACHE_ENABLED = config(
+    "USER_CACHE_ENABLED",
+    default=not CACHES[USER_CACHE_ALIAS]["BACKEND"].endswith(".LocMemCache"),
+    cast=bool,
+)
+
+# Cache remembering the ids of revoked refresh tokens until they expire
+TOKEN_BLACKLIST_CACHE_ALIAS = "default"
+
+# Serve the activity read endpoints (list, retrieve, history, summary and
+# trends) with async views. Only enable when running under an ASGI server.
+ASYNC_READ_VIEWS = config("ASYNC_READ_VIEWS", default=False, cast=bool)
+
+# Request profiling: add a Server-Timing header and a JSON log line with the
+# query count and the database, view and render times to every request, or
+# to a random fraction (0 to 1) of them. Off by default.
+REQUEST_PROFILING = config("REQUEST_PROFILING", default=False, cast=bool)
+REQUEST_PROFILING_SAMPLE_RATE = config("REQUEST_PROFILING_SAMPLE_RATE", default=0.0, cast=float)
+
+# Metrics: request counts, latencies, errors, query counts and cache hits
+# per view, served at /metrics. Every worker process adds its counts to the
+# SQLite file METRICS_STORE, which all of them must be able to write, every
+# METRICS_FLUSH_INTERVAL seconds. Set METRICS_TOKEN to require
+# "Authorization: Bearer <token>" on /metrics.
+METRICS_ENABLED = config("METRICS_ENABLED", default=False, cast=bool)
+METRICS_STORE = config("METRICS_STORE", default=str(BASE_DIR / "metrics.sqlite3"))
+METRICS_FLUSH_INTERVAL = config("METRICS_FLUSH_INTERVAL", default=1.0, cast=float)
+METRICS_TOKEN = config("METRICS_TOKEN", default="")
+
+LOGGING = {
+    "version": 1,
+    "disable_existing_loggers": False,
+    "handlers": {
+        "console": {"class": "logging.StreamHandler"},
+    },
+    "loggers": {
+        "activities.profiling": {"handlers": ["console"], "level": "INFO", "propagate": False},
+    },
+}
+
 # Password validation
 AUTH_PASSWORD_VALIDATORS = [
     {
@@ -129,7 +288,7 @@ DEFAULT_AUTO_FIELD = "django.db.models.BigAutoField"
 
 REST_FRAMEWORK = {
     "DEFAULT_AUTHENTICATION_CLASSES": [
-        "rest_framework_simplejwt.authentication.JWTAuthentication",
+        "activities.authentication.CachedJWTAuthentication",
         "rest_framework.authentication.SessionAuthentication",
     ],
     "DEFAULT_PERMISSION_CLASSES": [
@@ -149,6 +308,7 @@ SIMPLE_JWT = {
     "ROTATE_REFRESH_TOKENS": True,
     "BLACKLIST_AFTER_ROTATION": True,
     "AUTH_HEADER_TYPES": ("Bearer",),
+    "TOKEN_REFRESH_SERIALIZER": "activities.authentication.RotatingTokenRefreshSerializer",
 }
 
 # CORS
@@ -4,6 +4,7 @@ URL configuration for fitness_tracker project.
 from django.contrib import admin
 from django.urls import path, include
 from rest_framework_simplejwt.views import TokenObtainPairView, TokenRefreshView
+from activities.views import metrics_view
 
 urlpatterns = [
     path('admin/', admin.site.urls),
@@ -11,5 +12,7 @@ urlpatterns = [
     # JWT Authentication endpoints
     path('api/token/', TokenObtainPairView.as_view(), name='token_obtain_pair'),
     path('api/token/refresh/', TokenRefreshView.as_view(), name='token_refresh'),
+    # Prometheus metrics, at the path Prometheus scrapes by default
+    path('metrics', metrics_view, name='metrics'),
 ]
 